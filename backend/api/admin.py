@@ -1,7 +1,13 @@
 from django.contrib import admin
-from .models import GeneratedImage
+from .models import GeneratedImage, GenerationJob
 
 @admin.register(GeneratedImage)
 class GeneratedImageAdmin(admin.ModelAdmin):
     list_display = ("id", "prompt", "created_at")
     readonly_fields = ("created_at",)
+
+@admin.register(GenerationJob)
+class GenerationJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "created_at", "finished_at")
+    list_filter = ("status", "kind")
+    readonly_fields = ("created_at", "started_at", "finished_at")
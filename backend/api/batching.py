@@ -0,0 +1,129 @@
+import time
+import threading
+import logging
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Outcome of one item of a multi-image request: its image, or why it failed,
+# and the seconds spent per stage where the backend measures them
+class ItemResult(NamedTuple):
+    index: int
+    image: Any
+    error: Optional[str]
+    timings: Optional[dict] = None
+
+
+class BatchItem:
+    __slots__ = ("key", "payload", "future", "enqueued_at")
+
+    def __init__(self, key: Hashable, payload: Any):
+        self.key = key
+        self.payload = payload
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+# Dynamic micro-batching: requests with the same compatibility key that arrive
+# within max_wait of the oldest one are handed to run_batch together. A single
+# worker thread owns the backend, so the pipeline is never entered concurrently.
+# batch_size_for can lower the limit per key, e.g. for large resolutions.
+class BatchScheduler:
+    def __init__(
+        self,
+        run_batch: Callable[[Hashable, List[Any]], List[Any]],
+        max_batch_size: int = 4,
+        max_wait: float = 0.02,
+        name: str = "batch-scheduler",
+        batch_size_for: Callable[[Hashable], int] = None,
+    ):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_size_for = batch_size_for
+        self.max_wait = max(0.0, max_wait)
+        self.name = name
+        self._pending: Dict[Hashable, List[BatchItem]] = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._batches = 0
+        self._items = 0
+
+    def submit(self, key: Hashable, payload: Any) -> Future:
+        item = BatchItem(key, payload)
+        with self._cond:
+            self._ensure_worker()
+            self._pending.setdefault(key, []).append(item)
+            self._cond.notify()
+        return item.future
+
+    def run(self, key: Hashable, payload: Any, timeout: float = None):
+        return self.submit(key, payload).result(timeout=timeout)
+
+    def pending(self) -> int:
+        with self._cond:
+            return sum(len(group) for group in self._pending.values())
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": round(self.max_wait * 1000, 3),
+            "pending": self.pending(),
+            "batches": self._batches,
+            "items": self._items,
+            "mean_batch_size": round(self._items / self._batches, 3) if self._batches else 0.0,
+        }
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _limit(self, key: Hashable) -> int:
+        if self.batch_size_for is None:
+            return self.max_batch_size
+        return max(1, min(self.max_batch_size, self.batch_size_for(key)))
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+
+            # Serve the group whose oldest request has waited longest
+            key = min(self._pending, key=lambda k: self._pending[k][0].enqueued_at)
+            limit = self._limit(key)
+            deadline = self._pending[key][0].enqueued_at + self.max_wait
+            while len(self._pending[key]) < limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(timeout=remaining)
+
+            group = self._pending.pop(key)
+            batch, rest = group[:limit], group[limit:]
+            if rest:
+                self._pending[key] = rest
+            return key, batch
+
+    def _loop(self):
+        while True:
+            key, batch = self._next_batch()
+            live = [item for item in batch if item.future.set_running_or_notify_cancel()]
+            if not live:
+                continue
+
+            self._batches += 1
+            self._items += len(live)
+            try:
+                results = self.run_batch(key, [item.payload for item in live])
+                if len(results) != len(live):
+                    raise RuntimeError(f"batch returned {len(results)} results for {len(live)} requests")
+            except Exception as e:
+                logger.error(f"Batch of {len(live)} failed: {str(e)}")
+                for item in live:
+                    item.future.set_exception(e)
+                continue
+
+            for item, result in zip(live, results):
+                item.future.set_result(result)
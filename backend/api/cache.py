@@ -0,0 +1,139 @@
+import json
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .models import GeneratedImage
+from .metrics import registry
+from . import storage
+
+logger = logging.getLogger(__name__)
+
+# Stable digest of everything that determines the output image and its
+# encoding. Unlike hash(), this is identical across processes and restarts.
+def generation_cache_key(params: dict, scheduler: str) -> str:
+    values = dict(params, scheduler=scheduler)
+    canonical = {
+        "model_id": str(values["model_id"]),
+        "prompt": str(values["prompt"]),
+        "negative_prompt": str(values.get("negative_prompt") or ""),
+        "width": int(values["width"]),
+        "height": int(values["height"]),
+        "steps": int(values["steps"]),
+        "guidance_scale": float(values["guidance_scale"]),
+        "seed": int(values["seed"]),
+        "scheduler": str(values["scheduler"]),
+        "output_format": str(values.get("output_format") or "png"),
+        "quality": int(values["quality"]) if values.get("quality") is not None else None,
+    }
+    # img2img: the input path is content-addressed, so it stands for the pixels.
+    # Only added when present so txt2img keys are unchanged.
+    if values.get("init_image"):
+        canonical["init_image"] = str(values["init_image"])
+        canonical["strength"] = float(values["strength"])
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+# Maps cache keys to GeneratedImage ids. The in-memory LRU holds the hot keys;
+# misses fall back to the indexed cache_key column so entries survive restarts
+# and are shared between processes. Entries older than the TTL are ignored, and
+# so are records whose file is gone from storage: those are regenerated.
+class GenerationCache:
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: str):
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        record_id = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[1] <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    record_id = entry[0]
+                else:
+                    del self._entries[key]
+                    self.evictions += 1
+
+        record = None
+        if record_id is not None:
+            record = GeneratedImage.objects.filter(id=record_id).first()
+        if record is None:
+            cutoff = timezone.now() - timedelta(seconds=self.ttl_seconds)
+            record = (
+                GeneratedImage.objects.filter(cache_key=key, created_at__gte=cutoff)
+                .order_by("-created_at")
+                .first()
+            )
+        if record is not None and not storage.exists(record.image.name):
+            logger.warning(f"Cached image {record.image.name} is missing from storage, regenerating")
+            record = None
+
+        with self._lock:
+            if record is None:
+                self.misses += 1
+                self._entries.pop(key, None)
+                return None
+            self.hits += 1
+        self._remember(key, record.id, record.created_at.timestamp())
+        return record
+
+    def put(self, key: str, record):
+        if self.enabled:
+            self._remember(key, record.id, record.created_at.timestamp())
+
+    def _remember(self, key: str, record_id: int, stored_at: float):
+        with self._lock:
+            self._entries[key] = (record_id, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+generation_cache = GenerationCache(
+    max_entries=settings.GENERATION_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.GENERATION_CACHE_TTL_SECONDS,
+)
+
+registry.gauge(
+    "cache_lookups_total", "Cache lookups by cache and result", ("cache", "result"),
+    lambda: [(("generation", "hit"), generation_cache.hits), (("generation", "miss"), generation_cache.misses)],
+    metric_type="counter",
+)
+registry.gauge(
+    "cache_hit_ratio", "Fraction of cache lookups served from the cache", ("cache",),
+    lambda: [(("generation",), generation_cache.stats()["hit_rate"])],
+)
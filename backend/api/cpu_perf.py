@@ -0,0 +1,99 @@
+import os
+import logging
+import threading
+from contextlib import nullcontext
+import torch
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_threads_configured = False
+_threads_lock = threading.Lock()
+
+
+# bfloat16 kernels need AVX512-BF16/AMX (oneDNN reports it); elsewhere autocast
+# would fall back to slow emulation, so it stays off
+def bf16_supported() -> bool:
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def autocast_enabled() -> bool:
+    return settings.CPU_BF16_AUTOCAST and bf16_supported()
+
+
+# Process-wide thread pools. Inter-op threads can only be set before any
+# parallel work has run, so this is applied once, when the model stack loads.
+def configure_threads(intra_op: int = None, inter_op: int = None):
+    global _threads_configured
+    intra_op = settings.CPU_INTRA_OP_THREADS if intra_op is None else intra_op
+    inter_op = settings.CPU_INTER_OP_THREADS if inter_op is None else inter_op
+
+    with _threads_lock:
+        if _threads_configured:
+            return
+        _threads_configured = True
+        if intra_op:
+            torch.set_num_threads(intra_op)
+        if inter_op:
+            try:
+                torch.set_num_interop_threads(inter_op)
+            except RuntimeError as e:
+                logger.warning(f"Could not set inter-op threads to {inter_op}: {e}")
+    logger.info(f"Torch threads: intra-op {torch.get_num_threads()}, inter-op {torch.get_num_interop_threads()}")
+
+
+# bfloat16 autocast around a pipeline call when enabled and supported. Weights
+# stay float32; matmuls and convolutions run in bfloat16.
+def cpu_autocast(enabled: bool = None):
+    enabled = autocast_enabled() if enabled is None else enabled
+    if not enabled:
+        return nullcontext()
+    return torch.autocast("cpu", dtype=torch.bfloat16)
+
+
+# In-place: the pipeline keeps its module objects, so component sharing and
+# fingerprints are unaffected. The UNet and VAE decoder are compiled lazily on
+# their first call (the warm-up pass); compiled kernels are cached on disk so a
+# restart does not pay for compilation again.
+def optimize_pipeline(pipeline, channels_last: bool = None, compile: bool = None, compile_mode: str = None):
+    channels_last = settings.CPU_CHANNELS_LAST if channels_last is None else channels_last
+    compile = settings.CPU_COMPILE if compile is None else compile
+    compile_mode = compile_mode or settings.CPU_COMPILE_MODE
+
+    applied = []
+    if channels_last:
+        for name in ("unet", "vae"):
+            module = getattr(pipeline, name, None)
+            if module is not None:
+                module.to(memory_format=torch.channels_last)
+        applied.append("channels_last")
+
+    if compile:
+        if settings.CPU_COMPILE_CACHE_DIR:
+            os.makedirs(settings.CPU_COMPILE_CACHE_DIR, exist_ok=True)
+            # Read by inductor on every cache access; importing diffusers may
+            # already have filled in the default
+            os.environ["TORCHINDUCTOR_CACHE_DIR"] = settings.CPU_COMPILE_CACHE_DIR
+        targets = [getattr(pipeline, "unet", None), getattr(getattr(pipeline, "vae", None), "decoder", None)]
+        for module in targets:
+            if module is not None and getattr(module, "_compiled_call_impl", None) is None:
+                module.compile(mode=compile_mode, dynamic=False)
+        applied.append(f"compile({compile_mode})")
+
+    if applied:
+        logger.info(f"CPU optimizations applied: {', '.join(applied)}")
+    return pipeline
+
+
+def cpu_mode_state() -> dict:
+    return {
+        "bf16_autocast": autocast_enabled(),
+        "bf16_supported": bf16_supported(),
+        "channels_last": settings.CPU_CHANNELS_LAST,
+        "compile": settings.CPU_COMPILE,
+        "intra_op_threads": torch.get_num_threads(),
+        "inter_op_threads": torch.get_num_interop_threads(),
+    }
@@ -0,0 +1,111 @@
+import logging
+from concurrent.futures import Future
+from django.conf import settings
+from django.db import connection, transaction
+from .batching import BatchScheduler
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+# connection_created handler (connected in ApiConfig.ready). journal_mode is
+# stored in the database file, the other pragmas last for the connection.
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        if settings.SQLITE_WAL:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        # Negative cache_size is in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+
+
+def sqlite_state() -> dict:
+    if connection.vendor != "sqlite":
+        return {}
+    with connection.cursor() as cursor:
+        state = {}
+        for pragma in ("journal_mode", "synchronous", "busy_timeout", "cache_size", "mmap_size"):
+            cursor.execute(f"PRAGMA {pragma}")
+            state[pragma] = cursor.fetchone()[0]
+    return state
+
+
+# Buffered inserts. Each submit is a list of unsaved model instances of one
+# model; one writer thread inserts everything that arrives within max_wait with
+# a single bulk_create per model in one transaction, so N concurrent
+# generations cost one commit (one WAL fsync) instead of N. The returned future
+# resolves to the saved instances, with primary keys set.
+class RecordWriter:
+    def __init__(self, enabled: bool, max_batch: int, max_wait: float):
+        self.enabled = enabled
+        self._scheduler = BatchScheduler(
+            self._insert, max_batch_size=max_batch, max_wait=max_wait, name="record-writer"
+        )
+        self.rows = 0
+        self.transactions = 0
+
+    def submit(self, records: list) -> Future:
+        if not records:
+            future = Future()
+            future.set_result([])
+            return future
+        # Inside a transaction the rows must belong to it, and when the writer
+        # is off they are inserted on the calling thread
+        if not self.enabled or transaction.get_connection().in_atomic_block:
+            future = Future()
+            try:
+                future.set_result(type(records[0]).objects.bulk_create(records))
+                self.rows += len(records)
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return self._scheduler.submit(type(records[0]), records)
+
+    def insert(self, records: list) -> list:
+        return self.submit(records).result()
+
+    def _insert(self, model, groups: list) -> list:
+        rows = [record for group in groups for record in group]
+        with transaction.atomic():
+            created = model.objects.bulk_create(rows)
+        self.rows += len(rows)
+        self.transactions += 1
+
+        results, start = [], 0
+        for group in groups:
+            results.append(created[start:start + len(group)])
+            start += len(group)
+        return results
+
+    def pending(self) -> int:
+        return self._scheduler.pending()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "rows": self.rows,
+            "transactions": self.transactions,
+            **{k: v for k, v in self._scheduler.stats().items() if k in ("pending", "max_batch_size", "max_wait_ms")},
+        }
+
+
+record_writer = RecordWriter(
+    settings.RECORD_WRITER_ENABLED,
+    settings.RECORD_WRITER_MAX_BATCH,
+    settings.RECORD_WRITER_MAX_WAIT_MS / 1000,
+)
+
+registry.gauge(
+    "record_writer_pending", "Rows waiting for the buffered database writer", (),
+    lambda: [((), record_writer.pending())],
+)
+registry.gauge(
+    "record_writer_rows_total", "Rows inserted by the buffered database writer", (),
+    lambda: [((), record_writer.rows)],
+    metric_type="counter",
+)
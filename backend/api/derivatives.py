@@ -0,0 +1,53 @@
+import os
+import logging
+from django.conf import settings
+from PIL import Image
+from . import storage
+from .encoding import encode_image, extension_for
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels for each derivative size served to the gallery
+DERIVATIVE_SIZES = {
+    "thumb": 256,
+    "medium": 512,
+}
+
+_generation = SingleFlight()
+
+
+# Stored next to the original: generated/ab/cd/<name>.<size>.<ext>
+def derivative_rel_path(rel_path: str, size: str) -> str:
+    base, _ = os.path.splitext(rel_path)
+    return f"{base}.{size}.{extension_for(settings.IMAGE_DERIVATIVE_FORMAT)}"
+
+
+def _render(rel_path: str, size: str) -> bytes:
+    max_edge = DERIVATIVE_SIZES[size]
+    with storage.open_file(rel_path) as f, Image.open(f) as image:
+        # JPEG can decode straight at a reduced scale; other formats ignore this
+        image.draft("RGB", (max_edge, max_edge))
+        image = image.convert("RGB")
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS, reducing_gap=3.0)
+        return encode_image(image, settings.IMAGE_DERIVATIVE_FORMAT, settings.IMAGE_DERIVATIVE_QUALITY)
+
+
+# Create the derivative on first request. Concurrent requests for the same one
+# share a single render, and once written it is only ever served from disk.
+def ensure_derivative(rel_path: str, size: str) -> str:
+    if size not in DERIVATIVE_SIZES:
+        raise ValueError(f"unknown derivative size: {size}")
+
+    target = derivative_rel_path(rel_path, size)
+    if storage.exists(target):
+        return target
+
+    def build():
+        if not storage.exists(target):
+            storage.write_file_atomic(target, _render(rel_path, size))
+            logger.info(f"Created {size} derivative {target}")
+        return target
+
+    target, _ = _generation.do(target, build)
+    return target
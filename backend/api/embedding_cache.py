@@ -0,0 +1,86 @@
+import threading
+import logging
+from collections import OrderedDict
+from typing import Callable, Tuple
+from django.conf import settings
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+def _nbytes(tensors) -> int:
+    return sum(t.numel() * t.element_size() for t in tensors if t is not None)
+
+
+# LRU of text-encoder outputs keyed by (model_id, exact text), bounded by the
+# bytes of the cached tensors. Prompts and negative prompts share entries.
+class PromptEmbeddingCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, model_id: str, text: str, compute: Callable[[], Tuple]) -> Tuple:
+        key = (model_id, text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        tensors = compute()
+        size = _nbytes(tensors)
+        if size > self.max_bytes:
+            return tensors
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (tensors, size)
+                self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+        return tensors
+
+    def drop_model(self, model_id: str):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == model_id]:
+                _, size = self._entries.pop(key)
+                self._bytes -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+prompt_embedding_cache = PromptEmbeddingCache(max_bytes=settings.PROMPT_EMBEDDING_CACHE_BYTES)
+
+registry.gauge(
+    "prompt_embedding_cache_lookups_total", "Prompt embedding cache lookups by result", ("result",),
+    lambda: [(("hit",), prompt_embedding_cache.hits), (("miss",), prompt_embedding_cache.misses)],
+    metric_type="counter",
+)
+registry.gauge(
+    "prompt_embedding_cache_hit_ratio", "Fraction of prompt encodes served from the cache", (),
+    lambda: [((), prompt_embedding_cache.stats()["hit_rate"])],
+)
+registry.gauge(
+    "prompt_embedding_cache_bytes", "Bytes held by cached prompt embeddings", (),
+    lambda: [((), prompt_embedding_cache.stats()["bytes"])],
+)
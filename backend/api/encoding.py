@@ -0,0 +1,81 @@
+import io
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import NamedTuple
+from django.conf import settings
+from PIL import Image
+from .metrics import timed_stage
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pillow_avif  # noqa: F401  (registers the AVIF plugin on older Pillow)
+except ImportError:
+    pass
+
+Image.init()
+HAS_AVIF = "AVIF" in Image.SAVE
+
+DEFAULT_OUTPUT_FORMAT = "png"
+
+
+class OutputFormat(NamedTuple):
+    pil_format: str
+    ext: str
+    content_type: str
+    default_quality: int
+
+
+OUTPUT_FORMATS = {
+    "png": OutputFormat("PNG", "png", "image/png", None),
+    "png-fast": OutputFormat("PNG", "png", "image/png", None),
+    "webp": OutputFormat("WEBP", "webp", "image/webp", 85),
+    "jpeg": OutputFormat("JPEG", "jpg", "image/jpeg", 90),
+}
+if HAS_AVIF:
+    OUTPUT_FORMATS["avif"] = OutputFormat("AVIF", "avif", "image/avif", 60)
+
+
+def extension_for(output_format: str) -> str:
+    return OUTPUT_FORMATS[output_format].ext
+
+
+def _save_options(output_format: str, quality: int = None) -> dict:
+    if output_format == "png":
+        return {"optimize": True}
+    if output_format == "png-fast":
+        return {"compress_level": 1}
+    quality = quality or OUTPUT_FORMATS[output_format].default_quality
+    if output_format == "webp":
+        return {"quality": quality, "method": 4}
+    if output_format == "jpeg":
+        return {"quality": quality, "optimize": False, "progressive": False}
+    return {"quality": quality, "speed": 8}
+
+
+def encode_image(image: Image.Image, output_format: str = DEFAULT_OUTPUT_FORMAT, quality: int = None) -> bytes:
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"unsupported output_format: {output_format}")
+    fmt = OUTPUT_FORMATS[output_format]
+    if fmt.pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buf = io.BytesIO()
+    image.save(buf, format=fmt.pil_format, **_save_options(output_format, quality))
+    return buf.getvalue()
+
+
+# Encoding is CPU-bound and releases the GIL inside Pillow, so a small dedicated
+# pool keeps it off the inference thread and bounds how many run at once
+_encoder_pool = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_ENCODER_WORKERS,
+    thread_name_prefix="image-encoder",
+)
+
+
+def _encode_timed(image: Image.Image, output_format: str, quality: int) -> bytes:
+    with timed_stage("encode"):
+        return encode_image(image, output_format, quality)
+
+
+def encode_image_async(image: Image.Image, output_format: str = DEFAULT_OUTPUT_FORMAT, quality: int = None) -> Future:
+    return _encoder_pool.submit(_encode_timed, image, output_format, quality)
@@ -0,0 +1,25 @@
+import asyncio
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+_loop = None
+_lock = threading.Lock()
+
+
+# One event loop running on a daemon thread, shared by every sync caller that
+# needs to drive coroutines (e.g. fan-out from synchronous Django views)
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_loop.run_forever, name="shared-event-loop", daemon=True)
+            thread.start()
+            logger.info("Started shared event loop thread")
+        return _loop
+
+
+def run_sync(coro, timeout: float = None):
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout=timeout)
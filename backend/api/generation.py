@@ -0,0 +1,331 @@
+import io
+import os
+import time
+import logging
+from PIL import Image
+from django.utils import timezone
+from .models import GeneratedImage
+from .cache import generation_cache, generation_cache_key
+from .storage import StoredImage, save_image_bytes_async
+from .encoding import DEFAULT_OUTPUT_FORMAT, encode_image, extension_for
+from .singleflight import SingleFlight
+from .batching import ItemResult
+from .init_images import load_init_image
+from .db import record_writer
+from .metrics import add_server_timing, generation_seconds, generations, registry, server_timing_snapshot, timed_stage
+from . import inference
+
+logger = logging.getLogger(__name__)
+
+
+def _queue_write(image_bytes, output_format: str):
+    if isinstance(image_bytes, StoredImage):
+        return image_bytes.rel_path, None
+    return save_image_bytes_async(image_bytes, ext=extension_for(output_format))
+
+
+# The row is never returned before its file exists: a failed write removes it
+def _await_write(written, records):
+    if written is None:
+        return
+    try:
+        with timed_stage("storage"):
+            written.result()
+    except Exception:
+        GeneratedImage.objects.filter(id__in=[record.id for record in records]).delete()
+        raise
+
+
+# Dimensions from the encoded header (read while storing, for streamed results);
+# the request's only if the header could not be read
+def _image_size(image_bytes, params: dict):
+    if isinstance(image_bytes, StoredImage):
+        if image_bytes.dimensions is not None:
+            return image_bytes.dimensions
+    else:
+        try:
+            with Image.open(io.BytesIO(image_bytes)) as image:
+                return image.size
+        except Exception:
+            pass
+    return params["width"], params["height"]
+
+
+# Unsaved row with the generation metadata; timings are the stages recorded so
+# far for this request (queue, text_encode, denoise, decode, encode, ...)
+def _new_record(params: dict, image_bytes, rel_path: str, cache_key: str = "", timings: dict = None) -> GeneratedImage:
+    width, height = _image_size(image_bytes, params)
+    return GeneratedImage(
+        prompt=params["prompt"],
+        image=rel_path,
+        created_at=timezone.now(),
+        cache_key=cache_key,
+        model_id=params["model_id"],
+        params={name: value for name, value in params.items() if name != "prompt"},
+        seed=params.get("seed"),
+        width=width,
+        height=height,
+        byte_size=image_bytes.size if isinstance(image_bytes, StoredImage) else len(image_bytes),
+        timings=server_timing_snapshot() if timings is None else {k: round(v, 4) for k, v in timings.items()},
+    )
+
+
+# Helper - save image bytes and return record + filename. The file is written
+# by the background writer while the buffered record writer inserts the row.
+def _save_bytes_and_record(params: dict, image_bytes, cache_key: str = ""):
+    rel_path, written = _queue_write(image_bytes, params.get("output_format", DEFAULT_OUTPUT_FORMAT))
+    with timed_stage("db"):
+        record, = record_writer.insert([_new_record(params, image_bytes, rel_path, cache_key)])
+    _await_write(written, [record])
+    return record, os.path.basename(rel_path)
+
+
+# Stub inference (you can replace with real model later)
+def run_inference_stub(prompt: str, width: int, height: int, output_format: str = DEFAULT_OUTPUT_FORMAT, quality: int = None) -> bytes:
+    from PIL import Image
+    img = Image.new("RGB", (int(width), int(height)), color=(120, 180, 200))
+    return encode_image(img, output_format, quality)
+
+
+def _generate_bytes_or_stub(prompt, negative_prompt, width, height, steps, guidance, model_id, seed=None, on_step=None,
+                            output_format=DEFAULT_OUTPUT_FORMAT, quality=None, init_image=None, strength=None):
+    backend = inference.get_backend()
+    if backend is not None:
+        if model_id not in backend.model_map:
+            raise ValueError(f"unknown model_id: {model_id}")
+        if init_image:
+            if backend.generate_img2img is None:
+                raise ValueError(f"img2img is not supported by the {backend.mode} inference backend")
+            return backend.generate_img2img(
+                model_id=model_id,
+                init_image=load_init_image(init_image, width, height),
+                prompt=prompt,
+                negative_prompt=negative_prompt,
+                strength=strength,
+                steps=steps,
+                guidance_scale=guidance,
+                seed=seed,
+                on_step=on_step,
+                output_format=output_format,
+                quality=quality,
+            )
+        return backend.generate_image(
+            model_id=model_id,
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            width=width,
+            height=height,
+            steps=steps,
+            guidance_scale=guidance,
+            seed=seed,
+            on_step=on_step,
+            output_format=output_format,
+            quality=quality,
+        )
+    return run_inference_stub(prompt, width, height, output_format, quality)
+
+
+def is_known_model(model_id: str) -> bool:
+    backend = inference.get_backend()
+    return backend is None or model_id in backend.model_map
+
+
+# The stub generator ignores the init image, so only a backend without an
+# img2img entry point rejects it
+def supports_img2img() -> bool:
+    backend = inference.get_backend()
+    return backend is None or backend.generate_img2img is not None
+
+
+def generation_params(data: dict) -> dict:
+    # Normalise validated serializer data into the plain dict stored on jobs
+    return {
+        "prompt": data.get("prompt", ""),
+        "negative_prompt": data.get("negative_prompt", ""),
+        "model_id": data.get("model_id", "sdxl-turbo"),
+        "width": int(data.get("width", 512)),
+        "height": int(data.get("height", 512)),
+        "steps": int(data.get("steps", 30)),
+        "guidance_scale": float(data.get("guidance_scale", 7.5)),
+        "seed": data.get("seed", None),
+        "output_format": data.get("output_format", DEFAULT_OUTPUT_FORMAT),
+        "quality": data.get("quality", None),
+    }
+
+
+# Identical seeded requests that arrive while one is running share its result
+in_flight_generations = SingleFlight()
+
+registry.gauge(
+    "generations_in_flight", "Distinct generations currently running", (),
+    lambda: [((), in_flight_generations.in_flight())],
+)
+registry.gauge(
+    "generations_coalesced_total", "Requests served by attaching to an identical in-flight generation", (),
+    lambda: [((), in_flight_generations.shared)],
+    metric_type="counter",
+)
+
+
+def request_key(params: dict):
+    # Only seeded generations are deterministic, so only those can be shared
+    if params.get("seed") is None:
+        return ""
+    backend = inference.get_backend()
+    return generation_cache_key(params, backend.scheduler_name if backend is not None else "stub")
+
+
+def cache_key_for(params: dict):
+    if not generation_cache.enabled:
+        return ""
+    return request_key(params)
+
+
+def _cached_record(cache_key: str):
+    if not cache_key:
+        return None
+    record = generation_cache.get(cache_key)
+    if record is not None:
+        logger.info(f"Generation cache hit for {record.prompt[:50]}...")
+    return record
+
+
+def generate_record(params: dict, on_step=None):
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        result, outcome = _generate_record(params, on_step)
+        return result
+    finally:
+        elapsed = time.perf_counter() - started
+        generations.inc(model=params["model_id"], outcome=outcome)
+        generation_seconds.observe(elapsed, model=params["model_id"], outcome=outcome)
+        if outcome in ("cached", "coalesced"):
+            add_server_timing(outcome, elapsed)
+
+
+def _generate_record(params: dict, on_step=None):
+    cache_key = cache_key_for(params)
+    record = _cached_record(cache_key)
+    if record is not None:
+        return (record, os.path.basename(record.image.name)), "cached"
+
+    key = request_key(params)
+    if not key:
+        return _generate_and_save(params, cache_key, on_step), "generated"
+
+    # Followers block until the leader finishes and get the same record, or the
+    # same exception if it failed or was cancelled. Step callbacks only fire for
+    # the leader; followers see just the final result.
+    def run():
+        # A matching run may have finished between the cache check and now
+        record = _cached_record(cache_key)
+        if record is not None:
+            return record, os.path.basename(record.image.name)
+        return _generate_and_save(params, cache_key, on_step)
+
+    result, shared = in_flight_generations.do(key, run)
+    if shared:
+        logger.info(f"Coalesced with in-flight generation for {params['prompt'][:50]}...")
+        return result, "coalesced"
+    return result, "generated"
+
+
+def _generate_and_save(params: dict, cache_key: str, on_step=None):
+    image_bytes = _generate_bytes_or_stub(
+        params["prompt"],
+        params["negative_prompt"],
+        params["width"],
+        params["height"],
+        params["steps"],
+        params["guidance_scale"],
+        params["model_id"],
+        params["seed"],
+        on_step,
+        output_format=params.get("output_format", DEFAULT_OUTPUT_FORMAT),
+        quality=params.get("quality"),
+        init_image=params.get("init_image"),
+        strength=params.get("strength"),
+    )
+    record, filename = _save_bytes_and_record(params, image_bytes, cache_key)
+    if cache_key:
+        generation_cache.put(cache_key, record)
+    return record, filename
+
+
+# Many images for one set of parameters, one per (prompt, seed). Cache hits are
+# served as usual; the rest go to the backend in one batched call, and their
+# records are written with a single bulk insert. Returns (record, error) per
+# item, in order.
+def generate_batch_records(params: dict, prompts: list, seeds: list) -> list:
+    started = time.perf_counter()
+    items = [dict(params, prompt=prompt, seed=seed) for prompt, seed in zip(prompts, seeds)]
+    cache_keys = [cache_key_for(item) for item in items]
+    outcomes = [None] * len(items)
+
+    missing = []
+    for index, cache_key in enumerate(cache_keys):
+        record = _cached_record(cache_key)
+        if record is not None:
+            outcomes[index] = (record, None)
+        else:
+            missing.append(index)
+
+    if missing:
+        images = _generate_batch_bytes_or_stub(params, [prompts[i] for i in missing], [seeds[i] for i in missing])
+        output_format = params.get("output_format", DEFAULT_OUTPUT_FORMAT)
+        pending = []
+        for index, result in zip(missing, images):
+            if result.error is not None:
+                outcomes[index] = (None, result.error)
+                continue
+            rel_path, written = _queue_write(result.image, output_format)
+            pending.append((index, written, _new_record(items[index], result.image, rel_path, cache_keys[index], result.timings)))
+
+        with timed_stage("db"):
+            created = record_writer.insert([record for _, _, record in pending])
+        for (index, written, _), record in zip(pending, created):
+            try:
+                _await_write(written, [record])
+            except Exception as e:
+                logger.error(f"Could not store batch item {index}: {str(e)}")
+                outcomes[index] = (None, str(e))
+                continue
+            outcomes[index] = (record, None)
+            if cache_keys[index]:
+                generation_cache.put(cache_keys[index], record)
+
+    elapsed = time.perf_counter() - started
+    generated = set(missing)
+    for index, (record, error) in enumerate(outcomes):
+        outcome = "error" if error else ("generated" if index in generated else "cached")
+        generations.inc(model=params["model_id"], outcome=outcome)
+    generation_seconds.observe(elapsed, model=params["model_id"], outcome="batch")
+    return outcomes
+
+
+def _generate_batch_bytes_or_stub(params: dict, prompts: list, seeds: list) -> list:
+    output_format = params.get("output_format", DEFAULT_OUTPUT_FORMAT)
+    backend = inference.get_backend()
+    if backend is None:
+        return [
+            ItemResult(index, run_inference_stub(prompt, params["width"], params["height"], output_format,
+                                                 params.get("quality")), None)
+            for index, prompt in enumerate(prompts)
+        ]
+    if params["model_id"] not in backend.model_map:
+        raise ValueError(f"unknown model_id: {params['model_id']}")
+    if backend.generate_batch is None:
+        raise ValueError(f"batch generation is not supported by the {backend.mode} inference backend")
+    return backend.generate_batch(
+        model_id=params["model_id"],
+        prompts=prompts,
+        negative_prompt=params["negative_prompt"],
+        width=params["width"],
+        height=params["height"],
+        steps=params["steps"],
+        guidance_scale=params["guidance_scale"],
+        seeds=seeds,
+        output_format=output_format,
+        quality=params.get("quality"),
+    )
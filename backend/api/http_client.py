@@ -0,0 +1,183 @@
+import time
+import random
+import threading
+import logging
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class ConcurrencyLimitError(RuntimeError):
+    pass
+
+
+# Opens after failure_threshold consecutive failed calls and fails fast until
+# reset_timeout has passed; then a single trial call decides whether to close.
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                raise CircuitOpenError("upstream circuit is open; failing fast")
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Opening upstream circuit after {self._failures} consecutive failures")
+                self._opened_at = time.monotonic()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+
+def _retry_after_seconds(resp: requests.Response):
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+# Shared keep-alive session with bounded connection pools, jittered exponential
+# backoff on retryable statuses (honouring Retry-After), a circuit breaker and a
+# per-key cap on concurrent calls. Responses are streamed; read them inside the
+# post() context so the concurrency slot is held until the body is consumed.
+class PooledHTTPClient:
+    def __init__(
+        self,
+        pool_size: int = 10,
+        max_retries: int = 4,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+        max_concurrency_per_key: int = 4,
+        acquire_timeout: float = 300.0,
+        breaker: CircuitBreaker = None,
+    ):
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_concurrency_per_key = max(1, max_concurrency_per_key)
+        self.acquire_timeout = acquire_timeout
+        self.breaker = breaker or CircuitBreaker(failure_threshold=5, reset_timeout=30.0)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._semaphores = {}
+        self._lock = threading.Lock()
+        self.retries = 0
+
+    def _semaphore(self, key: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            sem = self._semaphores.get(key)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.max_concurrency_per_key)
+                self._semaphores[key] = sem
+            return sem
+
+    def _backoff(self, attempt: int, resp: requests.Response = None) -> float:
+        retry_after = _retry_after_seconds(resp) if resp is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        # Full jitter: spreads retries from concurrent callers apart
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    # The breaker is consulted once per logical call, not per attempt: retries
+    # are part of one call (in half-open state, of the single trial call), and
+    # every way out of it records an outcome so a trial never stays in flight
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        self.breaker.before_call()
+        try:
+            resp = self._send_with_retries(method, url, **kwargs)
+        except BaseException:
+            self.breaker.record_failure()
+            raise
+        if resp.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return resp
+
+    def _send_with_retries(self, method: str, url: str, **kwargs) -> requests.Response:
+        attempt = 0
+        while True:
+            try:
+                resp = self.session.request(method, url, stream=True, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"Request to {url} failed ({e}); retrying in {delay:.2f}s")
+            else:
+                if resp.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return resp
+                delay = self._backoff(attempt, resp)
+                logger.warning(f"{url} returned {resp.status_code}; retrying in {delay:.2f}s")
+                resp.close()
+
+            attempt += 1
+            self.retries += 1
+            time.sleep(delay)
+
+    @contextmanager
+    def post(self, url: str, limit_key: str, **kwargs):
+        sem = self._semaphore(limit_key)
+        if not sem.acquire(timeout=self.acquire_timeout):
+            raise ConcurrencyLimitError(f"too many concurrent requests for {limit_key}")
+        try:
+            resp = self._send("POST", url, **kwargs)
+            try:
+                yield resp
+            finally:
+                resp.close()
+        finally:
+            sem.release()
+
+    def stats(self) -> dict:
+        return {
+            "circuit": self.breaker.state,
+            "retries": self.retries,
+            "max_concurrency_per_key": self.max_concurrency_per_key,
+        }
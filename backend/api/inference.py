@@ -1,8 +1,10 @@
 import os
+import time
+import threading
 import logging
 from pathlib import Path
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Callable, NamedTuple, Optional
 
 env_path = Path(__file__).resolve().parents[1] / ".env"
 if env_path.exists():
@@ -12,18 +14,81 @@ logger = logging.getLogger(__name__)
 
 USE_LOCAL_MODELS = os.getenv("USE_LOCAL_MODELS", "true").lower() == "true"
 
-try:
+
+class InferenceBackend(NamedTuple):
+    mode: str
+    generate_image: Callable
+    model_map: dict
+    scheduler_name: str
+    # None when the backend cannot condition on an input image
+    generate_img2img: Optional[Callable] = None
+    # Many images in one call; returns an ItemResult per prompt
+    generate_batch: Optional[Callable] = None
+
+
+def _import_backend() -> InferenceBackend:
     if USE_LOCAL_MODELS:
-        from .inference_local import generate_image_local as generate_image
-        from .model_loader import model_manager
-
-        MODEL_MAP = {model["id"]: model for model in model_manager.get_available_models()}
-        logger.info(f"Using local PyTorch models. Available: {list(MODEL_MAP.keys())}")
-    else:
-        from .inference_remote import generate_image_remote as generate_image
-        from .inference_remote import MODEL_MAP
-        logger.info(f"Using remote HuggingFace API. Available: {list(MODEL_MAP.keys())}")
-except ImportError as e:
-    logger.error(f"Failed to import inference module: {e}")
-    MODEL_MAP = {}
-    generate_image = None
+        from .inference_local import generate_image_local, generate_image_batch, img2img_generate
+        from .model_loader import model_manager, SCHEDULER_CLASS
+
+        model_map = {model["id"]: model for model in model_manager.get_available_models()}
+        logger.info(f"Using local PyTorch models. Available: {list(model_map.keys())}")
+        return InferenceBackend(
+            "local", generate_image_local, model_map, SCHEDULER_CLASS.__name__,
+            generate_img2img=img2img_generate,
+            generate_batch=generate_image_batch,
+        )
+
+    from .inference_remote import generate_image_remote, generate_image_batch_remote, MODEL_MAP
+
+    logger.info(f"Using remote HuggingFace API. Available: {list(MODEL_MAP.keys())}")
+    return InferenceBackend(
+        "remote", generate_image_remote, MODEL_MAP, "hf-inference-api",
+        generate_batch=generate_image_batch_remote,
+    )
+
+
+_backend: Optional[InferenceBackend] = None
+_backend_error: Optional[str] = None
+_import_seconds: Optional[float] = None
+_attempted = threading.Event()
+_lock = threading.Lock()
+
+
+# True once get_backend() returns without waiting on the import
+def backend_resolved() -> bool:
+    return _attempted.is_set()
+
+
+# The ML stack (torch, diffusers, transformers) costs seconds to import, so it is
+# loaded on the first call that needs inference rather than when Django imports
+# the views. Returns None when the backend cannot be imported; callers then fall
+# back to the stub generator.
+def get_backend() -> Optional[InferenceBackend]:
+    global _backend, _backend_error, _import_seconds
+    if _attempted.is_set():
+        return _backend
+
+    with _lock:
+        if not _attempted.is_set():
+            started = time.perf_counter()
+            try:
+                _backend = _import_backend()
+            except Exception as e:
+                _backend_error = str(e)
+                logger.error(f"Failed to import inference module: {e}")
+            finally:
+                _import_seconds = time.perf_counter() - started
+                _attempted.set()
+            logger.info(f"Inference backend import took {_import_seconds:.2f}s")
+    return _backend
+
+
+def backend_state() -> dict:
+    return {
+        "mode": "local" if USE_LOCAL_MODELS else "remote",
+        "loaded": _attempted.is_set(),
+        "available": _backend is not None,
+        "import_seconds": round(_import_seconds, 3) if _import_seconds is not None else None,
+        "error": _backend_error,
+    }
@@ -0,0 +1,94 @@
+import asyncio
+import functools
+import threading
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from django.conf import settings
+from django.db import close_old_connections
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorFull(Exception):
+    pass
+
+
+# Async views hand blocking generations to this pool. Its size caps how many
+# run at once (each thread mostly waits on the batch worker, so about one
+# forward pass worth plus the next batch forming); everything else waits as a
+# coroutine, which costs no thread. Beyond max_queued, submissions fail fast
+# so clients can retry instead of piling up.
+class InferenceExecutor:
+    def __init__(self, workers: int, max_queued: int, name: str = "inference"):
+        self.workers = max(1, workers)
+        self.max_queued = max(0, max_queued)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+
+    # Runs fn(*args, **kwargs) on the pool with the caller's context variables
+    # (so stage timings reach the request's Server-Timing collector)
+    async def run(self, fn: Callable, *args, **kwargs):
+        with self._lock:
+            if self.max_queued and self.queued >= self.max_queued:
+                self.rejected += 1
+                raise ExecutorFull(f"{self.queued} generations already waiting")
+            self.queued += 1
+
+        # Whichever of the pool thread and a cancelled caller gets there first
+        # takes the call off the queue count
+        state = {"dequeued": False}
+
+        def call():
+            with self._lock:
+                if not state["dequeued"]:
+                    state["dequeued"] = True
+                    self.queued -= 1
+                self.running += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                # Pool threads live on between requests; drop their database
+                # connection the way the request cycle would
+                close_old_connections()
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        context = contextvars.copy_context()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(context.run, call))
+        finally:
+            with self._lock:
+                if not state["dequeued"]:
+                    state["dequeued"] = True
+                    self.queued -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "running": self.running,
+                "queued": self.queued,
+                "max_queued": self.max_queued,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+
+inference_executor = InferenceExecutor(settings.INFERENCE_EXECUTOR_THREADS, settings.INFERENCE_EXECUTOR_MAX_QUEUED)
+
+registry.gauge(
+    "inference_executor_queued", "Generations waiting for an inference executor thread", (),
+    lambda: [((), inference_executor.queued)],
+)
+registry.gauge(
+    "inference_executor_running", "Generations running on the inference executor", (),
+    lambda: [((), inference_executor.running)],
+)
@@ -1,13 +1,234 @@
-import io
+import time
+import weakref
 import torch
 from PIL import Image
-from typing import Optional
+from typing import Callable, Optional
 import logging
+from diffusers import StableDiffusionXLImg2ImgPipeline
+from contextlib import nullcontext
+from django.conf import settings
+from .batching import BatchScheduler, ItemResult
+from .cpu_perf import cpu_autocast
+from .embedding_cache import prompt_embedding_cache
+from .encoding import DEFAULT_OUTPUT_FORMAT, encode_image_async
+from .metrics import add_server_timing, record_stage, registry
 from .model_loader import model_manager, DEVICE, DTYPE
 
 logger = logging.getLogger(__name__)
 
 
+def _make_generator(seed: Optional[int]) -> torch.Generator:
+    generator = torch.Generator(device=DEVICE)
+    if seed is None:
+        generator.seed()
+    else:
+        generator.manual_seed(seed)
+    return generator
+
+
+def _encode_text(pipeline, text: str):
+    prompt_embeds, _, pooled_prompt_embeds, _ = pipeline.encode_prompt(
+        prompt=text,
+        device=pipeline._execution_device,
+        num_images_per_prompt=1,
+        do_classifier_free_guidance=False,
+    )
+    return prompt_embeds, pooled_prompt_embeds
+
+
+# SDXL prompt embeddings for one text, served from the embedding cache
+def _text_embeddings(pipeline, model_id: str, text: str):
+    return prompt_embedding_cache.get_or_compute(model_id, text, lambda: _encode_text(pipeline, text))
+
+
+def _negative_embeddings(pipeline, model_id: str, text: str, like):
+    # Same rule the pipeline applies to a missing negative prompt
+    if not text and pipeline.config.force_zeros_for_empty_prompt:
+        return torch.zeros_like(like[0]), torch.zeros_like(like[1])
+    return _text_embeddings(pipeline, model_id, text)
+
+
+def _supports_prompt_embeds(pipeline) -> bool:
+    return hasattr(pipeline, "encode_prompt") and getattr(pipeline, "text_encoder_2", None) is not None
+
+
+def _embedding_kwargs(pipeline, model_id: str, items: list[dict], guidance_scale: float) -> dict:
+    positive = [_text_embeddings(pipeline, model_id, item["prompt"]) for item in items]
+    kwargs = {
+        "prompt_embeds": torch.cat([p[0] for p in positive]),
+        "pooled_prompt_embeds": torch.cat([p[1] for p in positive]),
+    }
+    if guidance_scale > 1.0:
+        negative = [
+            _negative_embeddings(pipeline, model_id, item["negative_prompt"], pos)
+            for item, pos in zip(items, positive)
+        ]
+        kwargs["negative_prompt_embeds"] = torch.cat([n[0] for n in negative])
+        kwargs["negative_pooled_prompt_embeds"] = torch.cat([n[1] for n in negative])
+    return kwargs
+
+
+# bfloat16 autocast when the CPU performance mode enables it
+def _autocast():
+    return cpu_autocast() if DEVICE == "cpu" else nullcontext()
+
+
+# Forward per-step latents to the items that asked for progress callbacks. When
+# step_marks is given, the end time of each step is recorded there too.
+def _step_callback(items: list[dict], step_marks: list = None):
+    listeners = [(i, item["on_step"]) for i, item in enumerate(items) if item.get("on_step")]
+    if not listeners and step_marks is None:
+        return None
+
+    def callback(pipe, step_index, timestep, callback_kwargs):
+        if step_marks is not None:
+            step_marks.append(time.perf_counter())
+        latents = callback_kwargs["latents"]
+        total = getattr(pipe, "num_timesteps", None) or len(pipe.scheduler.timesteps)
+        for i, on_step in listeners:
+            try:
+                on_step(step_index + 1, total, latents[i:i + 1])
+            except Exception as e:
+                logger.warning(f"Step callback failed: {str(e)}")
+        return callback_kwargs
+
+    return callback
+
+
+# img2img variants of resident pipelines. from_pipe reuses the base pipeline's
+# modules, so no weights are copied; the entry goes away with the base pipeline.
+_img2img_pipelines = weakref.WeakKeyDictionary()
+
+
+def _img2img_pipeline(pipeline):
+    img2img = _img2img_pipelines.get(pipeline)
+    if img2img is None:
+        img2img = StableDiffusionXLImg2ImgPipeline.from_pipe(pipeline)
+        img2img.set_progress_bar_config(disable=True)
+        _img2img_pipelines[pipeline] = img2img
+    return img2img
+
+
+# Run one group of compatible requests as a single batched pipeline call.
+# Every item gets its own generator so its image only depends on its own seed.
+# A strength in the key makes it an img2img batch over the items' init images.
+# The model was loaded and pinned by the submitting threads, so this worker
+# only runs forward passes and a cold load never holds up other models.
+def _run_pipeline_batch(key: tuple, items: list[dict]) -> list[Image.Image]:
+    model_id, width, height, steps, guidance_scale, has_negative, strength = key
+
+    logger.info(f"Running {'img2img ' if strength is not None else ''}batch of {len(items)} with {model_id}")
+
+    pipeline = model_manager.resident_pipeline(model_id)
+    with torch.inference_mode(), _autocast():
+        if strength is None:
+            mode_kwargs = {"width": width, "height": height}
+        else:
+            pipeline = _img2img_pipeline(pipeline)
+            # Denoising starts at int(steps * strength) from the end, so only
+            # that many steps run
+            mode_kwargs = {"image": [item["image"] for item in items], "strength": strength}
+
+        started = time.perf_counter()
+        if _supports_prompt_embeds(pipeline):
+            text_kwargs = _embedding_kwargs(pipeline, model_id, items, guidance_scale)
+        else:
+            text_kwargs = {
+                "prompt": [item["prompt"] for item in items],
+                "negative_prompt": [item["negative_prompt"] for item in items] if has_negative else None,
+            }
+
+        step_marks = []
+        text_kwargs["callback_on_step_end"] = _step_callback(items, step_marks)
+
+        denoise_started = time.perf_counter()
+        result = pipeline(
+            **text_kwargs,
+            **mode_kwargs,
+            num_inference_steps=steps,
+            guidance_scale=guidance_scale,
+            generator=[_make_generator(item["seed"]) for item in items],
+        )
+        finished = time.perf_counter()
+
+    # Everything after the last step callback is VAE decode and postprocessing
+    last_step = step_marks[-1] if step_marks else finished
+    stages = {
+        "text_encode": denoise_started - started,
+        "denoise": last_step - denoise_started,
+        "decode": finished - last_step,
+    }
+    for stage, seconds in stages.items():
+        record_stage(stage, seconds, model_id)
+    for item in items:
+        if item.get("timings") is not None:
+            item["timings"].update(stages)
+
+    return list(result.images)
+
+
+# Activation memory grows with batch size times resolution, so large images
+# are batched fewer at a time
+def _batch_size_for(key: tuple) -> int:
+    if not settings.GENERATION_BATCH_MAX_PIXELS:
+        return settings.GENERATION_BATCH_MAX_SIZE
+    _, width, height = key[:3]
+    return settings.GENERATION_BATCH_MAX_PIXELS // (width * height)
+
+
+batch_scheduler = BatchScheduler(
+    _run_pipeline_batch,
+    max_batch_size=settings.GENERATION_BATCH_MAX_SIZE,
+    max_wait=settings.GENERATION_BATCH_MAX_WAIT_MS / 1000.0,
+    name="local-diffusion-batcher",
+    batch_size_for=_batch_size_for,
+)
+
+registry.gauge(
+    "batch_queue_depth", "Local generations waiting for the pipeline", (),
+    lambda: [((), batch_scheduler.pending())],
+)
+
+
+def _submit(
+    model_id: str,
+    prompt: str,
+    negative_prompt: str,
+    width: int,
+    height: int,
+    steps: int,
+    guidance_scale: float,
+    seed: Optional[int],
+    on_step: Optional[Callable] = None,
+    timings: Optional[dict] = None,
+    init_image: Optional[Image.Image] = None,
+    strength: Optional[float] = None,
+):
+    if init_image is not None:
+        width, height = init_image.size
+        strength = float(strength)
+    else:
+        strength = None
+    key = (model_id, int(width), int(height), int(steps), float(guidance_scale), bool(negative_prompt), strength)
+
+    # Loaded on the calling thread and pinned until the item is done
+    model_manager.acquire(model_id)
+    try:
+        future = batch_scheduler.submit(key, {
+            "prompt": prompt,
+            "negative_prompt": negative_prompt,
+            "seed": seed,
+            "on_step": on_step,
+            "timings": timings,
+            "image": init_image,
+        })
+    except BaseException:
+        model_manager.release(model_id)
+        raise
+    future.add_done_callback(lambda _: model_manager.release(model_id))
+    return future
+
+
 def generate_image_local(
     model_id: str,
     prompt: str,
@@ -17,41 +238,52 @@ def generate_image_local(
     steps: int = 30,
     guidance_scale: float = 7.5,
     seed: Optional[int] = None,
+    on_step: Optional[Callable] = None,
+    output_format: str = DEFAULT_OUTPUT_FORMAT,
+    quality: Optional[int] = None,
+    init_image: Optional[Image.Image] = None,
+    strength: Optional[float] = None,
 ) -> bytes:
     try:
-        pipeline = model_manager.load_model(model_id)
-
-        generator = None
-        if seed is not None:
-            generator = torch.Generator(device=DEVICE).manual_seed(seed)
-
         logger.info(f"Generating image with {model_id}: {prompt[:50]}...")
 
-        with torch.inference_mode():
-            result = pipeline(
-                prompt=prompt,
-                negative_prompt=negative_prompt if negative_prompt else None,
-                width=width,
-                height=height,
-                num_inference_steps=steps,
-                guidance_scale=guidance_scale,
-                generator=generator,
-            )
-
-        image = result.images[0]
-
-        buf = io.BytesIO()
-        image.save(buf, format="PNG", optimize=True)
-        buf.seek(0)
+        # Stages run on the batch worker; forward their timings to this request
+        timings = {}
+        started = time.perf_counter()
+        image = _submit(
+            model_id, prompt, negative_prompt, width, height, steps, guidance_scale, seed, on_step, timings,
+            init_image, strength,
+        ).result()
+        waited = time.perf_counter() - started
+        add_server_timing("queue", max(0.0, waited - sum(timings.values())))
+        for stage, seconds in timings.items():
+            add_server_timing(stage, seconds)
 
         logger.info(f"Image generated successfully")
-        return buf.getvalue()
+        started = time.perf_counter()
+        image_bytes = encode_image_async(image, output_format, quality).result()
+        add_server_timing("encode", time.perf_counter() - started)
+        return image_bytes
 
     except Exception as e:
         logger.error(f"Error generating image: {str(e)}")
         raise RuntimeError(f"Failed to generate image: {str(e)}")
 
 
+# Short generations at each resolution so the first real request does not pay
+# for allocator growth and kernel selection at that shape
+def warm_up_model(model_id: str, resolutions: list, steps: int = 2, guidance_scale: float = 7.5):
+    with model_manager.use_model(model_id):
+        for width, height in resolutions:
+            started = time.perf_counter()
+            _submit(model_id, "warm-up", "", width, height, steps, guidance_scale, 0).result()
+            logger.info(f"Warm-up pass for {model_id} at {width}x{height} took {time.perf_counter() - started:.2f}s")
+
+
+# Every item is queued at once, so the scheduler cuts the request into full
+# batched pipeline calls. Each item has its own seed (seed + index when only a
+# base seed is given), so an image does not depend on its position. Encoding
+# overlaps with the remaining batches; a failed batch fails only its items.
 def generate_image_batch(
     model_id: str,
     prompts: list[str],
@@ -61,44 +293,48 @@ def generate_image_batch(
     steps: int = 30,
     guidance_scale: float = 7.5,
     seed: Optional[int] = None,
-) -> list[bytes]:
-    try:
-        pipeline = model_manager.load_model(model_id)
+    seeds: Optional[list[Optional[int]]] = None,
+    output_format: str = DEFAULT_OUTPUT_FORMAT,
+    quality: Optional[int] = None,
+) -> list[ItemResult]:
+    if seeds is None:
+        seeds = [seed + i if seed is not None else None for i in range(len(prompts))]
+    logger.info(f"Generating batch of {len(prompts)} images with {model_id}")
 
-        generator = None
-        if seed is not None:
-            generator = torch.Generator(device=DEVICE).manual_seed(seed)
+    started = time.perf_counter()
+    timings = [{} for _ in prompts]
+    futures = [
+        _submit(model_id, prompt, negative_prompt, width, height, steps, guidance_scale, item_seed, None, item_timings)
+        for prompt, item_seed, item_timings in zip(prompts, seeds, timings)
+    ]
+    encoded = []
+    for future, item_timings in zip(futures, timings):
+        try:
+            image = future.result()
+            item_timings["queue"] = max(0.0, time.perf_counter() - started - sum(item_timings.values()))
+            encoded.append((encode_image_async(image, output_format, quality), time.perf_counter()))
+        except Exception as e:
+            encoded.append(e)
 
-        logger.info(f"Generating batch of {len(prompts)} images with {model_id}")
+    results = []
+    for index, item in enumerate(encoded):
+        try:
+            if isinstance(item, Exception):
+                raise item
+            encoding, queued_at = item
+            image_bytes = encoding.result()
+            timings[index]["encode"] = time.perf_counter() - queued_at
+            results.append(ItemResult(index, image_bytes, None, timings[index]))
+        except Exception as e:
+            logger.error(f"Batch item {index} failed: {str(e)}")
+            results.append(ItemResult(index, None, str(e)))
 
-        images_bytes = []
-
-        for prompt in prompts:
-            with torch.inference_mode():
-                result = pipeline(
-                    prompt=prompt,
-                    negative_prompt=negative_prompt if negative_prompt else None,
-                    width=width,
-                    height=height,
-                    num_inference_steps=steps,
-                    guidance_scale=guidance_scale,
-                    generator=generator,
-                )
-
-            image = result.images[0]
-            buf = io.BytesIO()
-            image.save(buf, format="PNG", optimize=True)
-            buf.seek(0)
-            images_bytes.append(buf.getvalue())
-
-        logger.info(f"Batch generation completed")
-        return images_bytes
-
-    except Exception as e:
-        logger.error(f"Error in batch generation: {str(e)}")
-        raise RuntimeError(f"Failed to generate batch: {str(e)}")
+    logger.info(f"Batch generation completed")
+    return results
 
 
+# Runs on the batch worker like txt2img, with the img2img variant of the
+# resident pipeline; the output has the init image's size
 def img2img_generate(
     model_id: str,
     init_image: Image.Image,
@@ -108,41 +344,18 @@ def img2img_generate(
     steps: int = 30,
     guidance_scale: float = 7.5,
     seed: Optional[int] = None,
+    on_step: Optional[Callable] = None,
+    output_format: str = DEFAULT_OUTPUT_FORMAT,
+    quality: Optional[int] = None,
 ) -> bytes:
-    try:
-        from diffusers import StableDiffusionImg2ImgPipeline
-
-        pipeline = model_manager.load_model(model_id)
-
-        if not hasattr(pipeline, 'img2img'):
-            logger.info(f"Converting pipeline to img2img mode")
-
-        generator = None
-        if seed is not None:
-            generator = torch.Generator(device=DEVICE).manual_seed(seed)
-
-        logger.info(f"Generating img2img with {model_id}: {prompt[:50]}...")
-
-        with torch.inference_mode():
-            result = pipeline(
-                prompt=prompt,
-                image=init_image,
-                negative_prompt=negative_prompt if negative_prompt else None,
-                strength=strength,
-                num_inference_steps=steps,
-                guidance_scale=guidance_scale,
-                generator=generator,
-            )
-
-        image = result.images[0]
-
-        buf = io.BytesIO()
-        image.save(buf, format="PNG", optimize=True)
-        buf.seek(0)
-
-        logger.info(f"Img2img generated successfully")
-        return buf.getvalue()
-
-    except Exception as e:
-        logger.error(f"Error in img2img generation: {str(e)}")
-        raise RuntimeError(f"Failed to generate img2img: {str(e)}")
+    return generate_image_local(
+        model_id, prompt, negative_prompt,
+        steps=steps,
+        guidance_scale=guidance_scale,
+        seed=seed,
+        on_step=on_step,
+        output_format=output_format,
+        quality=quality,
+        init_image=init_image,
+        strength=strength,
+    )
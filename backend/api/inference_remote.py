@@ -1,8 +1,21 @@
+import io
 import os
-import requests
+import base64
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Optional
 from pathlib import Path
+from PIL import Image
 from dotenv import load_dotenv
+from django.conf import settings
 import logging
+from .http_client import CircuitBreaker, PooledHTTPClient
+from .storage import StoredImage, save_image_stream
+from .event_loop import run_sync
+from .encoding import DEFAULT_OUTPUT_FORMAT, encode_image_async
+from .metrics import timed_stage
+from .batching import ItemResult
 
 env_path = Path(__file__).resolve().parents[1] / ".env"
 if env_path.exists():
@@ -23,15 +36,44 @@ MODEL_MAP = {
     "animagine-xl-3.1": "cagliostrolab/animagine-xl-3.1",
 }
 
-HF_INFERENCE_BASE = "https://api-inference.huggingface.co/models"
+HF_INFERENCE_BASE = os.getenv("HF_INFERENCE_BASE", "https://api-inference.huggingface.co/models")
 
 HEADERS = {"Authorization": f"Bearer {HF_TOKEN}"} if HF_TOKEN else {}
 
 
-def _call_hf_inference(repo_id: str, payload: dict, timeout: int = 300):
+IMAGE_EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/webp": "webp",
+}
+
+http_client = PooledHTTPClient(
+    pool_size=settings.REMOTE_POOL_SIZE,
+    max_retries=settings.REMOTE_MAX_RETRIES,
+    backoff_base=settings.REMOTE_BACKOFF_BASE,
+    backoff_max=settings.REMOTE_BACKOFF_MAX,
+    max_concurrency_per_key=settings.REMOTE_MAX_CONCURRENCY_PER_MODEL,
+    acquire_timeout=settings.REMOTE_TIMEOUT,
+    breaker=CircuitBreaker(
+        failure_threshold=settings.REMOTE_CIRCUIT_FAILURES,
+        reset_timeout=settings.REMOTE_CIRCUIT_RESET_SECONDS,
+    ),
+)
+
+
+# Upstream returns PNG/JPEG; re-encode only when the caller asked for another format
+def _transcode(image_bytes: bytes, output_format: str, quality: int = None) -> bytes:
+    if output_format == DEFAULT_OUTPUT_FORMAT:
+        return image_bytes
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.load()
+        return encode_image_async(image, output_format, quality).result()
+
+
+# Streamed POST through the shared client; use as a context manager
+def _call_hf_inference(repo_id: str, payload: dict, timeout: int = None):
     url = f"{HF_INFERENCE_BASE}/{repo_id}"
-    resp = requests.post(url, headers=HEADERS, json=payload, timeout=timeout)
-    return resp
+    return http_client.post(url, limit_key=repo_id, headers=HEADERS, json=payload, timeout=timeout or settings.REMOTE_TIMEOUT)
 
 
 def generate_image_remote(
@@ -43,7 +85,10 @@ def generate_image_remote(
     steps: int = 30,
     guidance_scale: float = 7.5,
     seed: int = None,
-) -> bytes:
+    on_step=None,
+    output_format: str = DEFAULT_OUTPUT_FORMAT,
+    quality: int = None,
+) -> "bytes | StoredImage":
     if model_id not in MODEL_MAP:
         raise ValueError(f"unknown model_id: {model_id}")
 
@@ -66,22 +111,110 @@ def generate_image_remote(
 
     logger.info(f"Calling HuggingFace API for {model_id}")
 
-    resp = _call_hf_inference(repo, payload)
+    with timed_stage("remote_inference", model_id), _call_hf_inference(repo, payload) as resp:
+        content_type = resp.headers.get("Content-Type", "")
+        if resp.status_code != 200:
+            try:
+                j = resp.json()
+                raise RuntimeError(f"HuggingFace error {resp.status_code}: {j}")
+            except ValueError:
+                raise RuntimeError(f"HuggingFace error {resp.status_code}: {resp.text}")
 
-    content_type = resp.headers.get("Content-Type", "")
-    if resp.status_code != 200:
-        try:
+        if content_type.startswith("application/json"):
             j = resp.json()
-            raise RuntimeError(f"HuggingFace error {resp.status_code}: {j}")
-        except Exception:
-            raise RuntimeError(f"HuggingFace error {resp.status_code}: {resp.text}")
-
-    if content_type.startswith("application/json"):
-        j = resp.json()
-        if isinstance(j, dict) and "images" in j and isinstance(j["images"], list) and j["images"]:
-            import base64
-            img_b64 = j["images"][0]
-            return base64.b64decode(img_b64)
-        raise RuntimeError(f"HuggingFace returned JSON, cannot extract image: {j}")
-
-    return resp.content
+            if isinstance(j, dict) and "images" in j and isinstance(j["images"], list) and j["images"]:
+                img_b64 = j["images"][0]
+                return _transcode(base64.b64decode(img_b64), output_format, quality)
+            raise RuntimeError(f"HuggingFace returned JSON, cannot extract image: {j}")
+
+        ext = IMAGE_EXTENSIONS.get(content_type.split(";")[0].strip(), "png")
+        if output_format != DEFAULT_OUTPUT_FORMAT:
+            return _transcode(resp.content, output_format, quality)
+        return save_image_stream(resp.iter_content(chunk_size=64 * 1024), ext=ext)
+
+
+# Blocking calls go through the pooled client (retries, breaker, per-model
+# limits) on these threads while the shared event loop bounds the fan-out
+_fanout_executor = ThreadPoolExecutor(
+    max_workers=settings.REMOTE_BATCH_MAX_IN_FLIGHT,
+    thread_name_prefix="remote-fanout",
+)
+
+
+async def generate_images_remote_async(
+    model_id: str,
+    prompts: List[str],
+    negative_prompt: str = "",
+    width: int = 512,
+    height: int = 512,
+    steps: int = 30,
+    guidance_scale: float = 7.5,
+    seeds: Optional[List[Optional[int]]] = None,
+    max_in_flight: int = None,
+    output_format: str = DEFAULT_OUTPUT_FORMAT,
+    quality: int = None,
+) -> List[ItemResult]:
+    if model_id not in MODEL_MAP:
+        raise ValueError(f"unknown model_id: {model_id}")
+
+    limit = asyncio.Semaphore(max(1, max_in_flight or settings.REMOTE_BATCH_MAX_IN_FLIGHT))
+    loop = asyncio.get_running_loop()
+    seeds = seeds or [None] * len(prompts)
+
+    async def one(index: int, prompt: str, seed: Optional[int]) -> ItemResult:
+        async with limit:
+            call = partial(
+                generate_image_remote,
+                model_id=model_id,
+                prompt=prompt,
+                negative_prompt=negative_prompt,
+                width=width,
+                height=height,
+                steps=steps,
+                guidance_scale=guidance_scale,
+                seed=seed,
+                output_format=output_format,
+                quality=quality,
+            )
+            try:
+                image = await loop.run_in_executor(_fanout_executor, call)
+            except Exception as e:
+                logger.error(f"Remote batch item {index} failed: {str(e)}")
+                return ItemResult(index, None, str(e))
+            return ItemResult(index, image, None)
+
+    logger.info(f"Fanning out {len(prompts)} remote generations for {model_id}")
+    return list(await asyncio.gather(*(one(i, p, s) for i, (p, s) in enumerate(zip(prompts, seeds)))))
+
+
+# Sync entry point for Django views: results come back in prompt order, with a
+# per-item error instead of failing the whole batch
+def generate_image_batch_remote(
+    model_id: str,
+    prompts: List[str],
+    negative_prompt: str = "",
+    width: int = 512,
+    height: int = 512,
+    steps: int = 30,
+    guidance_scale: float = 7.5,
+    seed: Optional[int] = None,
+    seeds: Optional[List[Optional[int]]] = None,
+    max_in_flight: int = None,
+    output_format: str = DEFAULT_OUTPUT_FORMAT,
+    quality: int = None,
+) -> List[ItemResult]:
+    if seeds is None and seed is not None:
+        seeds = [seed + i for i in range(len(prompts))]
+    return run_sync(generate_images_remote_async(
+        model_id,
+        prompts,
+        negative_prompt=negative_prompt,
+        width=width,
+        height=height,
+        steps=steps,
+        guidance_scale=guidance_scale,
+        seeds=seeds,
+        max_in_flight=max_in_flight,
+        output_format=output_format,
+        quality=quality,
+    ))
@@ -0,0 +1,152 @@
+import json
+import logging
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from PIL import Image, ImageOps, UnidentifiedImageError
+from . import storage
+
+logger = logging.getLogger(__name__)
+
+# Upload formats accepted as img2img input, and the extension they are stored with
+INPUT_FORMATS = {
+    "PNG": "png",
+    "JPEG": "jpg",
+    "WEBP": "webp",
+}
+
+
+# Multipart overhead allowed on top of the file itself: boundaries, part
+# headers and the other form fields
+UPLOAD_OVERHEAD_BYTES = 64 * 1024
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def max_request_bytes() -> int:
+    return settings.IMG2IMG_MAX_UPLOAD_BYTES + UPLOAD_OVERHEAD_BYTES
+
+
+def upload_too_large_message() -> str:
+    return f"upload is larger than {settings.IMG2IMG_MAX_UPLOAD_BYTES} bytes"
+
+
+# First in the request's upload handler chain: stops reading the request once
+# an uploaded file passes the limit, so the rest is neither received nor
+# written. The view checks exceeded, since the stopped file is simply missing.
+class MaxUploadSizeHandler(FileUploadHandler):
+    def __init__(self, request=None, max_bytes: int = None):
+        super().__init__(request)
+        self.max_bytes = settings.IMG2IMG_MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+        self.exceeded = False
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_bytes:
+            self.exceeded = True
+            raise StopUpload(connection_reset=True)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+# ASGI wrapper capping the body of requests to the given paths. Django's ASGI
+# handler reads the whole body before any view runs, so only this stops an
+# oversized upload from being received: it answers 413 as soon as the
+# Content-Length, or the bytes actually received, pass the limit.
+class RequestBodyLimit:
+    def __init__(self, app, limits: dict):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        try:
+            declared = int(dict(scope.get("headers") or []).get(b"content-length", b"0"))
+        except ValueError:
+            declared = 0
+        if declared > limit:
+            return await self._reject(send)
+
+        received = 0
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    rejected = True
+                    await self._reject(send)
+                    # Django abandons the request on disconnect and sends nothing
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            if not rejected:
+                await send(message)
+
+        await self.app(scope, limited_receive, guarded_send)
+
+    @staticmethod
+    async def _reject(send):
+        body = json.dumps({"status": "error", "error": upload_too_large_message()}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def _check_header(image: Image.Image):
+    if image.format not in INPUT_FORMATS:
+        raise InvalidImage(f"unsupported image format: {image.format}; use one of {', '.join(INPUT_FORMATS)}")
+    width, height = image.size
+    if width * height > settings.IMG2IMG_MAX_INPUT_PIXELS:
+        raise InvalidImage(f"image is {width}x{height}; at most {settings.IMG2IMG_MAX_INPUT_PIXELS} pixels allowed")
+
+
+# Checks size, format and dimensions from the header only, then streams the
+# upload into content-addressed storage (inputs/ab/cd/<sha256>.<ext>) in chunks.
+# Returns the stored path, which jobs and the generation cache key refer to.
+def store_upload(upload) -> str:
+    if upload.size > settings.IMG2IMG_MAX_UPLOAD_BYTES:
+        raise InvalidImage(f"upload is {upload.size} bytes; at most {settings.IMG2IMG_MAX_UPLOAD_BYTES} allowed")
+    try:
+        with Image.open(upload) as image:
+            _check_header(image)
+            ext = INPUT_FORMATS[image.format]
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise InvalidImage(f"not a readable image: {e}")
+
+    upload.seek(0)
+    stored = storage.save_image_stream(upload.chunks(), ext=ext, directory="inputs")
+    logger.info(f"Stored img2img input {stored.rel_path} ({stored.size} bytes)")
+    return stored.rel_path
+
+
+# Decode the init image at the generation size. JPEGs decode straight at a
+# reduced scale; the result is cropped to the target aspect ratio and resized to
+# multiples of 8, which the VAE requires.
+def load_init_image(rel_path: str, width: int, height: int) -> Image.Image:
+    width, height = max(8, width - width % 8), max(8, height - height % 8)
+    try:
+        with storage.open_file(rel_path) as f, Image.open(f) as image:
+            _check_header(image)
+            image.draft("RGB", (width, height))
+            image = ImageOps.exif_transpose(image).convert("RGB")
+    except FileNotFoundError:
+        raise InvalidImage(f"init image not found: {rel_path}")
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise InvalidImage(f"not a readable image: {e}")
+    if image.size == (width, height):
+        return image
+    return ImageOps.fit(image, (width, height), Image.LANCZOS)
@@ -0,0 +1,154 @@
+import threading
+import time
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from .models import GenerationJob
+from .metrics import collect_server_timing, registry
+from .startup import warmup
+
+logger = logging.getLogger(__name__)
+
+
+# Bounded pool of in-process workers draining the GenerationJob table. The table
+# is the queue, so queued jobs survive restarts and several server processes can
+# share it: a worker only runs a job after winning the queued -> running update.
+# A job still running after stale_after seconds belonged to a worker that died,
+# and is failed so clients polling it get an answer.
+class JobQueue:
+    def __init__(self, num_workers: int, poll_interval: float, stale_after: float = 1800.0):
+        self.num_workers = max(1, num_workers)
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._next_stale_check = 0.0
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._stopping = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            try:
+                self.fail_stale()
+            except Exception as e:
+                logger.error(f"Job queue could not check for interrupted jobs: {str(e)}")
+            for i in range(self.num_workers):
+                t = threading.Thread(target=self._worker_loop, name=f"generation-job-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        logger.info(f"Job queue started with {self.num_workers} worker(s)")
+
+    def stop(self):
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for t in threads:
+            t.join(timeout=5)
+
+    def submit(self, kind: str, params: dict) -> GenerationJob:
+        job = GenerationJob.objects.create(kind=kind, params=params)
+        self.start()
+        with self._wakeup:
+            self._wakeup.notify()
+        return job
+
+    def depth(self) -> int:
+        return GenerationJob.objects.filter(status=GenerationJob.STATUS_QUEUED).count()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.num_workers,
+            "running": len(self._threads) > 0,
+            "queued": self.depth(),
+        }
+
+    def fail_stale(self) -> int:
+        self._next_stale_check = time.monotonic() + min(self.stale_after, 60.0)
+        if self.stale_after <= 0:
+            return 0
+        cutoff = timezone.now() - timedelta(seconds=self.stale_after)
+        failed = GenerationJob.objects.filter(
+            status=GenerationJob.STATUS_RUNNING, started_at__lt=cutoff
+        ).update(
+            status=GenerationJob.STATUS_FAILED,
+            error="Job was interrupted before it finished; submit it again",
+            finished_at=timezone.now(),
+        )
+        if failed:
+            logger.warning(f"Failed {failed} job(s) left running by a stopped worker")
+        return failed
+
+    def _claim_next(self):
+        candidates = list(
+            GenerationJob.objects.filter(status=GenerationJob.STATUS_QUEUED)
+            .order_by("created_at")
+            .values_list("id", "params")[:self.num_workers * 4]
+        )
+        # Among the oldest jobs, run those for already-resident models first so a
+        # cold model load does not hold up work that could start now. The window
+        # is bounded, so jobs for cold models still run once they are the oldest.
+        candidates.sort(key=lambda c: not warmup.is_model_warm((c[1] or {}).get("model_id")))
+        for job_id, _ in candidates:
+            claimed = GenerationJob.objects.filter(id=job_id, status=GenerationJob.STATUS_QUEUED).update(
+                status=GenerationJob.STATUS_RUNNING, started_at=timezone.now()
+            )
+            if claimed:
+                return GenerationJob.objects.get(id=job_id)
+        return None
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            close_old_connections()
+            try:
+                if time.monotonic() >= self._next_stale_check:
+                    self.fail_stale()
+                job = self._claim_next()
+            except Exception as e:
+                logger.error(f"Job queue could not claim work: {str(e)}")
+                job = None
+
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(timeout=self.poll_interval)
+                continue
+
+            self._run(job)
+
+    def _run(self, job: GenerationJob):
+        from .generation import generate_record
+
+        logger.info(f"Running job {job.id} ({job.kind})")
+        try:
+            # Collected so the stored record carries its stage timings
+            with collect_server_timing():
+                record, _ = generate_record(job.params)
+            job.result = record
+            job.status = GenerationJob.STATUS_DONE
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {str(e)}")
+            job.error = str(e)
+            job.status = GenerationJob.STATUS_FAILED
+        job.finished_at = timezone.now()
+        try:
+            job.save(update_fields=["result", "status", "error", "finished_at"])
+        except Exception as e:
+            logger.error(f"Could not record outcome of job {job.id}: {str(e)}")
+
+
+job_queue = JobQueue(
+    num_workers=settings.GENERATION_JOB_WORKERS,
+    poll_interval=settings.GENERATION_JOB_POLL_INTERVAL,
+    stale_after=settings.GENERATION_JOB_STALE_AFTER,
+)
+
+registry.gauge(
+    "job_queue_depth", "Generation jobs waiting for a worker", (),
+    lambda: [((), job_queue.depth())],
+)
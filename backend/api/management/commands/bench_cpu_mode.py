@@ -0,0 +1,141 @@
+import json
+import math
+import statistics
+import time
+import numpy as np
+import torch
+from diffusers.utils import logging as diffusers_logging
+from django.core.management.base import BaseCommand, CommandError
+from api.cpu_perf import bf16_supported, configure_threads, cpu_autocast, optimize_pipeline
+from api.model_loader import MODEL_CONFIGS, SCHEDULER_CLASS, model_manager
+from api.tiny_pipeline import build_tiny_sdxl_pipeline
+
+# name -> (channels_last, bf16 autocast, torch.compile)
+VARIANTS = {
+    "fp32": (False, False, False),
+    "channels_last": (True, False, False),
+    "bf16": (False, True, False),
+    "compile": (False, False, True),
+    "all": (True, True, True),
+}
+
+
+# How far an image moved from the fp32 baseline, on 0-255 pixel values
+def _drift(image: np.ndarray, baseline: np.ndarray) -> dict:
+    diff = np.abs(image.astype(np.float64) - baseline.astype(np.float64))
+    mse = float(np.mean(diff ** 2))
+    return {
+        "mean_abs_diff": round(float(diff.mean()), 3),
+        "max_abs_diff": int(diff.max()),
+        "psnr_db": round(10 * math.log10(255 ** 2 / mse), 2) if mse else None,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare CPU performance-mode variants (bf16 autocast, channels_last, torch.compile) against fp32'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', type=str, default=None, help='Benchmark a configured model (needs its weights)')
+        parser.add_argument('--variants', nargs='+', default=list(VARIANTS.keys()), choices=list(VARIANTS.keys()))
+        parser.add_argument('--size', type=int, default=None, help='Square resolution (default: 128, or the model default)')
+        parser.add_argument('--steps', type=int, default=4)
+        parser.add_argument('--guidance-scale', type=float, default=5.0)
+        parser.add_argument('--threads', type=int, default=0, help='Intra-op threads (0 = torch default)')
+        parser.add_argument('--repeats', type=int, default=3, help='Timed runs per variant (after one warm-up)')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        diffusers_logging.disable_progress_bar()
+        configure_threads(intra_op=options['threads'])
+
+        model_id = options['model']
+        if model_id is not None and model_id not in MODEL_CONFIGS:
+            raise CommandError(f"Unknown model: {model_id}")
+        size = options['size'] or (MODEL_CONFIGS[model_id]["default_size"] if model_id else 128)
+
+        def build():
+            if model_id is None:
+                return build_tiny_sdxl_pipeline()
+            config = MODEL_CONFIGS[model_id]
+            pipeline = config["pipeline_class"].from_pretrained(
+                config["repo_id"], torch_dtype=torch.float32, use_safetensors=True, token=model_manager.hf_token
+            )
+            pipeline.scheduler = SCHEDULER_CLASS.from_config(pipeline.scheduler.config)
+            pipeline.set_progress_bar_config(disable=True)
+            return pipeline
+
+        def generate(pipeline, autocast):
+            with torch.inference_mode(), cpu_autocast(autocast):
+                result = pipeline(
+                    prompt="a lighthouse on a cliff at dusk",
+                    width=size,
+                    height=size,
+                    num_inference_steps=options['steps'],
+                    guidance_scale=options['guidance_scale'],
+                    generator=torch.Generator().manual_seed(0),
+                )
+            return np.asarray(result.images[0])
+
+        results = {
+            "model": model_id or "tiny-sdxl",
+            "size": size,
+            "steps": options['steps'],
+            "threads": torch.get_num_threads(),
+            "bf16_supported": bf16_supported(),
+            "variants": {},
+        }
+        # fp32 always runs first: it is the reference for speed and drift
+        variants = ["fp32"] + [v for v in options['variants'] if v != "fp32"]
+        baseline_image, baseline_ms = None, None
+        for name in variants:
+            channels_last, autocast, compile = VARIANTS[name]
+            if autocast and not bf16_supported():
+                results["variants"][name] = {"skipped": "no native bf16 support on this CPU"}
+                continue
+            try:
+                pipeline = optimize_pipeline(build(), channels_last=channels_last, compile=compile)
+                started = time.perf_counter()
+                generate(pipeline, autocast)
+                warmup_ms = (time.perf_counter() - started) * 1000
+
+                times = []
+                for _ in range(options['repeats']):
+                    started = time.perf_counter()
+                    image = generate(pipeline, autocast)
+                    times.append((time.perf_counter() - started) * 1000)
+            except Exception as e:
+                results["variants"][name] = {"error": str(e).splitlines()[0]}
+                continue
+
+            median_ms = statistics.median(times)
+            if baseline_image is None:
+                baseline_image, baseline_ms = image, median_ms
+            entry = {
+                "warmup_ms": round(warmup_ms, 2),
+                "median_ms": round(median_ms, 2),
+                "speedup": round(baseline_ms / median_ms, 2),
+            }
+            entry.update(_drift(image, baseline_image))
+            results["variants"][name] = entry
+            del pipeline
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(
+            f"{results['model']} {size}x{size}, {options['steps']} steps, {results['threads']} threads, "
+            f"bf16 {'supported' if results['bf16_supported'] else 'unsupported'}"
+        )
+        self.stdout.write(
+            f"{'variant':>14} {'warm-up ms':>11} {'median ms':>10} {'speedup':>8} {'mean diff':>10} {'max diff':>9} {'PSNR dB':>8}"
+        )
+        for name, r in results["variants"].items():
+            if "median_ms" not in r:
+                self.stdout.write(f"{name:>14}  {r.get('skipped') or r.get('error')}")
+                continue
+            psnr = "inf" if r["psnr_db"] is None else f"{r['psnr_db']:.2f}"
+            self.stdout.write(
+                f"{name:>14} {r['warmup_ms']:>11.2f} {r['median_ms']:>10.2f} {r['speedup']:>7.2f}x "
+                f"{r['mean_abs_diff']:>10.3f} {r['max_abs_diff']:>9} {psnr:>8}"
+            )
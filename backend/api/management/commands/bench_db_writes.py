@@ -0,0 +1,156 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Database settings per variant; each runs in a fresh interpreter against its
+# own database file, since journal_mode is stored in the file
+VARIANTS = {
+    "default": {"SQLITE_WAL": "false", "SQLITE_SYNCHRONOUS": "FULL", "RECORD_WRITER_ENABLED": "false"},
+    "wal": {"SQLITE_WAL": "true", "SQLITE_SYNCHRONOUS": "NORMAL", "RECORD_WRITER_ENABLED": "false"},
+    "buffered": {"SQLITE_WAL": "false", "SQLITE_SYNCHRONOUS": "FULL", "RECORD_WRITER_ENABLED": "true"},
+    "wal+buffered": {"SQLITE_WAL": "true", "SQLITE_SYNCHRONOUS": "NORMAL", "RECORD_WRITER_ENABLED": "true"},
+}
+
+# Writer threads insert one generated-image row at a time through the record
+# writer (inline autocommitted inserts when it is disabled) for a fixed time,
+# while reader threads page through the history like the results view does.
+CHILD = r"""
+import json, os, sys, time, threading
+sys.path.insert(0, os.environ["BENCH_BASE_DIR"])
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+import django
+django.setup()
+
+from django.core.management import call_command
+from django.db import close_old_connections, connection
+from django.utils import timezone
+from api.db import record_writer
+from api.models import GeneratedImage
+
+call_command("migrate", verbosity=0)
+connection.close()
+
+duration = float(os.environ["BENCH_DURATION"])
+writers = int(os.environ["BENCH_WRITERS"])
+readers = int(os.environ["BENCH_READERS"])
+latencies, reads, errors = [], [0], []
+lock = threading.Lock()
+deadline = time.perf_counter() + duration
+
+def write(worker):
+    n = 0
+    mine = []
+    while time.perf_counter() < deadline:
+        record = GeneratedImage(
+            prompt=f"benchmark prompt {worker}-{n}", image=f"generated/{worker:02x}/{n:08x}.png",
+            created_at=timezone.now(), model_id="sdxl-turbo", seed=n, width=512, height=512, byte_size=400000,
+            params={"steps": 4, "guidance_scale": 0.0, "output_format": "png"},
+            timings={"queue": 0.001, "denoise": 0.8, "decode": 0.1, "encode": 0.02},
+        )
+        started = time.perf_counter()
+        try:
+            record_writer.insert([record])
+            mine.append(time.perf_counter() - started)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+        n += 1
+    with lock:
+        latencies.extend(mine)
+    close_old_connections()
+    connection.close()
+
+def read():
+    while time.perf_counter() < deadline:
+        list(GeneratedImage.objects.order_by("-created_at", "-id")[:20])
+        reads[0] += 1
+    connection.close()
+
+started = time.perf_counter()
+threads = [threading.Thread(target=write, args=(i,)) for i in range(writers)]
+threads += [threading.Thread(target=read) for _ in range(readers)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+elapsed = time.perf_counter() - started
+
+latencies.sort()
+pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else 0.0
+with connection.cursor() as cursor:
+    cursor.execute("PRAGMA journal_mode")
+    journal_mode = cursor.fetchone()[0]
+print(json.dumps({
+    "rows": len(latencies),
+    "rows_per_s": len(latencies) / elapsed,
+    "p50_ms": pick(0.5) * 1000,
+    "p99_ms": pick(0.99) * 1000,
+    "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+    "reads_per_s": reads[0] / elapsed,
+    "errors": len(errors),
+    "first_error": errors[0] if errors else None,
+    "transactions": record_writer.transactions,
+    "journal_mode": journal_mode,
+    "stored_rows": GeneratedImage.objects.count(),
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Measure sustained generated-image insert throughput with concurrent writers, per SQLite configuration'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--variants', nargs='+', default=list(VARIANTS.keys()), choices=list(VARIANTS.keys()))
+        parser.add_argument('--writers', type=int, default=8, help='Concurrent writer threads')
+        parser.add_argument('--readers', type=int, default=1, help='Concurrent history readers')
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds of sustained writes per variant')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        results = {}
+        with tempfile.TemporaryDirectory(prefix="bench-db-") as tmp:
+            for name in options['variants']:
+                env = dict(
+                    os.environ,
+                    **VARIANTS[name],
+                    SQLITE_PATH=os.path.join(tmp, f"{name.replace('+', '-')}.sqlite3"),
+                    BENCH_BASE_DIR=str(settings.BASE_DIR),
+                    BENCH_DURATION=str(options['duration']),
+                    BENCH_WRITERS=str(options['writers']),
+                    BENCH_READERS=str(options['readers']),
+                )
+                proc = subprocess.run(
+                    [sys.executable, "-c", CHILD], env=env, cwd=settings.BASE_DIR, capture_output=True, text=True
+                )
+                if proc.returncode != 0:
+                    raise CommandError(f"Variant {name} failed:\n{proc.stderr[-2000:]}")
+                results[name] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+        baseline = results.get("default")
+        for result in results.values():
+            if baseline and baseline["rows_per_s"]:
+                result["speedup"] = result["rows_per_s"] / baseline["rows_per_s"]
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(
+            f"{options['writers']} writers, {options['readers']} readers, {options['duration']:.0f}s per variant"
+        )
+        self.stdout.write(
+            f"{'variant':>13}  {'journal':>7}  {'rows/s':>9}  {'p50 ms':>8}  {'p99 ms':>8}  {'max ms':>8}  "
+            f"{'reads/s':>8}  {'txns':>6}  {'errors':>6}  {'speedup':>7}"
+        )
+        for name, r in results.items():
+            self.stdout.write(
+                f"{name:>13}  {r['journal_mode']:>7}  {r['rows_per_s']:>9.0f}  {r['p50_ms']:>8.2f}  {r['p99_ms']:>8.2f}  "
+                f"{r['max_ms']:>8.1f}  {r['reads_per_s']:>8.0f}  {r['transactions'] or '-':>6}  {r['errors']:>6}  "
+                f"{r.get('speedup', 1.0):>6.2f}x"
+            )
+            if r['first_error']:
+                self.stdout.write(self.style.WARNING(f"  {name}: {r['first_error']}"))
@@ -0,0 +1,57 @@
+import json
+import statistics
+import time
+from PIL import Image, ImageFilter
+from django.core.management.base import BaseCommand
+from api.encoding import OUTPUT_FORMATS, encode_image
+
+
+# Smooth gradients plus blurred noise: compresses roughly like a generated image,
+# unlike pure noise (incompressible) or a flat fill (trivially compressible)
+def _synthetic_image(size: int) -> Image.Image:
+    gradient = Image.linear_gradient("L").resize((size, size))
+    radial = Image.radial_gradient("L").resize((size, size))
+    noise = Image.effect_noise((size, size), 64).filter(ImageFilter.GaussianBlur(2))
+    return Image.merge("RGB", (gradient, radial, noise))
+
+
+class Command(BaseCommand):
+    help = 'Benchmark output encoders: time and bytes per format and resolution'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[512, 768, 1024])
+        parser.add_argument('--formats', nargs='+', type=str, default=list(OUTPUT_FORMATS.keys()))
+        parser.add_argument('--quality', type=int, default=None)
+        parser.add_argument('--repeats', type=int, default=5)
+        parser.add_argument('--image', type=str, default=None, help='Encode this image instead of a synthetic one')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        source = Image.open(options['image']).convert("RGB") if options['image'] else None
+        results = []
+
+        for size in options['sizes']:
+            image = source.resize((size, size)) if source else _synthetic_image(size)
+            for output_format in options['formats']:
+                if output_format not in OUTPUT_FORMATS:
+                    self.stdout.write(self.style.WARNING(f"Skipping unavailable format {output_format}"))
+                    continue
+                timings = []
+                for _ in range(options['repeats']):
+                    started = time.perf_counter()
+                    data = encode_image(image, output_format, options['quality'])
+                    timings.append(time.perf_counter() - started)
+                results.append({
+                    "size": size,
+                    "format": output_format,
+                    "ms": round(statistics.median(timings) * 1000, 2),
+                    "bytes": len(data),
+                })
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f"{'size':>6} {'format':>10} {'ms':>10} {'bytes':>10}")
+        for r in results:
+            self.stdout.write(f"{r['size']:>6} {r['format']:>10} {r['ms']:>10.2f} {r['bytes']:>10}")
@@ -0,0 +1,211 @@
+import json
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+import torch
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from django.utils import timezone
+from api.encoding import DEFAULT_OUTPUT_FORMAT, OUTPUT_FORMATS, encode_image, extension_for
+from api.inference_local import _encode_text
+from api.models import GeneratedImage
+from api.storage import save_image_bytes
+from api.tiny_pipeline import build_tiny_sdxl_pipeline
+
+
+# Records wall time of every call to the wrapped callables, grouped by stage
+class StageTimer:
+    def __init__(self):
+        self.calls = defaultdict(list)
+
+    def wrap(self, stage: str, fn):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.calls[stage].append(time.perf_counter() - started)
+        return timed
+
+    def measure(self, stage: str, fn, *args, **kwargs):
+        return self.wrap(stage, fn)(*args, **kwargs)
+
+    def reset(self):
+        self.calls = defaultdict(list)
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+class Command(BaseCommand):
+    help = 'Time each inference stage on a tiny random-weight SDXL pipeline (CPU, no downloads)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[64, 128], help='Square output resolutions')
+        parser.add_argument('--steps', nargs='+', type=int, default=[2, 4])
+        parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 2])
+        parser.add_argument('--guidance-scale', type=float, default=5.0)
+        parser.add_argument('--output-format', type=str, default=DEFAULT_OUTPUT_FORMAT, choices=list(OUTPUT_FORMATS.keys()))
+        parser.add_argument('--repeats', type=int, default=3, help='Timed runs per configuration (after one warm-up)')
+        parser.add_argument('--output', type=str, default=None, help='Write JSON results to this file')
+        parser.add_argument('--compare', type=str, default=None, help='Report change against a previous --output file')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        pipeline = build_tiny_sdxl_pipeline()
+        timer = StageTimer()
+        # Instance attributes shadow the methods the pipeline calls internally
+        pipeline.unet.forward = timer.wrap("unet_step", pipeline.unet.forward)
+        pipeline.scheduler.step = timer.wrap("scheduler_step", pipeline.scheduler.step)
+        pipeline.vae.decode = timer.wrap("vae_decode", pipeline.vae.decode)
+
+        configs = []
+        with tempfile.TemporaryDirectory(prefix="bench-media-") as media_root, override_settings(MEDIA_ROOT=media_root):
+            for size in options['sizes']:
+                for steps in options['steps']:
+                    for batch_size in options['batch_sizes']:
+                        configs.append(self._bench(pipeline, timer, size, steps, batch_size, options))
+                        if not options['json']:
+                            self._print_row(configs[-1])
+
+        results = {
+            "benchmark": "inference",
+            "revision": _git_revision(),
+            "timestamp": timezone.now().isoformat(),
+            "torch": torch.__version__,
+            "threads": torch.get_num_threads(),
+            "platform": platform.platform(),
+            "guidance_scale": options['guidance_scale'],
+            "output_format": options['output_format'],
+            "repeats": options['repeats'],
+            "configs": configs,
+        }
+
+        if options['output']:
+            with open(options['output'], "w") as f:
+                json.dump(results, f, indent=2)
+            if not options['json']:
+                self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        elif options['compare']:
+            self._print_comparison(options['compare'], results)
+
+    def _run_once(self, pipeline, timer, size, steps, batch_size, seed, options):
+        guidance_scale = options['guidance_scale']
+        prompts = [f"benchmark prompt {i}" for i in range(batch_size)]
+
+        started = time.perf_counter()
+        with torch.inference_mode():
+            positive = [timer.measure("text_encode", _encode_text, pipeline, p) for p in prompts]
+            kwargs = {
+                "prompt_embeds": torch.cat([p[0] for p in positive]),
+                "pooled_prompt_embeds": torch.cat([p[1] for p in positive]),
+            }
+            if guidance_scale > 1.0:
+                negative = [timer.measure("text_encode", _encode_text, pipeline, "blurry") for _ in prompts]
+                kwargs["negative_prompt_embeds"] = torch.cat([n[0] for n in negative])
+                kwargs["negative_pooled_prompt_embeds"] = torch.cat([n[1] for n in negative])
+
+            images = timer.measure(
+                "pipeline", pipeline,
+                **kwargs,
+                width=size,
+                height=size,
+                num_inference_steps=steps,
+                guidance_scale=guidance_scale,
+                generator=[torch.Generator().manual_seed(seed + i) for i in range(batch_size)],
+            ).images
+
+        ext = extension_for(options['output_format'])
+        with transaction.atomic():
+            for prompt, image in zip(prompts, images):
+                data = timer.measure("image_encode", encode_image, image, options['output_format'])
+                rel_path = timer.measure("file_write", save_image_bytes, data, ext=ext)
+                timer.measure(
+                    "db_insert", GeneratedImage.objects.create,
+                    prompt=prompt, image=rel_path, created_at=timezone.now(),
+                )
+            # Measure the insert without leaving benchmark rows behind
+            transaction.set_rollback(True)
+        return time.perf_counter() - started
+
+    def _bench(self, pipeline, timer, size, steps, batch_size, options):
+        # Warm-up run: first-call allocations and lazy init are not representative
+        self._run_once(pipeline, timer, size, steps, batch_size, 0, options)
+
+        totals, per_run = [], defaultdict(list)
+        per_call = defaultdict(list)
+        for repeat in range(options['repeats']):
+            timer.reset()
+            totals.append(self._run_once(pipeline, timer, size, steps, batch_size, (repeat + 1) * 1000, options))
+            for stage, calls in timer.calls.items():
+                per_run[stage].append(sum(calls))
+                per_call[stage].extend(calls)
+
+        stages = {
+            stage: {
+                "total_ms": _ms(statistics.median(per_run[stage])),
+                "per_call_ms": _ms(statistics.median(per_call[stage])),
+                "calls": len(per_call[stage]) // options['repeats'],
+            }
+            for stage in per_run
+        }
+        # Whatever the pipeline spends outside the UNet, scheduler and VAE
+        pipeline_ms = stages.pop("pipeline")["total_ms"]
+        inner_ms = sum(stages[s]["total_ms"] for s in ("unet_step", "scheduler_step", "vae_decode") if s in stages)
+        stages["pipeline_overhead"] = {"total_ms": round(pipeline_ms - inner_ms, 3), "per_call_ms": None, "calls": 1}
+
+        total_ms = statistics.median(totals) * 1000
+        return {
+            "size": size,
+            "steps": steps,
+            "batch_size": batch_size,
+            "total_ms": round(total_ms, 3),
+            "per_image_ms": round(total_ms / batch_size, 3),
+            "stages": stages,
+        }
+
+    def _print_comparison(self, path, results):
+        with open(path) as f:
+            baseline = json.load(f)
+        previous = {(c["size"], c["steps"], c["batch_size"]): c for c in baseline["configs"]}
+
+        self.stdout.write(f"\nAgainst {baseline.get('revision', 'unknown')} ({path}):")
+        for config in results["configs"]:
+            before = previous.get((config["size"], config["steps"], config["batch_size"]))
+            if before is None:
+                continue
+            change = (config["total_ms"] - before["total_ms"]) / before["total_ms"] * 100
+            self.stdout.write(
+                f"{config['size']:>5} {config['steps']:>5} {config['batch_size']:>5} "
+                f"{before['total_ms']:>10.2f} -> {config['total_ms']:>10.2f} ms ({change:+.1f}%)"
+            )
+
+    def _print_row(self, result):
+        stages = result["stages"]
+        columns = ["text_encode", "unet_step", "scheduler_step", "vae_decode", "image_encode", "file_write", "db_insert"]
+        if not hasattr(self, "_header_printed"):
+            self._header_printed = True
+            self.stdout.write(
+                f"{'size':>5} {'steps':>5} {'batch':>5} {'total':>10} "
+                + " ".join(f"{c:>14}" for c in columns)
+            )
+        cells = " ".join(f"{stages[c]['total_ms'] if c in stages else 0:>14.2f}" for c in columns)
+        self.stdout.write(
+            f"{result['size']:>5} {result['steps']:>5} {result['batch_size']:>5} {result['total_ms']:>10.2f} {cells}"
+        )
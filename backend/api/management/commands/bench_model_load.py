@@ -0,0 +1,120 @@
+import ctypes
+import gc
+import json
+import os
+import statistics
+import tempfile
+import time
+import torch
+from diffusers.utils import logging as diffusers_logging
+from django.core.management.base import BaseCommand, CommandError
+from api.model_loader import DTYPE, MODEL_CONFIGS, SCHEDULER_CLASS, model_manager, pipeline_modules
+from api.snapshots import load_snapshot, save_snapshot
+from api.tiny_pipeline import build_tiny_sdxl_pipeline
+
+
+# Anonymous (heap) memory of this process. Weights copied into fresh tensors
+# land here; mmapped snapshot weights are file-backed and do not.
+def _anonymous_bytes() -> int:
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Anonymous:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+# Hand freed heap back to the OS so the next load's copies show up as new memory
+def _release_heap():
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+# Read every weight once, so lazily mapped pages are faulted in and the
+# comparison includes the I/O a first generation would otherwise pay
+def _touch(pipeline) -> float:
+    total = 0.0
+    with torch.inference_mode():
+        for module in pipeline_modules(pipeline).values():
+            for tensor in module.parameters():
+                total += float(tensor.float().sum())
+    return total
+
+
+class Command(BaseCommand):
+    help = 'Compare from_pretrained loads with mmapped snapshot loads (tiny pipeline unless --model is given)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', type=str, default=None, help='Benchmark a configured model (needs its weights)')
+        parser.add_argument('--repeats', type=int, default=3)
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        diffusers_logging.disable_progress_bar()
+        with tempfile.TemporaryDirectory(prefix="bench-load-") as workdir:
+            if options['model']:
+                model_id = options['model']
+                if model_id not in MODEL_CONFIGS:
+                    raise CommandError(f"Unknown model: {model_id}")
+                pipeline_class = MODEL_CONFIGS[model_id]["pipeline_class"]
+                source = MODEL_CONFIGS[model_id]["repo_id"]
+                snapshot = model_manager.snapshot_path(model_id) or os.path.join(workdir, "snapshot")
+            else:
+                model_id = "tiny-sdxl"
+                pipeline = build_tiny_sdxl_pipeline(dtype=DTYPE)
+                pipeline_class = type(pipeline)
+                # Stands in for the hub cache: a regular diffusers checkout on disk
+                source = os.path.join(workdir, "pretrained")
+                pipeline.save_pretrained(source, safe_serialization=True)
+                snapshot = os.path.join(workdir, "snapshot")
+                del pipeline
+
+            def cold():
+                pipeline = pipeline_class.from_pretrained(
+                    source, torch_dtype=DTYPE, use_safetensors=True, token=model_manager.hf_token
+                )
+                pipeline.scheduler = SCHEDULER_CLASS.from_config(pipeline.scheduler.config)
+                return pipeline
+
+            if not os.path.exists(snapshot):
+                save_snapshot(cold(), snapshot, {"model_id": model_id})
+
+            results = {"model": model_id, "dtype": str(DTYPE), "repeats": options['repeats']}
+            for name, load in (("from_pretrained", cold), ("snapshot", lambda: load_snapshot(snapshot, pipeline_class))):
+                load_times, touch_times, anon = [], [], []
+                for _ in range(options['repeats']):
+                    _release_heap()
+                    anon_before = _anonymous_bytes()
+                    started = time.perf_counter()
+                    pipeline = load()
+                    loaded = time.perf_counter()
+                    _touch(pipeline)
+                    touch_times.append(time.perf_counter() - loaded)
+                    load_times.append(loaded - started)
+                    anon.append(_anonymous_bytes() - anon_before)
+                    del pipeline
+                results[name] = {
+                    "load_ms": round(statistics.median(load_times) * 1000, 2),
+                    "first_touch_ms": round(statistics.median(touch_times) * 1000, 2),
+                    "anonymous_mb": round(statistics.median(anon) / 2 ** 20, 2),
+                }
+
+        base, snap = results["from_pretrained"], results["snapshot"]
+        results["speedup"] = round(
+            (base["load_ms"] + base["first_touch_ms"]) / max(snap["load_ms"] + snap["first_touch_ms"], 1e-6), 2
+        )
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f"{'loader':>16} {'load ms':>10} {'touch ms':>10} {'anon MB':>10}")
+        for name in ("from_pretrained", "snapshot"):
+            r = results[name]
+            self.stdout.write(f"{name:>16} {r['load_ms']:>10.2f} {r['first_touch_ms']:>10.2f} {r['anonymous_mb']:>10.2f}")
+        self.stdout.write(f"Snapshot load + first touch is {results['speedup']}x faster")
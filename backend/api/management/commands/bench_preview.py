@@ -0,0 +1,87 @@
+import json
+import queue
+import statistics
+import time
+import torch
+from django.core.management.base import BaseCommand, CommandError
+from api.inference_local import _step_callback
+from api.previews import latents_to_data_url
+from api.streaming import step_listener
+from api.tiny_pipeline import build_tiny_sdxl_pipeline
+
+
+class Command(BaseCommand):
+    help = 'Measure the denoising-loop overhead of streamed progress and latent previews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=128, help='Square output resolution')
+        parser.add_argument('--steps', type=int, default=10)
+        parser.add_argument('--preview-interval', type=int, default=1, help='Preview every N steps (1 = worst case)')
+        parser.add_argument('--repeats', type=int, default=5)
+        parser.add_argument('--max-overhead', type=float, default=5.0, help='Fail above this overhead in percent')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        pipeline = build_tiny_sdxl_pipeline()
+        size, steps = options['size'], options['steps']
+
+        def run(callback):
+            kwargs = {"callback_on_step_end": callback} if callback is not None else {}
+            started = time.perf_counter()
+            with torch.inference_mode():
+                pipeline(
+                    prompt="benchmark",
+                    width=size,
+                    height=size,
+                    num_inference_steps=steps,
+                    guidance_scale=5.0,
+                    generator=torch.Generator().manual_seed(0),
+                    **kwargs,
+                )
+            return time.perf_counter() - started
+
+        def preview_callback(events):
+            listener = step_listener(events, options['preview_interval'])
+            return _step_callback([{"on_step": listener}])
+
+        run(None)  # warm-up
+        baseline, streamed = [], []
+        events = queue.Queue()
+        for _ in range(options['repeats']):
+            baseline.append(run(None))
+            streamed.append(run(preview_callback(events)))
+
+        previews = []
+        while not events.empty():
+            kind, payload = events.get()
+            if kind == "preview":
+                previews.append(payload[1])
+
+        conversion = []
+        for latents in previews[:20]:
+            started = time.perf_counter()
+            latents_to_data_url(latents)
+            conversion.append(time.perf_counter() - started)
+
+        base_ms = statistics.median(baseline) * 1000
+        stream_ms = statistics.median(streamed) * 1000
+        overhead = (stream_ms - base_ms) / base_ms * 100
+        results = {
+            "size": size,
+            "steps": steps,
+            "preview_interval": options['preview_interval'],
+            "baseline_ms": round(base_ms, 2),
+            "streamed_ms": round(stream_ms, 2),
+            "overhead_pct": round(overhead, 2),
+            "preview_convert_ms": round(statistics.median(conversion) * 1000, 3) if conversion else None,
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            for key, value in results.items():
+                self.stdout.write(f"  {key}: {value}")
+
+        if overhead > options['max_overhead']:
+            raise CommandError(f"Preview overhead {overhead:.2f}% exceeds {options['max_overhead']}%")
+        self.stdout.write(self.style.SUCCESS(f"Preview overhead {overhead:.2f}% within {options['max_overhead']}%"))
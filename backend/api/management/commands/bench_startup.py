@@ -0,0 +1,91 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter so nothing is already imported. Times are seconds
+# since the child started executing this script. Warm-up is left to the first
+# readiness probe so the liveness timing is not competing with the ML imports.
+CHILD = r"""
+import json, os, sys, time
+started = time.perf_counter()
+sys.path.insert(0, os.environ["BENCH_BASE_DIR"])
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+os.environ["WARMUP_ON_START"] = "False"
+
+from config.wsgi import application
+app_ready = time.perf_counter() - started
+
+from django.test import Client
+client = Client(HTTP_HOST="localhost")
+health = client.get("/api/health/")
+first_health = time.perf_counter() - started
+torch_at_health = "torch" in sys.modules
+
+ready_status = None
+while time.perf_counter() - started < float(os.environ["BENCH_READY_TIMEOUT"]):
+    ready_status = client.get("/api/ready/").status_code
+    if ready_status != 503:
+        break
+    time.sleep(0.05)
+first_ready = time.perf_counter() - started
+
+print(json.dumps({
+    "wsgi_import_s": app_ready,
+    "first_health_s": first_health,
+    "health_status": health.status_code,
+    "torch_imported_at_health": torch_at_health,
+    "first_ready_s": first_ready,
+    "ready_status": ready_status,
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Measure cold-start latency: app import, first liveness response and time to readiness'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeats', type=int, default=3)
+        parser.add_argument('--ready-timeout', type=float, default=120.0, help='Give up waiting for readiness after N seconds')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        env = dict(
+            os.environ,
+            BENCH_BASE_DIR=str(settings.BASE_DIR),
+            BENCH_READY_TIMEOUT=str(options['ready_timeout']),
+        )
+
+        runs = []
+        for _ in range(options['repeats']):
+            started = time.perf_counter()
+            proc = subprocess.run(
+                [sys.executable, "-c", CHILD], env=env, cwd=settings.BASE_DIR, capture_output=True, text=True
+            )
+            if proc.returncode != 0:
+                raise CommandError(f"Startup run failed:\n{proc.stderr[-2000:]}")
+            run = json.loads(proc.stdout.strip().splitlines()[-1])
+            run["process_s"] = time.perf_counter() - started
+            runs.append(run)
+
+        timings = ("wsgi_import_s", "first_health_s", "first_ready_s", "process_s")
+        results = {key: round(statistics.median(r[key] for r in runs), 3) for key in timings}
+        results.update({
+            "repeats": len(runs),
+            "health_status": runs[-1]["health_status"],
+            "ready_status": runs[-1]["ready_status"],
+            "torch_imported_at_health": any(r["torch_imported_at_health"] for r in runs),
+        })
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for key, value in results.items():
+            self.stdout.write(f"  {key}: {value}")
+        if results["torch_imported_at_health"]:
+            self.stdout.write(self.style.WARNING("torch was imported before the first liveness response"))
@@ -1,12 +1,14 @@
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 from api.model_loader import model_manager, MODEL_CONFIGS
+from api.startup import WarmUp
 import logging
 
 logger = logging.getLogger(__name__)
 
 
 class Command(BaseCommand):
-    help = 'Preload AI models into memory'
+    help = 'Download, load and warm AI models (the server does the same at startup from WARMUP_MODELS)'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -20,25 +22,62 @@ class Command(BaseCommand):
             action='store_true',
             help='Load all available models',
         )
+        parser.add_argument(
+            '--download-only',
+            action='store_true',
+            help='Only fetch weights into the local cache, so serving workers load from disk',
+        )
+        parser.add_argument(
+            '--resolutions',
+            nargs='+',
+            type=str,
+            help='Warm-up shapes as WxH (default: WARMUP_RESOLUTIONS, else each model\'s default size)',
+        )
+        parser.add_argument('--steps', type=int, default=settings.WARMUP_STEPS, help='Steps per warm-up pass')
+        parser.add_argument('--parallel', type=int, default=settings.WARMUP_PARALLELISM, help='Models loaded at once')
 
     def handle(self, *args, **options):
-        models_to_load = options.get('models', [])
+        models_to_load = options.get('models') or []
         load_all = options.get('all', False)
 
         if load_all:
             models_to_load = list(MODEL_CONFIGS.keys())
         elif not models_to_load:
-            models_to_load = ['stable-diffusion-v1-5']
+            models_to_load = settings.WARMUP_MODELS or [next(iter(MODEL_CONFIGS))]
+
+        unknown = [m for m in models_to_load if m not in MODEL_CONFIGS]
+        if unknown:
+            raise CommandError(f"Unknown model(s): {', '.join(unknown)}. Available: {', '.join(MODEL_CONFIGS)}")
+
+        if options['download_only']:
+            for model_id in models_to_load:
+                try:
+                    self.stdout.write(f"Downloading {model_id}...")
+                    path = model_manager.download_model(model_id)
+                    self.stdout.write(self.style.SUCCESS(f"Cached {model_id} at {path}"))
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f"Failed to download {model_id}: {str(e)}"))
+            return
+
+        try:
+            resolutions = [
+                tuple(int(v) for v in r.lower().split("x"))
+                for r in options['resolutions']
+            ] if options['resolutions'] else settings.WARMUP_RESOLUTIONS
+        except ValueError:
+            raise CommandError("Resolutions must look like 1024x1024")
 
-        self.stdout.write(f"Loading models: {', '.join(models_to_load)}")
+        self.stdout.write(f"Loading and warming models: {', '.join(models_to_load)}")
+        warmup = WarmUp(models_to_load, resolutions, options['steps'], options['parallel'])
+        states = warmup.warm_models(models_to_load)
 
-        for model_id in models_to_load:
-            try:
-                self.stdout.write(f"Loading {model_id}...")
-                model_manager.load_model(model_id)
-                self.stdout.write(self.style.SUCCESS(f"Successfully loaded {model_id}"))
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"Failed to load {model_id}: {str(e)}"))
+        for model_id, entry in states.items():
+            if entry["state"] == WarmUp.READY:
+                self.stdout.write(self.style.SUCCESS(f"{model_id}: ready in {entry['seconds']}s"))
+            elif entry["state"] == WarmUp.SKIPPED:
+                self.stdout.write(self.style.WARNING(f"{model_id}: skipped ({entry['error']})"))
+            else:
+                self.stdout.write(self.style.ERROR(f"{model_id}: {entry['state']} ({entry['error']})"))
 
-        loaded_models = model_manager.get_loaded_models()
+        loaded_models = [m["id"] for m in model_manager.get_loaded_models()]
         self.stdout.write(self.style.SUCCESS(f"\nCurrently loaded models: {', '.join(loaded_models)}"))
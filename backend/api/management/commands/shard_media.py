@@ -0,0 +1,52 @@
+import re
+from django.core.management.base import BaseCommand, CommandError
+from api import storage
+from api.derivatives import DERIVATIVE_SIZES, derivative_rel_path
+from api.models import GeneratedImage
+
+# Paths written before sharding: generated/<sha256>.<ext>
+FLAT_PATH = re.compile(r"^generated/(?P<digest>[0-9a-f]{64})\.(?P<ext>[a-z0-9]+)$")
+
+
+class Command(BaseCommand):
+    help = 'Move flat content-addressed media files (and their derivatives) into hash-sharded directories'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Records updated per query')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would move')
+
+    def handle(self, *args, **options):
+        if not isinstance(storage.backend, storage.LocalStorage):
+            raise CommandError("shard_media only applies to the local storage backend")
+
+        records = GeneratedImage.objects.filter(image__regex=FLAT_PATH.pattern).only("id", "image")
+        moved, updated, batch = set(), 0, []
+        for record in records.iterator(chunk_size=options['batch_size']):
+            match = FLAT_PATH.match(record.image.name)
+            old = record.image.name
+            new = storage.content_rel_path(match["digest"], match["ext"])
+
+            pairs = [(old, new)] + [
+                (derivative_rel_path(old, size), derivative_rel_path(new, size)) for size in DERIVATIVE_SIZES
+            ]
+            for source, target in pairs:
+                # Several records can point at the same content; it moves once
+                if source not in moved and storage.exists(source):
+                    if not options['dry_run']:
+                        storage.backend.write_file(target, storage.backend.path(source))
+                    moved.add(source)
+
+            record.image.name = new
+            batch.append(record)
+            if len(batch) >= options['batch_size']:
+                updated += self._save(batch, options['dry_run'])
+                batch = []
+        updated += self._save(batch, options['dry_run'])
+
+        verb = "Would move" if options['dry_run'] else "Moved"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(moved)} files and update {updated} records"))
+
+    def _save(self, batch, dry_run: bool) -> int:
+        if batch and not dry_run:
+            GeneratedImage.objects.bulk_update(batch, ["image"])
+        return len(batch)
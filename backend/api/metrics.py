@@ -0,0 +1,226 @@
+import bisect
+import contextvars
+import threading
+import time
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Iterable, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "dreamsketch_"
+
+# Generation requests run from milliseconds (cache hits) to minutes (large SDXL
+# runs on CPU), so the buckets span both ends
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = PREFIX + name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        self.name = PREFIX + name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (plus overflow), sum, count
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = [(key, list(s[0]), s[1], s[2]) for key, s in self._series.items()]
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+
+# Samples read from the owning component at scrape time, so nothing has to be
+# kept in sync on the hot path. metric_type is "counter" for components that
+# already keep monotonic totals (cache hits, coalesced requests).
+class GaugeFunc:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str],
+                 collect: Callable[[], Iterable[Tuple[tuple, float]]], metric_type: str = "gauge"):
+        self.name = PREFIX + name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self.metric_type = metric_type
+
+    def render(self) -> Iterable[str]:
+        try:
+            samples = list(self.collect())
+        except Exception as e:
+            logger.warning(f"Could not collect {self.name}: {str(e)}")
+            return
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} {self.metric_type}"
+        for key, value in samples:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, labelnames, collect, metric_type="gauge") -> GaugeFunc:
+        return self.register(GaugeFunc(name, help_text, labelnames, collect, metric_type))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by endpoint, method and status", ("endpoint", "method", "status")
+)
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by endpoint", ("endpoint", "method")
+)
+generations = registry.counter(
+    "generations_total", "Generation requests by model and outcome", ("model", "outcome")
+)
+generation_seconds = registry.histogram(
+    "generation_duration_seconds", "End-to-end generation latency by model and outcome", ("model", "outcome")
+)
+stage_seconds = registry.histogram(
+    "stage_duration_seconds", "Time spent per generation stage", ("stage", "model")
+)
+
+
+# Server-Timing: stages that ran for the current request, in the order they
+# first ran. Stages timed on worker threads are forwarded with add_server_timing.
+class ServerTiming:
+    def __init__(self):
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            self.entries[name] = self.entries.get(name, 0.0) + seconds
+
+    def header(self, total: float = None) -> str:
+        with self._lock:
+            entries = list(self.entries.items())
+        if total is not None:
+            entries.append(("total", total))
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in entries)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: round(seconds, 4) for name, seconds in self.entries.items()}
+
+
+_server_timing = contextvars.ContextVar("server_timing", default=None)
+
+
+@contextmanager
+def collect_server_timing():
+    timing = ServerTiming()
+    token = _server_timing.set(timing)
+    try:
+        yield timing
+    finally:
+        _server_timing.reset(token)
+
+
+def add_server_timing(stage: str, seconds: float):
+    timing = _server_timing.get()
+    if timing is not None:
+        timing.add(stage, seconds)
+
+
+# Stage timings collected so far in this context, e.g. to store with a result
+def server_timing_snapshot() -> dict:
+    timing = _server_timing.get()
+    return timing.snapshot() if timing is not None else {}
+
+
+def record_stage(stage: str, seconds: float, model_id: str = ""):
+    stage_seconds.observe(seconds, stage=stage, model=model_id)
+    add_server_timing(stage, seconds)
+
+
+@contextmanager
+def timed_stage(stage: str, model_id: str = ""):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started, model_id)
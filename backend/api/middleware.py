@@ -0,0 +1,73 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from whitenoise.middleware import WhiteNoiseMiddleware
+from .metrics import collect_server_timing, http_request_seconds, http_requests
+
+
+# Counts and times every request by its URL pattern (not the raw path, which
+# would make a series per image id) and adds a Server-Timing header listing the
+# generation stages that ran while handling it. Runs natively under both WSGI
+# and ASGI; a sync-only middleware would push every ASGI request onto a thread.
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with collect_server_timing() as timing:
+            response = self.get_response(request)
+        return self._finish(request, response, timing, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with collect_server_timing() as timing:
+            response = await self.get_response(request)
+        return self._finish(request, response, timing, started)
+
+    def _finish(self, request, response, timing, started: float):
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, "resolver_match", None)
+        endpoint = match.route if match is not None else "unmatched"
+        http_requests.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        http_request_seconds.observe(elapsed, endpoint=endpoint, method=request.method)
+
+        if timing.entries and not response.has_header("Server-Timing"):
+            response["Server-Timing"] = timing.header(total=elapsed)
+        return response
+
+
+# WhiteNoise's lookup is an in-memory dict (or a stat with autorefresh), so it
+# can run on the event loop; only non-static requests continue down the chain,
+# without the sync hop a sync-only middleware would add
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
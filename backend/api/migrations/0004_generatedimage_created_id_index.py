@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 15:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_generatedimage_cache_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='generatedimage',
+            index=models.Index(fields=['-created_at', '-id'], name='api_genimg_created_id_idx'),
+        ),
+    ]
@@ -1,5 +1,15 @@
 import os
+import gc
+import json
+import time
+import hashlib
+import itertools
+import threading
 import torch
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from django.conf import settings
 from diffusers import (
     StableDiffusionPipeline,
     StableDiffusionXLPipeline,
@@ -9,16 +19,31 @@ from diffusers import (
 from transformers import CLIPTokenizer, CLIPTextModel
 from typing import Optional, Dict
 import logging
+from .utils import format_bytes
+from .singleflight import SingleFlight
+from .embedding_cache import prompt_embedding_cache
+from .metrics import registry, timed_stage
+from . import snapshots
+from . import cpu_perf
 
 logger = logging.getLogger(__name__)
 
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 DTYPE = torch.float16 if torch.cuda.is_available() else torch.float32
+SCHEDULER_CLASS = DPMSolverMultistepScheduler
+
+if DEVICE == "cpu":
+    cpu_perf.configure_threads()
+
+# Parameters of an SDXL pipeline (UNet, both text encoders, VAE); with the
+# dtype, the memory a model is assumed to need before its first load measures it
+SDXL_PARAMETERS = 3_470_000_000
 
 MODEL_CONFIGS = {
     "sdxl-turbo": {
         "repo_id": "stabilityai/sdxl-turbo",
         "pipeline_class": StableDiffusionXLPipeline,
+        "parameters": SDXL_PARAMETERS,
         "default_size": 512,
         "description": "Ultra-fast SDXL model (1-4 steps)",
         "recommended_steps": 4,
@@ -26,6 +51,7 @@ MODEL_CONFIGS = {
     "sdxl-base-1.0": {
         "repo_id": "stabilityai/stable-diffusion-xl-base-1.0",
         "pipeline_class": StableDiffusionXLPipeline,
+        "parameters": SDXL_PARAMETERS,
         "default_size": 1024,
         "description": "Latest SDXL base model for high-quality images",
         "recommended_steps": 30,
@@ -33,6 +59,7 @@ MODEL_CONFIGS = {
     "playground-v2.5": {
         "repo_id": "playgroundai/playground-v2.5-1024px-aesthetic",
         "pipeline_class": StableDiffusionXLPipeline,
+        "parameters": SDXL_PARAMETERS,
         "default_size": 1024,
         "description": "Playground v2.5 - Superior aesthetic quality",
         "recommended_steps": 30,
@@ -40,6 +67,7 @@ MODEL_CONFIGS = {
     "realvisxl-v4": {
         "repo_id": "SG161222/RealVisXL_V4.0",
         "pipeline_class": StableDiffusionXLPipeline,
+        "parameters": SDXL_PARAMETERS,
         "default_size": 1024,
         "description": "Photorealistic SDXL model",
         "recommended_steps": 30,
@@ -47,6 +75,7 @@ MODEL_CONFIGS = {
     "juggernaut-xl-v9": {
         "repo_id": "RunDiffusion/Juggernaut-XL-v9",
         "pipeline_class": StableDiffusionXLPipeline,
+        "parameters": SDXL_PARAMETERS,
         "default_size": 1024,
         "description": "Versatile SDXL model for various styles",
         "recommended_steps": 30,
@@ -54,6 +83,7 @@ MODEL_CONFIGS = {
     "animagine-xl-3.1": {
         "repo_id": "cagliostrolab/animagine-xl-3.1",
         "pipeline_class": StableDiffusionXLPipeline,
+        "parameters": SDXL_PARAMETERS,
         "default_size": 1024,
         "description": "Anime-style SDXL model",
         "recommended_steps": 28,
@@ -61,9 +91,96 @@ MODEL_CONFIGS = {
 }
 
 
+def estimated_model_bytes(model_id: str) -> int:
+    parameters = MODEL_CONFIGS.get(model_id, {}).get("parameters", 0)
+    return parameters * (torch.finfo(DTYPE).bits // 8)
+
+
+def pipeline_modules(pipeline) -> Dict[str, torch.nn.Module]:
+    return {
+        name: component
+        for name, component in pipeline.components.items()
+        if isinstance(component, torch.nn.Module)
+    }
+
+
+def module_nbytes(module: torch.nn.Module) -> int:
+    total = 0
+    for tensor in itertools.chain(module.parameters(), module.buffers()):
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+# Measured size of every weight and buffer the pipeline holds
+def pipeline_nbytes(pipeline) -> int:
+    return sum(module_nbytes(module) for module in pipeline_modules(pipeline).values())
+
+
+# Components that SDXL checkpoints commonly ship unchanged. Identical ones are
+# held once and shared by every resident pipeline; the UNet never is.
+SHAREABLE_COMPONENTS = ("vae", "text_encoder", "text_encoder_2", "tokenizer", "tokenizer_2")
+
+# Config keys that differ between checkouts of the same weights
+_VOLATILE_CONFIG_KEYS = ("transformers_version", "torch_dtype", "dtype")
+
+
+def _config_dict(component) -> dict:
+    config = getattr(component, "config", None)
+    if config is None:
+        return {}
+    config = config.to_dict() if hasattr(config, "to_dict") else dict(config)
+    return {
+        key: value for key, value in config.items()
+        if not key.startswith("_") and key not in _VOLATILE_CONFIG_KEYS
+    }
+
+
+# Content hash of a component: class, config and every weight's name, dtype,
+# shape and bytes for modules; class and vocabulary for tokenizers. Equal
+# fingerprints mean the component can be swapped without changing any output.
+def component_fingerprint(component) -> str:
+    digest = hashlib.sha256(type(component).__name__.encode())
+    if isinstance(component, torch.nn.Module):
+        digest.update(json.dumps(_config_dict(component), sort_keys=True, default=str).encode())
+        for name, tensor in sorted(component.state_dict().items()):
+            digest.update(f"{name}|{tensor.dtype}|{tuple(tensor.shape)}".encode())
+            digest.update(tensor.detach().to("cpu").contiguous().reshape(-1).view(torch.uint8).numpy())
+    else:
+        digest.update(json.dumps([
+            sorted(component.get_vocab().items()),
+            sorted((" ".join(pair), rank) for pair, rank in getattr(component, "bpe_ranks", {}).items()),
+            getattr(component, "model_max_length", None),
+            str(getattr(component, "pad_token", None)),
+        ]).encode())
+    return digest.hexdigest()
+
+
+def pipeline_fingerprints(pipeline) -> Dict[str, str]:
+    return {
+        name: component_fingerprint(component)
+        for name, component in pipeline.components.items()
+        if name in SHAREABLE_COMPONENTS and component is not None
+    }
+
+
 class ModelManager:
     _instance = None
-    _loaded_models: Dict[str, any] = {}
+    _loaded_models: "OrderedDict[str, any]" = OrderedDict()
+    _model_sizes: Dict[str, int] = {}
+    # Per model: component name -> (accounting key, bytes). Shared components
+    # are keyed by fingerprint so resident memory counts them once.
+    _model_components: Dict[str, Dict[str, tuple]] = {}
+    # Fingerprint -> component instance held by at least one resident model
+    _shared_components: Dict[str, any] = {}
+    # Snapshot path -> fingerprints recorded with it; snapshots never change
+    _snapshot_fingerprints: Dict[str, Dict[str, str]] = {}
+    _last_used: Dict[str, float] = {}
+    _in_use: Dict[str, int] = {}
+    # Models being loaded -> bytes reserved for them, so concurrent loads of
+    # different models count against the budget before they finish
+    _loading: Dict[str, int] = {}
+    _lock = threading.RLock()
+    _loads = SingleFlight()
 
     def __new__(cls):
         if cls._instance is None:
@@ -72,32 +189,183 @@ class ModelManager:
 
     def __init__(self):
         self.hf_token = os.getenv("HF_TOKEN")
-        logger.info(f"ModelManager initialized. Device: {DEVICE}, Dtype: {DTYPE}")
+        self.memory_budget = settings.MODEL_MEMORY_BUDGET_BYTES
+        self.max_resident = settings.MODEL_MAX_RESIDENT
+        logger.info(
+            f"ModelManager initialized. Device: {DEVICE}, Dtype: {DTYPE}, "
+            f"budget: {self.memory_budget or 'unlimited'} bytes, max resident: {self.max_resident or 'unlimited'}"
+        )
 
     def load_model(self, model_id: str):
-        if model_id in self._loaded_models:
-            logger.info(f"Model {model_id} already loaded")
-            return self._loaded_models[model_id]
+        with self._lock:
+            if model_id in self._loaded_models:
+                self._touch(model_id)
+                logger.info(f"Model {model_id} already loaded")
+                return self._loaded_models[model_id]
 
         if model_id not in MODEL_CONFIGS:
             raise ValueError(f"Unknown model_id: {model_id}. Available: {list(MODEL_CONFIGS.keys())}")
 
-        config = MODEL_CONFIGS[model_id]
-        logger.info(f"Loading model {model_id} from {config['repo_id']}")
+        # One load per model at a time; concurrent callers wait for it and get
+        # the same pipeline or the same error. Other models are not blocked.
+        pipeline, shared = self._loads.do(model_id, lambda: self._load_and_register(model_id))
+        if shared:
+            logger.info(f"Model {model_id} loaded by a concurrent request")
+        return pipeline
+
+    def _load_and_register(self, model_id: str):
+        with self._lock:
+            if model_id in self._loaded_models:
+                self._touch(model_id)
+                return self._loaded_models[model_id]
+
+        # Make room up front for the measured size from an earlier load, or the
+        # estimate, and keep it reserved until the load is registered
+        with self._lock:
+            incoming_bytes = self._incoming_bytes_locked(model_id)
+        self._evict_to_fit(model_id, incoming_bytes=incoming_bytes)
 
         try:
-            pipeline_class = config["pipeline_class"]
+            with timed_stage("model_load", model_id):
+                pipeline, fingerprints = self._load_pipeline(model_id)
+            size = pipeline_nbytes(pipeline)
+        except BaseException:
+            with self._lock:
+                self._loading.pop(model_id, None)
+            raise
 
-            pipeline = pipeline_class.from_pretrained(
-                config["repo_id"],
-                torch_dtype=DTYPE,
-                use_safetensors=True,
-                token=self.hf_token,
-            )
+        with self._lock:
+            self._loading.pop(model_id, None)
+            reused = self._share_components_locked(pipeline, fingerprints)
+            self._model_components[model_id] = {
+                name: (fingerprints.get(name, f"{model_id}/{name}"), module_nbytes(module))
+                for name, module in pipeline_modules(pipeline).items()
+            }
+            # Tokenizers take part in sharing but not in byte accounting
+            for name, fingerprint in fingerprints.items():
+                self._model_components[model_id].setdefault(name, (fingerprint, 0))
+            self._loaded_models[model_id] = pipeline
+            self._model_sizes[model_id] = size
+            self._touch(model_id)
+            unique = self._unique_bytes_locked(model_id)
+        shared_note = f", sharing {', '.join(reused)}" if reused else ""
+        logger.info(
+            f"Model {model_id} loaded successfully ({format_bytes(size)}, {format_bytes(unique)} new{shared_note})"
+        )
+
+        self._evict_to_fit(model_id)
+        return pipeline
+
+    # Point the pipeline at already resident copies of its shareable components,
+    # and offer its own copies to later loads. The private duplicates are
+    # dropped with the last reference. Returns the names that were swapped.
+    def _share_components_locked(self, pipeline, fingerprints: Dict[str, str]) -> list:
+        reused = []
+        for name, fingerprint in fingerprints.items():
+            shared = self._shared_components.get(fingerprint)
+            if shared is None:
+                self._shared_components[fingerprint] = pipeline.components[name]
+            elif shared is not pipeline.components[name]:
+                setattr(pipeline, name, shared)
+                reused.append(name)
+        return reused
+
+    def _recorded_fingerprints(self, path: Optional[str]) -> Dict[str, str]:
+        if not path:
+            return {}
+        recorded = self._snapshot_fingerprints.get(path)
+        if recorded is None:
+            recorded = (snapshots.snapshot_metadata(path) or {}).get("fingerprints") or {}
+            if recorded:
+                self._snapshot_fingerprints[path] = recorded
+        return recorded
 
-            pipeline.scheduler = DPMSolverMultistepScheduler.from_config(
-                pipeline.scheduler.config
+    # Fingerprints recorded with the snapshot when there is one; hashing the
+    # weights otherwise (text encoders and VAE only). Called before the
+    # pipeline moves to DEVICE, so hashing never copies weights back off the GPU.
+    def _fingerprints(self, model_id: str, pipeline) -> Dict[str, str]:
+        recorded = self._recorded_fingerprints(self.snapshot_path(model_id))
+        if recorded:
+            return {
+                name: fingerprint for name, fingerprint in recorded.items()
+                if pipeline.components.get(name) is not None
+            }
+        return pipeline_fingerprints(pipeline)
+
+    # Resident instances the snapshot loader can reuse instead of mapping
+    # another copy of the same weights
+    def _resident_components(self, path: str) -> Dict[str, any]:
+        recorded = self._recorded_fingerprints(path)
+        with self._lock:
+            return {
+                name: self._shared_components[fingerprint]
+                for name, fingerprint in recorded.items()
+                if fingerprint in self._shared_components
+            }
+
+    def snapshot_path(self, model_id: str) -> Optional[str]:
+        if not settings.MODEL_SNAPSHOT_DIR:
+            return None
+        return snapshots.snapshot_path(settings.MODEL_SNAPSHOT_DIR, model_id, DTYPE, SCHEDULER_CLASS.__name__)
+
+    # Prepared snapshot (converted scheduler, target dtype) mapped from local
+    # disk; None when there is none yet or it cannot be read
+    def _load_snapshot(self, model_id: str):
+        path = self.snapshot_path(model_id)
+        if path is None or not snapshots.is_complete(path):
+            return None
+        try:
+            pipeline = snapshots.load_snapshot(
+                path, MODEL_CONFIGS[model_id]["pipeline_class"], self._resident_components(path)
             )
+            logger.info(f"Mapped model {model_id} from snapshot {path}")
+            return pipeline
+        except Exception as e:
+            logger.warning(f"Could not load snapshot {path}, falling back to from_pretrained: {e}")
+            return None
+
+    def _save_snapshot(self, model_id: str, pipeline, fingerprints: Dict[str, str]):
+        path = self.snapshot_path(model_id)
+        if path is None or snapshots.is_complete(path):
+            return
+        try:
+            os.makedirs(settings.MODEL_SNAPSHOT_DIR, exist_ok=True)
+            snapshots.save_snapshot(pipeline, path, {
+                "model_id": model_id,
+                "repo_id": MODEL_CONFIGS[model_id]["repo_id"],
+                "dtype": str(DTYPE),
+                "scheduler": SCHEDULER_CLASS.__name__,
+                "fingerprints": fingerprints,
+            })
+            self._snapshot_fingerprints[path] = fingerprints
+            logger.info(f"Wrote snapshot of {model_id} to {path}")
+        except Exception as e:
+            logger.warning(f"Could not write snapshot of {model_id}: {e}")
+
+    # Returns the pipeline on DEVICE and its component fingerprints
+    def _load_pipeline(self, model_id: str):
+        config = MODEL_CONFIGS[model_id]
+
+        try:
+            pipeline = self._load_snapshot(model_id)
+            if pipeline is not None:
+                fingerprints = self._fingerprints(model_id, pipeline)
+            else:
+                logger.info(f"Loading model {model_id} from {config['repo_id']}")
+                pipeline_class = config["pipeline_class"]
+
+                pipeline = pipeline_class.from_pretrained(
+                    config["repo_id"],
+                    torch_dtype=DTYPE,
+                    use_safetensors=True,
+                    token=self.hf_token,
+                )
+
+                pipeline.scheduler = SCHEDULER_CLASS.from_config(
+                    pipeline.scheduler.config
+                )
+                fingerprints = self._fingerprints(model_id, pipeline)
+                self._save_snapshot(model_id, pipeline, fingerprints)
 
             pipeline = pipeline.to(DEVICE)
 
@@ -107,24 +375,181 @@ class ModelManager:
                     pipeline.enable_vae_slicing()
                 except Exception as e:
                     logger.warning(f"Could not enable memory optimizations: {e}")
+            else:
+                cpu_perf.optimize_pipeline(pipeline)
 
-            self._loaded_models[model_id] = pipeline
-            logger.info(f"Model {model_id} loaded successfully")
-            return pipeline
+            return pipeline, fingerprints
 
         except Exception as e:
             logger.error(f"Failed to load model {model_id}: {str(e)}")
             raise
 
-    def unload_model(self, model_id: str):
+    # Fetch weights into the local Hugging Face cache without loading them, so
+    # later loads (in any process on this host) only read from disk
+    def download_model(self, model_id: str) -> str:
+        if model_id not in MODEL_CONFIGS:
+            raise ValueError(f"Unknown model_id: {model_id}. Available: {list(MODEL_CONFIGS.keys())}")
+        config = MODEL_CONFIGS[model_id]
+        return config["pipeline_class"].download(config["repo_id"], use_safetensors=True, token=self.hf_token)
+
+    def is_loaded(self, model_id: str) -> bool:
+        with self._lock:
+            return model_id in self._loaded_models
+
+    # Whether loading model_id would stay within the residency limits without
+    # evicting anything. Before the first load the size is the estimate.
+    def has_room_for(self, model_id: str) -> bool:
+        with self._lock:
+            if model_id in self._loaded_models:
+                return True
+            return not self._over_budget(1, self._incoming_bytes_locked(model_id))
+
+    # Load (if needed) and pin a model so it cannot be evicted until the
+    # matching release(); use_model() pairs them for a block
+    def acquire(self, model_id: str):
+        with self._lock:
+            self._in_use[model_id] = self._in_use.get(model_id, 0) + 1
+        try:
+            return self.load_model(model_id)
+        except BaseException:
+            self.release(model_id)
+            raise
+
+    def release(self, model_id: str):
+        with self._lock:
+            self._in_use[model_id] -= 1
+            if self._in_use[model_id] <= 0:
+                del self._in_use[model_id]
+            self._touch(model_id)
+
+    @contextmanager
+    def use_model(self, model_id: str):
+        pipeline = self.acquire(model_id)
+        try:
+            yield pipeline
+        finally:
+            self.release(model_id)
+
+    # The resident pipeline of a model the caller has pinned; never loads
+    def resident_pipeline(self, model_id: str):
+        with self._lock:
+            pipeline = self._loaded_models.get(model_id)
+            if pipeline is None or not self._in_use.get(model_id):
+                raise RuntimeError(f"Model {model_id} is not loaded and pinned")
+            return pipeline
+
+    def _touch(self, model_id: str):
         if model_id in self._loaded_models:
-            del self._loaded_models[model_id]
-            if DEVICE == "cuda":
-                torch.cuda.empty_cache()
-            logger.info(f"Model {model_id} unloaded")
+            self._loaded_models.move_to_end(model_id)
+            self._last_used[model_id] = time.time()
+
+    # Accounting key -> bytes for every component held by resident models,
+    # optionally leaving one model out
+    def _resident_components_locked(self, exclude: str = None) -> Dict[str, int]:
+        resident = {}
+        for m in self._loaded_models:
+            if m != exclude:
+                resident.update(self._model_components.get(m, {}).values())
+        return resident
+
+    def _resident_bytes_locked(self) -> int:
+        return sum(self._resident_components_locked().values())
+
+    # Bytes that only this model holds: what unloading it would free
+    def _unique_bytes_locked(self, model_id: str) -> int:
+        others = self._resident_components_locked(exclude=model_id)
+        return sum(
+            nbytes for key, nbytes in self._model_components.get(model_id, {}).values() if key not in others
+        )
+
+    # What loading model_id would add, given the components already resident.
+    # Before its first load this is the estimate from its parameter count,
+    # which does not know about components it could share.
+    def _incoming_bytes_locked(self, model_id: str) -> int:
+        if model_id not in self._model_components:
+            return self._model_sizes.get(model_id) or estimated_model_bytes(model_id)
+        return self._unique_bytes_locked(model_id)
+
+    # Loads in progress count as resident, with their reserved bytes
+    def _over_budget(self, extra_models: int, extra_bytes: int) -> bool:
+        if self.max_resident and len(self._loaded_models) + len(self._loading) + extra_models > self.max_resident:
+            return True
+        if self.memory_budget:
+            resident = self._resident_bytes_locked() + sum(self._loading.values())
+            if resident + extra_bytes > self.memory_budget:
+                return True
+        return False
+
+    # Evict least recently used, unpinned models until the budget holds. With
+    # incoming_bytes the check also makes room for a model about to load, and
+    # reserves those bytes for it (released once the load is registered).
+    def _evict_to_fit(self, keep_id: str, incoming_bytes: int = None):
+        loading = incoming_bytes is not None
+        extra_models = 1 if loading else 0
+        extra_bytes = incoming_bytes or 0
+
+        with self._lock:
+            try:
+                while self._over_budget(extra_models, extra_bytes):
+                    victim = next(
+                        (m for m in self._loaded_models if m != keep_id and not self._in_use.get(m)),
+                        None,
+                    )
+                    if victim is None:
+                        logger.warning(
+                            f"Model memory budget exceeded but every other resident model is in use; "
+                            f"keeping {list(self._loaded_models.keys())}"
+                        )
+                        return
+                    self._unload_locked(victim)
+            finally:
+                if loading:
+                    self._loading[keep_id] = extra_bytes
+
+    def _unload_locked(self, model_id: str):
+        freed = self._unique_bytes_locked(model_id)
+        del self._loaded_models[model_id]
+        self._last_used.pop(model_id, None)
+        # Shared components stay registered while another resident model holds them
+        resident = self._resident_components_locked()
+        for fingerprint in list(self._shared_components):
+            if fingerprint not in resident:
+                del self._shared_components[fingerprint]
+        prompt_embedding_cache.drop_model(model_id)
+        gc.collect()
+        if DEVICE == "cuda":
+            torch.cuda.empty_cache()
+        logger.info(f"Model {model_id} unloaded ({format_bytes(freed)} freed)")
+
+    def unload_model(self, model_id: str):
+        with self._lock:
+            if model_id not in self._loaded_models:
+                return
+            if self._in_use.get(model_id):
+                logger.warning(f"Model {model_id} is in use and cannot be unloaded")
+                return
+            self._unload_locked(model_id)
 
     def get_loaded_models(self):
-        return list(self._loaded_models.keys())
+        with self._lock:
+            loaded = []
+            for model_id in self._loaded_models:
+                others = self._resident_components_locked(exclude=model_id)
+                components = self._model_components.get(model_id, {})
+                loaded.append({
+                    "id": model_id,
+                    "size_bytes": self._model_sizes.get(model_id, 0),
+                    "unique_bytes": sum(nbytes for key, nbytes in components.values() if key not in others),
+                    "shared_components": sorted(name for name, (key, _) in components.items() if key in others),
+                    "last_used": datetime.fromtimestamp(self._last_used[model_id], tz=timezone.utc).isoformat(),
+                    "in_use": self._in_use.get(model_id, 0),
+                })
+            return loaded
+
+    # Shared components counted once
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return self._resident_bytes_locked()
 
     def get_available_models(self):
         return [
@@ -140,3 +565,16 @@ class ModelManager:
 
 
 model_manager = ModelManager()
+
+registry.gauge(
+    "model_resident_bytes", "Memory held by each loaded model", ("model",),
+    lambda: [((m["id"],), m["size_bytes"]) for m in model_manager.get_loaded_models()],
+)
+registry.gauge(
+    "models_resident_bytes", "Memory held by all loaded models, shared components counted once", (),
+    lambda: [((), model_manager.resident_bytes())],
+)
+registry.gauge(
+    "model_in_use", "Generations currently pinning each loaded model", ("model",),
+    lambda: [((m["id"],), m["in_use"]) for m in model_manager.get_loaded_models()],
+)
@@ -1,9 +1,61 @@
+import uuid
 from django.db import models
 
 class GeneratedImage(models.Model):
     prompt = models.TextField()
     image = models.ImageField(upload_to='generated/')
     created_at = models.DateTimeField(auto_now_add=True)
+    cache_key = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    # Generation metadata for analytics; empty on rows written before it existed
+    model_id = models.CharField(max_length=64, blank=True, default="")
+    params = models.JSONField(default=dict, blank=True)
+    seed = models.BigIntegerField(null=True, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    byte_size = models.PositiveIntegerField(null=True, blank=True)
+    # Seconds per stage (queue, text_encode, denoise, decode, encode, ...)
+    timings = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            # Backs keyset pagination of the result history (newest first)
+            models.Index(fields=["-created_at", "-id"], name="api_genimg_created_id_idx"),
+            # Per-model history and analytics over time
+            models.Index(fields=["model_id", "-created_at"], name="api_genimg_model_created_idx"),
+            # Looking up earlier generations of a seed
+            models.Index(fields=["seed"], name="api_genimg_seed_idx"),
+        ]
 
     def __str__(self):
         return f"Image {self.id} - {self.prompt[:30]}"
+
+
+class GenerationJob(models.Model):
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=16, default="txt2img")
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    result = models.ForeignKey(GeneratedImage, null=True, blank=True, on_delete=models.SET_NULL)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} ({self.status})"
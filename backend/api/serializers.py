@@ -1,4 +1,6 @@
+from django.conf import settings
 from rest_framework import serializers
+from .encoding import DEFAULT_OUTPUT_FORMAT, OUTPUT_FORMATS
 
 class GenerateImageSerializer(serializers.Serializer):
     prompt = serializers.CharField(allow_blank=False, max_length=2000)
@@ -9,12 +11,77 @@ class GenerateImageSerializer(serializers.Serializer):
     width = serializers.IntegerField(required=False, default=512, min_value=64, max_value=2048)
     height = serializers.IntegerField(required=False, default=512, min_value=64, max_value=2048)
     seed = serializers.IntegerField(required=False, allow_null=True, default=None)
+    mode = serializers.ChoiceField(required=False, choices=["sync", "job"], default="sync")
+    output_format = serializers.ChoiceField(required=False, choices=list(OUTPUT_FORMATS), default=DEFAULT_OUTPUT_FORMAT)
+    quality = serializers.IntegerField(required=False, allow_null=True, default=None, min_value=1, max_value=100)
+
+class Img2ImgSerializer(GenerateImageSerializer):
+    # Either a multipart file upload or the id of an earlier result
+    init_image = serializers.FileField(required=False, allow_empty_file=False)
+    init_image_id = serializers.IntegerField(required=False, min_value=1)
+    strength = serializers.FloatField(required=False, default=0.75, min_value=0.0, max_value=1.0)
+
+    def validate(self, data):
+        if ("init_image" in data) == ("init_image_id" in data):
+            raise serializers.ValidationError("Provide exactly one of init_image or init_image_id")
+        # img2img runs int(steps * strength) denoising steps
+        if int(data["steps"] * data["strength"]) < 1:
+            raise serializers.ValidationError("steps * strength must be at least 1")
+        return data
+
+# Either prompts (one image each) or one prompt with seeds or num_images. Seeds
+# default to seed + index when a base seed is given, else random per item.
+class BatchGenerateSerializer(GenerateImageSerializer):
+    prompt = serializers.CharField(required=False, allow_blank=False, max_length=2000)
+    prompts = serializers.ListField(
+        child=serializers.CharField(allow_blank=False, max_length=2000), required=False, min_length=1,
+        max_length=settings.GENERATION_BATCH_REQUEST_MAX_ITEMS,
+    )
+    seeds = serializers.ListField(
+        child=serializers.IntegerField(), required=False, min_length=1,
+        max_length=settings.GENERATION_BATCH_REQUEST_MAX_ITEMS,
+    )
+    num_images = serializers.IntegerField(
+        required=False, min_value=1, max_value=settings.GENERATION_BATCH_REQUEST_MAX_ITEMS
+    )
+    mode = None
+
+    def validate(self, data):
+        prompts, seeds = data.get("prompts"), data.get("seeds")
+        # Checked before prompt is expanded into a list of that many items
+        count = len(prompts) if prompts is not None else (len(seeds) if seeds else data.get("num_images", 1))
+        if count > settings.GENERATION_BATCH_REQUEST_MAX_ITEMS:
+            raise serializers.ValidationError(
+                f"At most {settings.GENERATION_BATCH_REQUEST_MAX_ITEMS} images per batch request"
+            )
+
+        if prompts is None:
+            if not data.get("prompt"):
+                raise serializers.ValidationError("Provide prompts, or prompt with seeds or num_images")
+            prompts = [data["prompt"]] * count
+        elif data.get("prompt"):
+            raise serializers.ValidationError("Provide either prompt or prompts, not both")
+
+        if seeds is None:
+            base = data.get("seed")
+            seeds = [base + i if base is not None else None for i in range(len(prompts))]
+        if len(seeds) != len(prompts):
+            raise serializers.ValidationError("seeds must have one entry per prompt")
+        data["prompts"], data["seeds"] = prompts, seeds
+        return data
+
+class GenerateStreamSerializer(GenerateImageSerializer):
+    preview_interval = serializers.IntegerField(required=False, allow_null=True, default=None, min_value=0, max_value=150)
 
 class GeneratedImageSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     url = serializers.CharField()
     prompt = serializers.CharField()
     created_at = serializers.DateTimeField()
+    model_id = serializers.CharField()
+    seed = serializers.IntegerField(allow_null=True)
+    width = serializers.IntegerField(allow_null=True)
+    height = serializers.IntegerField(allow_null=True)
 
 class ModelInfoSerializer(serializers.Serializer):
     id = serializers.CharField()
@@ -0,0 +1,186 @@
+import os
+import json
+import mmap
+import shutil
+import struct
+import inspect
+import logging
+import warnings
+import importlib
+from datetime import datetime, timezone
+from typing import Dict, Optional
+import torch
+from accelerate import init_empty_weights
+
+logger = logging.getLogger(__name__)
+
+# Bump when the on-disk layout changes so stale snapshots are rebuilt
+SNAPSHOT_FORMAT = 1
+MARKER = "snapshot.json"
+
+_SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+_WEIGHT_FILES = {
+    "diffusers": "diffusion_pytorch_model.safetensors",
+    "transformers": "model.safetensors",
+}
+
+
+def snapshot_path(root: str, model_id: str, dtype: torch.dtype, scheduler_name: str) -> str:
+    dtype_name = str(dtype).replace("torch.", "")
+    return os.path.join(root, f"{model_id}--{dtype_name}--{scheduler_name}")
+
+
+def is_complete(path: str) -> bool:
+    marker = os.path.join(path, MARKER)
+    if not os.path.exists(marker):
+        return False
+    try:
+        with open(marker) as f:
+            return json.load(f).get("format") == SNAPSHOT_FORMAT
+    except (OSError, ValueError):
+        return False
+
+
+# Writes the prepared pipeline (converted scheduler, target dtype) as
+# safetensors. The directory is filled under a temporary name and renamed into
+# place with the marker already inside, so a snapshot is either whole or absent.
+def save_snapshot(pipeline, path: str, metadata: dict = None) -> str:
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    try:
+        pipeline.save_pretrained(tmp_path, safe_serialization=True)
+        with open(os.path.join(tmp_path, MARKER), "w") as f:
+            json.dump(dict(
+                metadata or {},
+                format=SNAPSHOT_FORMAT,
+                created_at=datetime.now(timezone.utc).isoformat(),
+            ), f, indent=2)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            # Another process published the same snapshot first
+            if not is_complete(path):
+                raise
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return path
+
+
+# Tensors that view a private (copy-on-write) mapping of the file. Pages come
+# from the shared page cache, so every worker on the host that maps the same
+# snapshot shares one physical copy until a tensor is written to.
+def mmap_safetensors(filename: str) -> Dict[str, torch.Tensor]:
+    with open(filename, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    header_len = struct.unpack("<Q", mapped[:8])[0]
+    header = json.loads(mapped[8:8 + header_len])
+    data_start = 8 + header_len
+
+    tensors = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        for name, info in header.items():
+            if name == "__metadata__":
+                continue
+            dtype = _SAFETENSORS_DTYPES[info["dtype"]]
+            start, end = info["data_offsets"]
+            itemsize = torch.empty((), dtype=dtype).element_size()
+            count = (end - start) // itemsize
+            if count == 0:
+                tensors[name] = torch.empty(info["shape"], dtype=dtype)
+                continue
+            tensors[name] = torch.frombuffer(
+                mapped, dtype=dtype, count=count, offset=data_start + start
+            ).view(info["shape"])
+    return tensors
+
+
+def _component_weights(directory: str, library: str) -> Dict[str, torch.Tensor]:
+    single = os.path.join(directory, _WEIGHT_FILES[library])
+    if os.path.exists(single):
+        return mmap_safetensors(single)
+
+    index_file = f"{single}.index.json"
+    with open(index_file) as f:
+        shards = sorted(set(json.load(f)["weight_map"].values()))
+    tensors = {}
+    for shard in shards:
+        tensors.update(mmap_safetensors(os.path.join(directory, shard)))
+    return tensors
+
+
+def _load_module(directory: str, library: str, cls):
+    # Build the module without allocating weights, then point its parameters at
+    # the mapped tensors instead of copying them in
+    if library == "diffusers":
+        config = cls.load_config(directory)
+        with init_empty_weights():
+            module = cls.from_config(config)
+    else:
+        config = cls.config_class.from_pretrained(directory)
+        with init_empty_weights():
+            module = cls._from_config(config)
+
+    module.load_state_dict(_component_weights(directory, library), strict=True, assign=True)
+    if hasattr(module, "tie_weights"):
+        module.tie_weights()
+    module.eval()
+    return module
+
+
+# Rebuilds the pipeline from a snapshot without touching the network: small
+# components (tokenizers, scheduler) through from_pretrained, weights mmapped.
+# Entries in components are used as they are instead of being read from disk.
+def load_snapshot(path: str, pipeline_class, components: Dict[str, object] = None):
+    with open(os.path.join(path, "model_index.json")) as f:
+        index = json.load(f)
+
+    accepted = inspect.signature(pipeline_class.__init__).parameters
+    kwargs = {}
+    for name, value in index.items():
+        if name.startswith("_") or name not in accepted:
+            continue
+        if components and name in components:
+            kwargs[name] = components[name]
+            continue
+        if not isinstance(value, list):
+            # Plain pipeline options such as force_zeros_for_empty_prompt
+            kwargs[name] = value
+            continue
+
+        library, class_name = value
+        if library is None:
+            kwargs[name] = None
+            continue
+
+        cls = getattr(importlib.import_module(library), class_name)
+        directory = os.path.join(path, name)
+        if isinstance(cls, type) and issubclass(cls, torch.nn.Module):
+            kwargs[name] = _load_module(directory, library, cls)
+        else:
+            kwargs[name] = cls.from_pretrained(directory)
+
+    pipeline = pipeline_class(**kwargs)
+    pipeline.set_progress_bar_config(disable=True)
+    return pipeline
+
+
+def snapshot_metadata(path: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(path, MARKER)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,175 @@
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from . import inference
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+# Background warm-up started by the WSGI/ASGI entry points. The process answers
+# liveness probes immediately; readiness only reports success once the inference
+# backend has been imported and every configured model has been loaded and run
+# once at each warm-up resolution (or has failed / been skipped), so traffic is
+# not routed to a cold worker. If some configured models failed to warm the
+# process is degraded (still ready, the rest can serve); if all of them failed
+# it is failed and never ready.
+class WarmUp:
+    PENDING = "pending"
+    RUNNING = "running"
+    READY = "ready"
+    DEGRADED = "degraded"
+    FAILED = "failed"
+
+    # Per-model states
+    LOADING = "loading"
+    WARMING = "warming"
+    SKIPPED = "skipped"
+
+    def __init__(self, models, resolutions, steps: int, parallelism: int):
+        self.models = list(dict.fromkeys(models))
+        self.resolutions = list(resolutions)
+        self.steps = max(1, steps)
+        self.parallelism = max(1, parallelism)
+        self.state = self.PENDING
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.state != self.PENDING:
+                return
+            self.state = self.RUNNING
+            self.started_at = time.time()
+        threading.Thread(target=self._run, name="warm-up", daemon=True).start()
+
+    def _run(self):
+        started = time.perf_counter()
+        backend = inference.get_backend()
+        if backend is not None and backend.mode == "local" and self.models:
+            self.warm_models(self.models)
+
+        with self._lock:
+            self.finished_at = time.time()
+            failed = [model_id for model_id, entry in self._models.items() if entry["state"] == self.FAILED]
+            warmed = any(entry["state"] == self.READY for entry in self._models.values())
+            if backend is None:
+                self.state = self.FAILED
+                self.error = inference.backend_state()["error"]
+            elif failed:
+                self.state = self.DEGRADED if warmed else self.FAILED
+                self.error = f"warm-up failed for {', '.join(failed)}"
+            else:
+                self.state = self.READY
+        logger.info(f"Warm-up finished in {time.perf_counter() - started:.2f}s ({self.state})")
+
+    # Load and warm models concurrently, as far as the residency limits allow.
+    # Blocks until every model has settled; also used by preload_models.
+    def warm_models(self, models) -> dict:
+        from .model_loader import model_manager
+
+        models = list(dict.fromkeys(models))
+        for model_id in models:
+            self._set_model(model_id, self.PENDING)
+
+        # Never warm more models than may be resident at once: the later ones
+        # would only evict the earlier ones
+        if model_manager.max_resident and len(models) > model_manager.max_resident:
+            for model_id in models[model_manager.max_resident:]:
+                self._set_model(model_id, self.SKIPPED, error="exceeds MODEL_MAX_RESIDENT")
+            models = models[:model_manager.max_resident]
+
+        with ThreadPoolExecutor(max_workers=min(self.parallelism, len(models) or 1), thread_name_prefix="warm-up") as pool:
+            list(pool.map(self._warm_model, models))
+        return self.model_states()
+
+    def _warm_model(self, model_id: str):
+        from .model_loader import model_manager, MODEL_CONFIGS
+        from .inference_local import warm_up_model
+
+        if model_id not in MODEL_CONFIGS:
+            self._set_model(model_id, self.FAILED, error="unknown model_id")
+            return
+        if not model_manager.has_room_for(model_id):
+            self._set_model(model_id, self.SKIPPED, error="model memory budget exhausted")
+            return
+
+        started = time.perf_counter()
+        resolutions = self.resolutions or [(MODEL_CONFIGS[model_id]["default_size"],) * 2]
+        try:
+            self._set_model(model_id, self.LOADING)
+            with model_manager.use_model(model_id):
+                self._set_model(model_id, self.WARMING)
+                warm_up_model(model_id, resolutions, self.steps)
+            self._set_model(model_id, self.READY, seconds=time.perf_counter() - started)
+        except Exception as e:
+            logger.error(f"Warm-up of {model_id} failed: {str(e)}")
+            self._set_model(model_id, self.FAILED, seconds=time.perf_counter() - started, error=str(e))
+
+    def _set_model(self, model_id: str, state: str, seconds: float = None, error: str = None):
+        with self._lock:
+            self._models[model_id] = {
+                "state": state,
+                "seconds": round(seconds, 3) if seconds is not None else None,
+                "error": error,
+            }
+
+    def model_states(self) -> dict:
+        with self._lock:
+            return {model_id: dict(entry) for model_id, entry in self._models.items()}
+
+    # Warm means the weights are resident now: warmed at startup, or loaded
+    # later by a request. Never imports the ML stack itself.
+    def is_model_warm(self, model_id: str) -> bool:
+        with self._lock:
+            if self._models.get(model_id, {}).get("state") == self.READY:
+                return True
+        if not inference.backend_resolved() or not inference.USE_LOCAL_MODELS:
+            return False
+        from .model_loader import model_manager
+        return model_manager.is_loaded(model_id)
+
+    @property
+    def ready(self) -> bool:
+        return self.state in (self.READY, self.DEGRADED)
+
+    def stats(self) -> dict:
+        with self._lock:
+            elapsed = None
+            if self.started_at is not None:
+                elapsed = round((self.finished_at or time.time()) - self.started_at, 3)
+            return {
+                "state": self.state,
+                "seconds": elapsed,
+                "error": self.error,
+                "models": {model_id: dict(entry) for model_id, entry in self._models.items()},
+            }
+
+
+warmup = WarmUp(
+    models=settings.WARMUP_MODELS,
+    resolutions=settings.WARMUP_RESOLUTIONS,
+    steps=settings.WARMUP_STEPS,
+    parallelism=settings.WARMUP_PARALLELISM,
+)
+
+
+registry.gauge(
+    "model_warm", "1 once a configured model has been loaded and warmed", ("model", "state"),
+    lambda: [((model_id, entry["state"]), 1 if entry["state"] == WarmUp.READY else 0)
+             for model_id, entry in warmup.model_states().items()],
+)
+
+
+def start_background_services():
+    from .jobs import job_queue
+
+    # Drain jobs left queued by a previous run without waiting for a new submission
+    job_queue.start()
+    if settings.WARMUP_ON_START:
+        warmup.start()
@@ -0,0 +1,375 @@
+import io
+import os
+import time
+import hashlib
+import tempfile
+import mimetypes
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Callable, Iterable, NamedTuple, Optional, Tuple
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+# An image already written to storage, returned instead of raw bytes by
+# backends that stream their output straight to disk
+class StoredImage(NamedTuple):
+    rel_path: str
+    size: int
+    # (width, height) from the image header; None if it could not be read
+    dimensions: Optional[Tuple[int, int]] = None
+
+
+# Content-addressed layout: the file name is the digest of the bytes, so
+# identical images are stored once and different images never collide. Two
+# levels of directories from the digest keep any one directory small
+# (generated/ab/cd/abcd....png).
+def content_rel_path(digest: str, ext: str, directory: str = "generated") -> str:
+    return f"{directory}/{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+# mkstemp creates files 0600; published files get the mode a plain open()
+# would give them so a web server running as another user can read them
+def _default_file_mode() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+FILE_MODE = _default_file_mode()
+
+
+# Files under MEDIA_ROOT. Writes go to a temp file in the target directory and
+# are renamed into place, so readers never see a partially written file.
+class LocalStorage:
+    name = "local"
+
+    def __init__(self, root: str = None):
+        self._root = root
+
+    @property
+    def root(self) -> str:
+        return str(self._root or settings.MEDIA_ROOT)
+
+    def path(self, rel_path: str) -> str:
+        return os.path.join(self.root, rel_path)
+
+    def exists(self, rel_path: str) -> bool:
+        return os.path.exists(self.path(rel_path))
+
+    def open(self, rel_path: str) -> BinaryIO:
+        return open(self.path(rel_path), "rb")
+
+    def write(self, rel_path: str, data: bytes):
+        filepath = self.path(rel_path)
+        directory = os.path.dirname(filepath)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                os.fchmod(f.fileno(), FILE_MODE)
+            os.replace(tmp_path, filepath)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    # Moves a finished temp file (from staging_dir) into place
+    def write_file(self, rel_path: str, local_path: str):
+        filepath = self.path(rel_path)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        os.chmod(local_path, FILE_MODE)
+        os.replace(local_path, filepath)
+
+    # Temp files for streamed writes live on the same filesystem, so
+    # write_file is a rename
+    def staging_dir(self) -> Optional[str]:
+        directory = os.path.join(self.root, ".incoming")
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def delete(self, rel_path: str):
+        try:
+            os.remove(self.path(rel_path))
+        except FileNotFoundError:
+            pass
+
+    # Served from MEDIA_URL by the web server
+    def url(self, rel_path: str) -> Optional[str]:
+        return None
+
+    # URLs never change
+    def url_version(self) -> str:
+        return ""
+
+
+# botocore ClientError codes for an absent object (HEAD answers a bare 404)
+def _is_missing_key(error: Exception) -> bool:
+    code = str(getattr(error, "response", {}).get("Error", {}).get("Code", ""))
+    return code in ("404", "NoSuchKey", "NotFound")
+
+
+# Objects in an S3-compatible bucket (AWS, MinIO, R2, ...). A PUT is atomic:
+# readers see the old object or the whole new one. boto3 is only needed when
+# no client is passed in; tests pass a local stand-in.
+class S3Storage:
+    name = "s3"
+
+    # Positive exists() results remembered in-process; objects are immutable
+    KNOWN_MAX_ENTRIES = 100_000
+
+    def __init__(self, bucket: str, prefix: str = "", client=None, endpoint_url: str = None,
+                 region: str = None, public_base_url: str = "", url_expiry: int = 3600):
+        if not bucket:
+            raise ImproperlyConfigured("STORAGE_S3_BUCKET is required for the s3 storage backend")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.public_base_url = public_base_url.rstrip("/")
+        self.url_expiry = url_expiry
+        self._client = client
+        self._endpoint_url = endpoint_url
+        self._region = region
+        self._known = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise ImproperlyConfigured("The s3 storage backend needs boto3 (pip install boto3)")
+            self._client = boto3.client("s3", endpoint_url=self._endpoint_url or None, region_name=self._region or None)
+        return self._client
+
+    def key(self, rel_path: str) -> str:
+        return f"{self.prefix}/{rel_path}" if self.prefix else rel_path
+
+    def _remember(self, rel_path: str):
+        with self._lock:
+            self._known[rel_path] = True
+            self._known.move_to_end(rel_path)
+            while len(self._known) > self.KNOWN_MAX_ENTRIES:
+                self._known.popitem(last=False)
+
+    def exists(self, rel_path: str) -> bool:
+        with self._lock:
+            if rel_path in self._known:
+                return True
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key(rel_path))
+        except Exception as e:
+            if _is_missing_key(e):
+                return False
+            raise
+        self._remember(rel_path)
+        return True
+
+    # Missing keys surface as FileNotFoundError, same as the local backend
+    def open(self, rel_path: str) -> BinaryIO:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.key(rel_path))
+        except Exception as e:
+            if _is_missing_key(e):
+                with self._lock:
+                    self._known.pop(rel_path, None)
+                raise FileNotFoundError(rel_path) from e
+            raise
+        return io.BytesIO(response["Body"].read())
+
+    def _put(self, rel_path: str, body):
+        content_type = mimetypes.guess_type(rel_path)[0] or "application/octet-stream"
+        self.client.put_object(Bucket=self.bucket, Key=self.key(rel_path), Body=body, ContentType=content_type)
+        self._remember(rel_path)
+
+    def write(self, rel_path: str, data: bytes):
+        self._put(rel_path, data)
+
+    def write_file(self, rel_path: str, local_path: str):
+        try:
+            with open(local_path, "rb") as f:
+                self._put(rel_path, f)
+        finally:
+            os.remove(local_path)
+
+    def staging_dir(self) -> Optional[str]:
+        return None
+
+    def delete(self, rel_path: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(rel_path))
+        with self._lock:
+            self._known.pop(rel_path, None)
+
+    # Public (CDN) URL when configured, otherwise a presigned GET
+    def url(self, rel_path: str) -> Optional[str]:
+        if self.public_base_url:
+            return f"{self.public_base_url}/{self.key(rel_path)}"
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self.key(rel_path)}, ExpiresIn=self.url_expiry
+        )
+
+    # Changes every half expiry period while URLs are presigned, so anything
+    # validated against it is refreshed before the URLs it holds expire
+    def url_version(self) -> str:
+        if self.public_base_url:
+            return ""
+        return str(int(time.time() // max(1, self.url_expiry // 2)))
+
+
+def build_storage():
+    if settings.STORAGE_BACKEND == "local":
+        return LocalStorage()
+    if settings.STORAGE_BACKEND == "s3":
+        return S3Storage(
+            settings.STORAGE_S3_BUCKET,
+            prefix=settings.STORAGE_S3_PREFIX,
+            endpoint_url=settings.STORAGE_S3_ENDPOINT_URL,
+            region=settings.STORAGE_S3_REGION,
+            public_base_url=settings.STORAGE_PUBLIC_BASE_URL,
+            url_expiry=settings.STORAGE_S3_URL_EXPIRY,
+        )
+    raise ImproperlyConfigured(f"Unknown STORAGE_BACKEND: {settings.STORAGE_BACKEND}")
+
+
+backend = build_storage()
+
+
+# Writes off the request thread. Pending bytes are bounded: submit blocks once
+# max_pending_bytes are queued, so a slow disk or bucket pushes back on
+# producers instead of buffering images without limit.
+class BackgroundWriter:
+    def __init__(self, max_pending_bytes: int, workers: int, name: str = "storage-writer"):
+        self.max_pending_bytes = max(1, max_pending_bytes)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=name)
+        self._cond = threading.Condition()
+        self.pending_bytes = 0
+        self.writes = 0
+        self.blocked_seconds = 0.0
+
+    def submit(self, fn: Callable, nbytes: int) -> Future:
+        with self._cond:
+            started = time.perf_counter()
+            # A single write larger than the bound still goes through once the
+            # queue has drained
+            while self.pending_bytes and self.pending_bytes + nbytes > self.max_pending_bytes:
+                self._cond.wait()
+            self.blocked_seconds += time.perf_counter() - started
+            self.pending_bytes += nbytes
+
+        def run():
+            try:
+                return fn()
+            finally:
+                with self._cond:
+                    self.pending_bytes -= nbytes
+                    self.writes += 1
+                    self._cond.notify_all()
+
+        return self._executor.submit(run)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "pending_bytes": self.pending_bytes,
+                "max_pending_bytes": self.max_pending_bytes,
+                "writes": self.writes,
+                "blocked_seconds": round(self.blocked_seconds, 3),
+            }
+
+
+writer = BackgroundWriter(settings.STORAGE_WRITER_MAX_PENDING_BYTES, settings.STORAGE_WRITER_THREADS)
+
+registry.gauge(
+    "storage_writer_pending_bytes", "Image bytes queued for the background storage writer", (),
+    lambda: [((), writer.pending_bytes)],
+)
+
+
+def _write_if_missing(rel_path: str, data: bytes) -> str:
+    if not backend.exists(rel_path):
+        backend.write(rel_path, data)
+    return rel_path
+
+
+# Queue a content-addressed write; the path is known immediately, so callers
+# can insert the database row while the bytes are written, then wait on the
+# future before handing out the URL
+def save_image_bytes_async(image_bytes: bytes, ext: str = "png", directory: str = "generated") -> Tuple[str, Future]:
+    rel_path = content_rel_path(hashlib.sha256(image_bytes).hexdigest(), ext, directory)
+    return rel_path, writer.submit(lambda: _write_if_missing(rel_path, image_bytes), len(image_bytes))
+
+
+def save_image_bytes(image_bytes: bytes, ext: str = "png", directory: str = "generated") -> str:
+    rel_path, written = save_image_bytes_async(image_bytes, ext, directory)
+    written.result()
+    return rel_path
+
+
+# Reads the header only; the pixels are not decoded
+def _image_dimensions(path: str) -> Optional[Tuple[int, int]]:
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+# Same naming as save_image_bytes, but hashes and writes chunks to a temp file
+# as they arrive so the whole body never has to sit in memory. The dimensions
+# come from the temp file's header before it is handed to the backend.
+def save_image_stream(chunks: Iterable[bytes], ext: str = "png", directory: str = "generated") -> StoredImage:
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=backend.staging_dir(), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                if chunk:
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+
+        rel_path = content_rel_path(digest.hexdigest(), ext, directory)
+        dimensions = _image_dimensions(tmp_path)
+        if backend.exists(rel_path):
+            os.remove(tmp_path)
+        else:
+            backend.write_file(rel_path, tmp_path)
+        return StoredImage(rel_path, size, dimensions)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def exists(rel_path: str) -> bool:
+    return backend.exists(rel_path)
+
+
+def open_file(rel_path: str) -> BinaryIO:
+    return backend.open(rel_path)
+
+
+def write_file_atomic(rel_path: str, data: bytes):
+    backend.write(rel_path, data)
+
+
+def delete(rel_path: str):
+    backend.delete(rel_path)
+
+
+# Absolute URL for backends that serve files themselves; None means MEDIA_URL
+def url(rel_path: str) -> Optional[str]:
+    return backend.url(rel_path)
+
+
+def url_version() -> str:
+    return backend.url_version()
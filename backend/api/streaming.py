@@ -0,0 +1,134 @@
+import json
+import queue
+import asyncio
+import threading
+import logging
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from rest_framework.renderers import BaseRenderer
+from .previews import latents_to_data_url
+from .metrics import collect_server_timing
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class EventStreamRenderer(BaseRenderer):
+    media_type = "text/event-stream"
+    format = "event-stream"
+    charset = "utf-8"
+
+    # Only used for non-streaming responses (e.g. validation errors)
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return sse_event("error", data).encode("utf-8")
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# Step callback run on the inference thread. It only queues progress and copies
+# the latents of preview steps; turning them into images happens on the reader.
+def step_listener(events: queue.Queue, preview_interval: int, cancelled: threading.Event = None):
+    def on_step(step, total, latents):
+        if cancelled is not None and cancelled.is_set():
+            return
+        events.put(("progress", {"step": step, "total": total}))
+        if preview_interval > 0 and step < total and (step == 1 or step % preview_interval == 0):
+            events.put(("preview", (step, latents.detach().float().cpu().numpy())))
+
+    return on_step
+
+
+# Runs generate(params, on_step) on a worker thread and yields Server-Sent
+# Events: progress for every step, a linear-approximation preview on step 1 and
+# every preview_interval steps, then the final result (or an error).
+def stream_generation(generate, params: dict, preview_interval: int, record_payload):
+    events = queue.Queue()
+    cancelled = threading.Event()
+    on_step = step_listener(events, preview_interval, cancelled)
+
+    def run():
+        try:
+            # Stage timings end up on the record; the headers are already sent
+            with collect_server_timing():
+                record, _ = generate(params, on_step=on_step)
+            events.put(("result", record))
+        except Exception as e:
+            logger.error(f"Error in streamed generation: {str(e)}")
+            events.put(("error", {"status": "error", "error": str(e)}))
+        finally:
+            events.put((_DONE, None))
+            close_old_connections()
+
+    threading.Thread(target=run, name="generation-stream", daemon=True).start()
+
+    try:
+        yield sse_event("queued", {"model_id": params["model_id"], "steps": params["steps"]})
+        while True:
+            kind, payload = events.get()
+            if kind is _DONE:
+                return
+            if kind == "preview":
+                step, latents = payload
+                yield sse_event("preview", {"step": step, "image": latents_to_data_url(latents)})
+            elif kind == "result":
+                yield sse_event("result", {"status": "success", "result": record_payload(payload)})
+            else:
+                yield sse_event(kind, payload)
+    finally:
+        cancelled.set()
+
+
+# queue.Queue-like put() for the inference thread, delivering to an
+# asyncio.Queue on the event loop
+class _LoopQueue:
+    def __init__(self, loop):
+        self._loop = loop
+        self.queue = asyncio.Queue()
+
+    def put(self, item):
+        self._loop.call_soon_threadsafe(self.queue.put_nowait, item)
+
+
+# ASGI variant of stream_generation: the same events, but the connection is a
+# coroutine waiting on an asyncio.Queue rather than a thread, so open streams
+# cost no threads. run(generate, params, on_step=...) is awaited to execute the
+# generation (the inference executor); previews render off the event loop.
+async def astream_generation(generate, params: dict, preview_interval: int, record_payload, run):
+    events = _LoopQueue(asyncio.get_running_loop())
+    cancelled = threading.Event()
+    on_step = step_listener(events, preview_interval, cancelled)
+
+    async def produce():
+        try:
+            with collect_server_timing():
+                record, _ = await run(generate, params, on_step=on_step)
+            events.queue.put_nowait(("result", record))
+        except Exception as e:
+            logger.error(f"Error in streamed generation: {str(e)}")
+            events.queue.put_nowait(("error", {"status": "error", "error": str(e)}))
+        finally:
+            events.queue.put_nowait((_DONE, None))
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        yield sse_event("queued", {"model_id": params["model_id"], "steps": params["steps"]})
+        while True:
+            kind, payload = await events.queue.get()
+            if kind is _DONE:
+                return
+            if kind == "preview":
+                step, latents = payload
+                image = await sync_to_async(latents_to_data_url, thread_sensitive=False)(latents)
+                yield sse_event("preview", {"step": step, "image": image})
+            elif kind == "result":
+                yield sse_event("result", {"status": "success", "result": record_payload(payload)})
+            else:
+                yield sse_event(kind, payload)
+    finally:
+        cancelled.set()
+        # A generation still waiting for an executor thread is dropped
+        if not producer.done():
+            producer.cancel()
@@ -0,0 +1,212 @@
+import asyncio
+import itertools
+import threading
+import time
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from api import storage
+from api.init_images import InvalidImage, RequestBodyLimit
+from api.inference_executor import ExecutorFull, InferenceExecutor
+from api.models import GeneratedImage
+
+
+class _Concurrency:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+
+    def __call__(self, seconds):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        time.sleep(seconds)
+        with self.lock:
+            self.current -= 1
+        return seconds
+
+
+class InferenceExecutorTests(SimpleTestCase):
+    async def test_running_calls_are_capped_at_the_pool_size(self):
+        executor = InferenceExecutor(workers=2, max_queued=0)
+        work = _Concurrency()
+        results = await asyncio.gather(*[executor.run(work, 0.02) for _ in range(10)])
+
+        self.assertEqual(results, [0.02] * 10)
+        self.assertEqual(work.peak, 2)
+        self.assertEqual(executor.stats()["completed"], 10)
+
+    async def test_submissions_past_the_queue_limit_are_rejected(self):
+        executor = InferenceExecutor(workers=1, max_queued=2)
+        release = threading.Event()
+        running = asyncio.ensure_future(executor.run(release.wait, 5))
+        while executor.running == 0:
+            await asyncio.sleep(0.01)
+        queued = [asyncio.ensure_future(executor.run(lambda: None)) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        with self.assertRaises(ExecutorFull):
+            await executor.run(lambda: None)
+
+        release.set()
+        await asyncio.gather(running, *queued)
+        self.assertEqual(executor.stats()["queued"], 0)
+        self.assertEqual(executor.stats()["rejected"], 1)
+
+
+class AsyncGenerationViewTests(SimpleTestCase):
+    # Many open requests wait as coroutines; only the executor's threads run
+    # generations
+    async def test_concurrent_requests_share_a_bounded_executor(self):
+        work = _Concurrency()
+
+        def fake_generate(params):
+            work(0.01)
+            record = GeneratedImage(id=1, prompt=params["prompt"], image="generated/a.png", created_at=timezone.now())
+            return record, "a.png"
+
+        executor = InferenceExecutor(workers=3, max_queued=0)
+        client = AsyncClient()
+        body = {"prompt": "a cat", "width": 64, "height": 64, "steps": 2}
+        threads_before = threading.active_count()
+        with mock.patch("api.views.generate_record", fake_generate), \
+                mock.patch("api.views.inference_executor", executor), \
+                mock.patch("api.views.is_known_model", return_value=True), \
+                mock.patch("api.inference.backend_resolved", return_value=True):
+            responses = await asyncio.gather(*[
+                client.post("/api/v1/generate/txt2img", body, content_type="application/json") for _ in range(200)
+            ])
+
+        self.assertEqual({response.status_code for response in responses}, {201})
+        self.assertEqual(work.peak, 3)
+        self.assertLess(threading.active_count() - threads_before, 10)
+
+
+class ResultListingTests(TestCase):
+    # Presigned URLs differ on every call; the ETag must not depend on them,
+    # and listing must not ask storage whether derivatives exist
+    def test_etag_is_stable_across_presigned_urls(self):
+        GeneratedImage.objects.create(prompt="a", image="generated/a.png", created_at=timezone.now())
+        signatures = itertools.count()
+        presign = lambda rel_path: f"https://bucket.example/{rel_path}?sig={next(signatures)}"
+
+        with mock.patch.object(storage.backend, "url", side_effect=presign), \
+                mock.patch.object(storage.backend, "exists", side_effect=AssertionError("exists called")):
+            first = self.client.get("/api/v1/result")
+            self.assertEqual(first.status_code, 200)
+            self.assertTrue(first.json()["results"][0]["derivatives"]["thumb"].endswith("/thumb"))
+
+            second = self.client.get("/api/v1/result", HTTP_IF_NONE_MATCH=first["ETag"])
+            self.assertEqual(second.status_code, 304)
+
+            GeneratedImage.objects.create(prompt="b", image="generated/b.png", created_at=timezone.now())
+            third = self.client.get("/api/v1/result", HTTP_IF_NONE_MATCH=first["ETag"])
+            self.assertEqual(third.status_code, 200)
+            self.assertEqual(len(third.json()["results"]), 2)
+
+
+class MetricsViewTests(TestCase):
+    # The queue depth gauge queries the database, which is not allowed on the
+    # event loop
+    async def test_database_backed_gauges_are_rendered(self):
+        response = await AsyncClient().get("/api/v1/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response.content.decode(), r"(?m)^\w*job_queue_depth \d")
+
+
+@override_settings(IMG2IMG_MAX_UPLOAD_BYTES=1000)
+class Img2ImgRequestTests(SimpleTestCase):
+    def _post(self, size):
+        upload = SimpleUploadedFile("in.png", b"x" * size, content_type="image/png")
+        return self.client.post("/api/v1/generate/img2img", {"prompt": "a cat", "init_image": upload})
+
+    def test_backend_without_img2img_is_rejected_before_storing(self):
+        backend = mock.Mock(generate_img2img=None)
+        with mock.patch("api.inference.get_backend", return_value=backend), \
+                mock.patch("api.inference.backend_resolved", return_value=True), \
+                mock.patch("api.views.store_upload") as store_upload:
+            response = self._post(10)
+        self.assertEqual(response.status_code, 501)
+        store_upload.assert_not_called()
+
+    def test_oversized_uploads_are_rejected_before_storing(self):
+        with mock.patch("api.inference.get_backend", return_value=None), \
+                mock.patch("api.inference.backend_resolved", return_value=True), \
+                mock.patch("api.views.store_upload") as store_upload:
+            # Past the upload handler's limit, then past the Content-Length check
+            self.assertEqual(self._post(5000).status_code, 413)
+            self.assertEqual(self._post(200_000).status_code, 413)
+        store_upload.assert_not_called()
+
+
+class Img2ImgSourceTests(TestCase):
+    def _post(self, generate, exists=True):
+        source = GeneratedImage.objects.create(prompt="a", image="generated/a.png", created_at=timezone.now())
+        with mock.patch("api.inference.get_backend", return_value=mock.Mock()), \
+                mock.patch("api.inference.backend_resolved", return_value=True), \
+                mock.patch("api.views.is_known_model", return_value=True), \
+                mock.patch.object(storage, "exists", return_value=exists), \
+                mock.patch("api.views.generate_record", side_effect=generate) as generate_record:
+            response = self.client.post(
+                "/api/v1/generate/img2img", {"prompt": "a cat", "init_image_id": source.id, "steps": 4},
+                content_type="application/json",
+            )
+        return response, generate_record
+
+    def test_missing_source_file_is_rejected_before_queueing(self):
+        response, generate_record = self._post(generate=None, exists=False)
+        self.assertEqual(response.status_code, 404)
+        generate_record.assert_not_called()
+
+    def test_undecodable_source_is_a_client_error(self):
+        response, generate_record = self._post(generate=InvalidImage("not a readable image: truncated"))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("not a readable image", response.json()["error"])
+        generate_record.assert_called_once()
+
+
+class RequestBodyLimitTests(SimpleTestCase):
+    async def _call(self, headers, chunks):
+        received, sent = [], []
+
+        async def app(scope, receive, send):
+            while True:
+                message = await receive()
+                received.append(message)
+                if message["type"] == "http.disconnect" or not message.get("more_body"):
+                    break
+            if received[-1]["type"] != "http.disconnect":
+                await send({"type": "http.response.start", "status": 200, "headers": []})
+
+        messages = iter(
+            [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1} for i, chunk in enumerate(chunks)]
+        )
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message)
+
+        limited = RequestBodyLimit(app, {"/upload": 10})
+        await limited({"type": "http", "path": "/upload", "headers": headers}, receive, send)
+        return received, sent
+
+    async def test_declared_length_over_the_limit_is_rejected_unread(self):
+        received, sent = await self._call([(b"content-length", b"11")], [b"x" * 11])
+        self.assertEqual(received, [])
+        self.assertEqual(sent[0]["status"], 413)
+
+    async def test_streamed_body_is_cut_off_at_the_limit(self):
+        received, sent = await self._call([], [b"x" * 6, b"x" * 6, b"x" * 6])
+        self.assertEqual([m["type"] for m in received], ["http.request", "http.disconnect"])
+        self.assertEqual([m.get("status") for m in sent], [413, None])
+
+    async def test_bodies_within_the_limit_pass_through(self):
+        received, sent = await self._call([(b"content-length", b"10")], [b"x" * 5, b"x" * 5])
+        self.assertEqual(len(received), 2)
+        self.assertEqual(sent[0]["status"], 200)
@@ -0,0 +1,25 @@
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from api import cache
+from api.cache import GenerationCache
+from api.models import GeneratedImage
+
+
+class GenerationCacheTests(TestCase):
+    def test_hit_whose_file_is_gone_is_a_miss(self):
+        generation_cache = GenerationCache(max_entries=8, ttl_seconds=3600)
+        record = GeneratedImage.objects.create(
+            prompt="a cat", image="generated/a.png", created_at=timezone.now(), cache_key="k"
+        )
+        generation_cache.put("k", record)
+
+        with mock.patch.object(cache.storage, "exists", return_value=True):
+            self.assertEqual(generation_cache.get("k"), record)
+        with mock.patch.object(cache.storage, "exists", return_value=False):
+            self.assertIsNone(generation_cache.get("k"))
+
+        self.assertEqual(generation_cache.stats()["entries"], 0)
+        self.assertEqual((generation_cache.hits, generation_cache.misses), (1, 1))
@@ -0,0 +1,74 @@
+import threading
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from api import generation, storage
+from api.db import RecordWriter
+from api.metrics import collect_server_timing
+from api.models import GeneratedImage
+
+
+def _record(prompt):
+    return GeneratedImage(prompt=prompt, image=f"generated/{prompt}.png", created_at=timezone.now())
+
+
+class RecordWriterTests(TransactionTestCase):
+    def test_concurrent_inserts_share_a_transaction(self):
+        writer = RecordWriter(enabled=True, max_batch=64, max_wait=0.2)
+        results = {}
+
+        def insert(i):
+            results[i] = writer.insert([_record(f"p{i}")])
+
+        threads = [threading.Thread(target=insert, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+
+        self.assertEqual(sorted(results), list(range(8)))
+        self.assertTrue(all(records[0].id for records in results.values()))
+        self.assertEqual(GeneratedImage.objects.count(), 8)
+        self.assertEqual(writer.rows, 8)
+        self.assertLess(writer.transactions, 8)
+
+    def test_batch_submits_keep_their_own_rows(self):
+        writer = RecordWriter(enabled=True, max_batch=64, max_wait=0.0)
+        created = writer.insert([_record("a"), _record("b")])
+        self.assertEqual([record.prompt for record in created], ["a", "b"])
+        self.assertEqual(GeneratedImage.objects.filter(id__in=[record.id for record in created]).count(), 2)
+
+
+class RecordMetadataTests(TestCase):
+    def test_rows_inside_a_transaction_are_written_inline(self):
+        writer = RecordWriter(enabled=True, max_batch=64, max_wait=0.0)
+        with transaction.atomic():
+            record, = writer.insert([_record("inline")])
+        self.assertEqual(writer.transactions, 0)
+        self.assertTrue(GeneratedImage.objects.filter(id=record.id).exists())
+
+    def test_generated_record_carries_metadata(self):
+        params = generation.generation_params({"prompt": "a cat", "model_id": "m", "width": 64, "height": 32, "seed": 7})
+        with mock.patch.object(generation.inference, "get_backend", return_value=None), \
+                mock.patch.object(storage.backend, "write"), \
+                mock.patch.object(storage.backend, "exists", return_value=True):
+            with collect_server_timing() as timing:
+                timing.add("denoise", 0.5)
+                record, _ = generation.generate_record(params)
+
+        record.refresh_from_db()
+        self.assertEqual((record.model_id, record.seed, record.width, record.height), ("m", 7, 64, 32))
+        self.assertEqual(record.params["steps"], 30)
+        self.assertNotIn("prompt", record.params)
+        self.assertGreater(record.byte_size, 0)
+        self.assertEqual(record.timings["denoise"], 0.5)
+
+    def test_sqlite_connections_are_tuned(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute("PRAGMA temp_store")
+            self.assertEqual(cursor.fetchone()[0], 2)
@@ -0,0 +1,79 @@
+from django.test import SimpleTestCase
+
+from api.embedding_cache import PromptEmbeddingCache
+
+
+# Stands in for a tensor of nbytes bytes
+class _Tensor:
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+    def numel(self):
+        return self.nbytes
+
+    def element_size(self):
+        return 1
+
+
+class PromptEmbeddingCacheTests(SimpleTestCase):
+    def _encoder(self):
+        calls = []
+
+        def encode(model_id, text, nbytes=10):
+            def compute():
+                calls.append((model_id, text))
+                return _Tensor(nbytes), _Tensor(nbytes)
+            return compute
+        return calls, encode
+
+    def test_repeated_texts_are_encoded_once_per_model(self):
+        cache = PromptEmbeddingCache(max_bytes=1000)
+        calls, encode = self._encoder()
+
+        first = cache.get_or_compute("a", "a cat", encode("a", "a cat"))
+        self.assertIs(cache.get_or_compute("a", "a cat", encode("a", "a cat")), first)
+        cache.get_or_compute("b", "a cat", encode("b", "a cat"))
+
+        self.assertEqual(calls, [("a", "a cat"), ("b", "a cat")])
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["bytes"]), (1, 2, 40))
+
+    def test_least_recently_used_entries_are_evicted_by_bytes(self):
+        cache = PromptEmbeddingCache(max_bytes=60)
+        calls, encode = self._encoder()
+        for text in ("one", "two", "three"):
+            cache.get_or_compute("a", text, encode("a", text))
+        cache.get_or_compute("a", "one", encode("a", "one"))
+        cache.get_or_compute("a", "four", encode("a", "four"))
+
+        calls.clear()
+        for text in ("one", "three", "four"):
+            cache.get_or_compute("a", text, encode("a", text))
+        self.assertEqual(calls, [])
+        cache.get_or_compute("a", "two", encode("a", "two"))
+        self.assertEqual(calls, [("a", "two")])
+        self.assertLessEqual(cache.stats()["bytes"], 60)
+        self.assertGreaterEqual(cache.stats()["evictions"], 1)
+
+    def test_oversized_outputs_are_not_cached(self):
+        cache = PromptEmbeddingCache(max_bytes=10)
+        calls, encode = self._encoder()
+        cache.get_or_compute("a", "long", encode("a", "long", nbytes=100))
+        cache.get_or_compute("a", "long", encode("a", "long", nbytes=100))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_dropping_a_model_clears_only_its_entries(self):
+        cache = PromptEmbeddingCache(max_bytes=1000)
+        calls, encode = self._encoder()
+        cache.get_or_compute("a", "a cat", encode("a", "a cat"))
+        cache.get_or_compute("b", "a cat", encode("b", "a cat"))
+
+        cache.drop_model("a")
+
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertEqual(cache.stats()["bytes"], 20)
+        cache.get_or_compute("b", "a cat", encode("b", "a cat"))
+        cache.get_or_compute("a", "a cat", encode("a", "a cat"))
+        self.assertEqual(calls, [("a", "a cat"), ("b", "a cat"), ("a", "a cat")])
+
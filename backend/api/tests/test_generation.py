@@ -0,0 +1,103 @@
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from api import generation
+from api.models import GeneratedImage
+from api.singleflight import SingleFlight
+
+
+def _coalesced(model_id: str) -> float:
+    series = f'{generation.generations.name}{{model="{model_id}",outcome="coalesced"}} '
+    for line in generation.generations.render():
+        if line.startswith(series):
+            return float(line[len(series):])
+    return 0.0
+
+
+class CoalescedGenerationTests(SimpleTestCase):
+    PARAMS = {
+        "prompt": "a lighthouse at dusk",
+        "negative_prompt": "",
+        "width": 64,
+        "height": 64,
+        "steps": 2,
+        "guidance_scale": 1.0,
+        "model_id": "sdxl-turbo",
+        "seed": 42,
+    }
+
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.runs = []
+        for patcher in (
+            mock.patch.object(generation, "in_flight_generations", self.flight),
+            mock.patch.object(generation, "cache_key_for", return_value=""),
+            mock.patch.object(generation.inference, "get_backend", return_value=None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    # The leader blocks until every other caller is waiting on it
+    def _slow_generate(self, followers, error=None):
+        def generate(params, cache_key, on_step=None):
+            self.runs.append(params["prompt"])
+            deadline = time.monotonic() + 5
+            while self.flight.stats()["waiting"] < followers and time.monotonic() < deadline:
+                time.sleep(0.01)
+            if error is not None:
+                raise error
+            record = GeneratedImage(id=7, prompt=params["prompt"], image="generated/a.png", created_at=timezone.now())
+            return record, "a.png"
+        return generate
+
+    def _generate_concurrently(self, n, generate):
+        results, errors = [None] * n, [None] * n
+
+        def worker(i):
+            try:
+                results[i] = generation.generate_record(dict(self.PARAMS))
+            except Exception as e:
+                errors[i] = e
+
+        with mock.patch.object(generation, "_generate_and_save", side_effect=generate):
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join(timeout=10)
+        return results, errors
+
+    def test_followers_receive_the_leaders_record(self):
+        coalesced_before = _coalesced("sdxl-turbo")
+
+        results, errors = self._generate_concurrently(6, self._slow_generate(followers=5))
+
+        self.assertEqual(self.runs, [self.PARAMS["prompt"]])
+        self.assertEqual(errors, [None] * 6)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(_coalesced("sdxl-turbo") - coalesced_before, 5)
+        # Backs the generations_coalesced_total gauge
+        self.assertEqual(self.flight.stats()["coalesced"], 5)
+
+    def test_leader_failure_reaches_every_follower(self):
+        failure = RuntimeError("CUDA out of memory")
+
+        results, errors = self._generate_concurrently(4, self._slow_generate(followers=3, error=failure))
+
+        self.assertEqual(len(self.runs), 1)
+        self.assertEqual(results, [None] * 4)
+        self.assertTrue(all(error is failure for error in errors))
+        self.assertEqual(self.flight.in_flight(), 0)
+
+    def test_unseeded_requests_are_never_coalesced(self):
+        params = dict(self.PARAMS, seed=None)
+        generate = self._slow_generate(followers=0)
+        with mock.patch.object(generation, "_generate_and_save", side_effect=generate):
+            for _ in range(2):
+                generation.generate_record(dict(params))
+        self.assertEqual(len(self.runs), 2)
+        self.assertEqual(self.flight.stats()["executions"], 0)
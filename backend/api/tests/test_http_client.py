@@ -0,0 +1,130 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from api import http_client
+from api.http_client import CircuitBreaker, CircuitOpenError, ConcurrencyLimitError, PooledHTTPClient
+
+
+# Local HTTP server answering POSTs from a script of (status, headers, body)
+# responses; once the script runs out it repeats the last entry
+class StubServer:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                with lock:
+                    status, headers, body = stub.responses[min(stub.requests, len(stub.responses) - 1)]
+                    stub.requests += 1
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/model"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class PooledHTTPClientTests(SimpleTestCase):
+    def _server(self, *responses):
+        server = StubServer(responses)
+        self.addCleanup(server.close)
+        return server
+
+    def _post(self, client, server, key="model"):
+        with client.post(server.url, limit_key=key, json={}) as resp:
+            return resp.status_code, resp.content
+
+    def test_retries_honour_retry_after(self):
+        server = self._server((503, {"Retry-After": "2"}, b""), (200, {}, b"ok"))
+        client = PooledHTTPClient(max_retries=3, backoff_base=10.0)
+
+        with mock.patch.object(http_client.time, "sleep") as sleep:
+            self.assertEqual(self._post(client, server), (200, b"ok"))
+
+        sleep.assert_called_once_with(2.0)
+        self.assertEqual(server.requests, 2)
+        self.assertEqual(client.retries, 1)
+
+    def test_breaker_opens_then_half_open_trial_closes_it(self):
+        server = self._server((500, {}, b""), (500, {}, b""), (200, {}, b"ok"))
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        client = PooledHTTPClient(max_retries=0, breaker=breaker)
+
+        self._post(client, server)
+        self._post(client, server)
+        self.assertEqual(breaker.state, "open")
+        with self.assertRaises(CircuitOpenError):
+            self._post(client, server)
+        self.assertEqual(server.requests, 2)
+
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, "half-open")
+        self.assertEqual(self._post(client, server), (200, b"ok"))
+        self.assertEqual(breaker.state, "closed")
+
+    def test_half_open_trial_may_retry_before_deciding(self):
+        server = self._server((500, {}, b""), (503, {"Retry-After": "0"}, b""), (200, {}, b"ok"))
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        client = PooledHTTPClient(max_retries=2, breaker=breaker)
+
+        with mock.patch.object(client, "max_retries", 0):
+            self._post(client, server)
+        self.assertEqual(breaker.state, "open")
+
+        time.sleep(0.06)
+        self.assertEqual(self._post(client, server), (200, b"ok"))
+        self.assertEqual(breaker.state, "closed")
+
+    def test_failed_trial_reopens_the_circuit(self):
+        server = self._server((500, {}, b""))
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        client = PooledHTTPClient(max_retries=0, breaker=breaker)
+
+        self._post(client, server)
+        time.sleep(0.06)
+        self._post(client, server)
+        self.assertEqual(breaker.state, "open")
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, "half-open")
+
+    def test_concurrent_calls_are_capped_per_key(self):
+        server = self._server((200, {}, b"ok"))
+        client = PooledHTTPClient(max_concurrency_per_key=1, acquire_timeout=0.05)
+
+        with client.post(server.url, limit_key="a", json={}):
+            with self.assertRaises(ConcurrencyLimitError):
+                self._post(client, server, key="a")
+            self.assertEqual(self._post(client, server, key="b"), (200, b"ok"))
+        self.assertEqual(self._post(client, server, key="a"), (200, b"ok"))
+
+    def test_body_is_streamed(self):
+        body = bytes(range(256)) * 4096
+        server = self._server((200, {"Content-Type": "image/png"}, body))
+        client = PooledHTTPClient()
+
+        with client.post(server.url, limit_key="model", json={}) as resp:
+            self.assertFalse(resp._content_consumed)
+            chunks = list(resp.iter_content(chunk_size=64 * 1024))
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(b"".join(chunks), body)
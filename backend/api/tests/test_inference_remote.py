@@ -0,0 +1,54 @@
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from api import inference_remote
+
+
+class RemoteBatchFanOutTests(SimpleTestCase):
+    def setUp(self):
+        self.in_flight = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    # Later prompts finish first; prompts containing "bad" fail upstream
+    def _fake_remote(self, model_id, prompt, seed, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            time.sleep(0.05 * (4 - int(prompt.split()[-1])))
+            if "bad" in prompt:
+                raise RuntimeError(f"HuggingFace error 500: {prompt}")
+            return f"{prompt}|{seed}".encode()
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def _batch(self, prompts, **kwargs):
+        with mock.patch.object(inference_remote, "generate_image_remote", side_effect=self._fake_remote):
+            return inference_remote.generate_image_batch_remote("sdxl-turbo", prompts, **kwargs)
+
+    def test_results_come_back_in_prompt_order(self):
+        results = self._batch(["cat 0", "dog 1", "fox 2", "owl 3"], seed=10)
+
+        self.assertEqual([r.index for r in results], [0, 1, 2, 3])
+        self.assertEqual([r.image for r in results], [b"cat 0|10", b"dog 1|11", b"fox 2|12", b"owl 3|13"])
+        self.assertTrue(all(r.error is None for r in results))
+        self.assertGreater(self.peak, 1)
+
+    def test_failed_item_does_not_fail_the_batch(self):
+        results = self._batch(["cat 0", "bad 1", "fox 2"])
+
+        self.assertEqual([r.image for r in results], [b"cat 0|None", None, b"fox 2|None"])
+        self.assertIsNone(results[0].error)
+        self.assertIn("HuggingFace error 500", results[1].error)
+        self.assertIsNone(results[2].error)
+
+    def test_in_flight_calls_are_bounded(self):
+        results = self._batch(["a 0", "b 1", "c 2", "d 3"], max_in_flight=2)
+
+        self.assertEqual(len(results), 4)
+        self.assertLessEqual(self.peak, 2)
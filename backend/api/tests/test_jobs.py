@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from api.jobs import JobQueue
+from api.models import GenerationJob
+
+
+class StaleJobTests(TestCase):
+    def test_jobs_orphaned_in_running_are_failed(self):
+        now = timezone.now()
+        stale = GenerationJob.objects.create(status=GenerationJob.STATUS_RUNNING, started_at=now - timedelta(hours=2))
+        fresh = GenerationJob.objects.create(status=GenerationJob.STATUS_RUNNING, started_at=now)
+        queued = GenerationJob.objects.create()
+
+        self.assertEqual(JobQueue(num_workers=1, poll_interval=1.0, stale_after=3600).fail_stale(), 1)
+
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, GenerationJob.STATUS_FAILED)
+        self.assertTrue(stale.error)
+        self.assertIsNotNone(stale.finished_at)
+        fresh.refresh_from_db()
+        self.assertEqual(fresh.status, GenerationJob.STATUS_RUNNING)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, GenerationJob.STATUS_QUEUED)
@@ -0,0 +1,83 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from api.inference_executor import InferenceExecutor
+from api.metrics import MetricsRegistry, http_requests, record_stage
+from api.models import GeneratedImage
+
+
+class ExpositionFormatTests(SimpleTestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter_labels_are_escaped(self):
+        counter = self.registry.counter("requests_total", "Requests", ("prompt",))
+        counter.inc(prompt='say "hi"\\n\nnow')
+        counter.inc(2, prompt="plain")
+
+        self.assertEqual(self.registry.render().splitlines(), [
+            "# HELP dreamsketch_requests_total Requests",
+            "# TYPE dreamsketch_requests_total counter",
+            'dreamsketch_requests_total{prompt="say \\"hi\\"\\\\n\\nnow"} 1',
+            'dreamsketch_requests_total{prompt="plain"} 2',
+        ])
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.histogram("latency_seconds", "Latency", ("model",), buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.5, 3):
+            histogram.observe(value, model="a")
+
+        self.assertEqual(self.registry.render().splitlines()[2:], [
+            'dreamsketch_latency_seconds_bucket{model="a",le="0.1"} 1',
+            'dreamsketch_latency_seconds_bucket{model="a",le="1"} 3',
+            'dreamsketch_latency_seconds_bucket{model="a",le="+Inf"} 4',
+            'dreamsketch_latency_seconds_sum{model="a"} 4.05',
+            'dreamsketch_latency_seconds_count{model="a"} 4',
+        ])
+
+    def test_failing_gauge_is_left_out_of_the_scrape(self):
+        self.registry.gauge("broken", "Broken", (), lambda: 1 / 0)
+        self.registry.gauge("depth", "Depth", ("queue",), lambda: [(("jobs",), 3)])
+
+        self.assertEqual(self.registry.render(), "\n".join([
+            "# HELP dreamsketch_depth Depth",
+            "# TYPE dreamsketch_depth gauge",
+            'dreamsketch_depth{queue="jobs"} 3',
+        ]) + "\n")
+
+
+class ServerTimingHeaderTests(SimpleTestCase):
+    def _post(self):
+        def fake_generate(params):
+            # Runs on an executor thread; the stage still lands on this request
+            record_stage("inference", 0.25, params["model_id"])
+            record = GeneratedImage(id=1, prompt=params["prompt"], image="generated/a.png", created_at=timezone.now())
+            return record, "a.png"
+
+        body = {"prompt": "a cat", "width": 64, "height": 64, "steps": 2}
+        with mock.patch("api.views.generate_record", fake_generate), \
+                mock.patch("api.views.inference_executor", InferenceExecutor(workers=1, max_queued=0)), \
+                mock.patch("api.views.is_known_model", return_value=True), \
+                mock.patch("api.inference.backend_resolved", return_value=True):
+            return self.client.post("/api/v1/generate/txt2img", body, content_type="application/json")
+
+    def test_stages_and_total_are_reported(self):
+        response = self._post()
+
+        self.assertEqual(response.status_code, 201)
+        stages = [entry.strip().split(";dur=") for entry in response["Server-Timing"].split(",")]
+        self.assertEqual([name for name, _ in stages], ["inference", "total"])
+        self.assertEqual(stages[0][1], "250.0")
+        self.assertGreaterEqual(float(stages[1][1]), 0)
+
+    def test_requests_without_stages_get_no_header(self):
+        response = self.client.get("/api/health/")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Server-Timing"))
+
+    def test_requests_are_counted_by_route_template(self):
+        self._post()
+        series = 'dreamsketch_http_requests_total{endpoint="api/v1/generate/txt2img",method="POST",status="201"}'
+        self.assertTrue(any(line.startswith(series + " ") for line in http_requests.render()))
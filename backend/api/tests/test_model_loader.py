@@ -0,0 +1,350 @@
+import tempfile
+import threading
+import time
+import unittest
+from collections import OrderedDict
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from PIL import Image
+
+try:
+    import torch
+    from api import inference_local, model_loader, snapshots
+    from api.batching import BatchScheduler
+    from api.embedding_cache import PromptEmbeddingCache
+    from api.model_loader import (
+        ModelManager, component_fingerprint, model_manager, module_nbytes, pipeline_fingerprints, pipeline_nbytes,
+    )
+    from api.singleflight import SingleFlight
+    from api.tiny_pipeline import build_tiny_sdxl_pipeline
+    _HAS_TORCH = True
+except ImportError:
+    _HAS_TORCH = False
+
+
+class _FakePipeline:
+    def __init__(self, model_id):
+        self.model_id = model_id
+        self.components = {}
+
+    def __call__(self, generator, **kwargs):
+        return mock.Mock(images=[Image.new("RGB", (8, 8)) for _ in generator])
+
+
+# A pipeline whose only weights are nbytes of UNet buffer
+class _SizedPipeline(_FakePipeline):
+    def __init__(self, model_id, nbytes):
+        super().__init__(model_id)
+        unet = torch.nn.Module()
+        unet.register_buffer("weight", torch.zeros(nbytes, dtype=torch.uint8))
+        self.components = {"unet": unet}
+
+
+def _isolated_manager_state():
+    return mock.patch.multiple(
+        ModelManager,
+        _loaded_models=OrderedDict(),
+        _model_sizes={},
+        _model_components={},
+        _shared_components={},
+        _snapshot_fingerprints={},
+        _last_used={},
+        _in_use={},
+        _loading={},
+        _loads=SingleFlight(),
+    )
+
+
+@unittest.skipUnless(_HAS_TORCH, "torch/diffusers not installed")
+class SingleFlightLoadingTests(SimpleTestCase):
+    def setUp(self):
+        patcher = _isolated_manager_state()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = []
+
+    def _slow_loader(self, delay=0.3, fail=False, gate=None):
+        def load(model_id):
+            self.calls.append(model_id)
+            if gate is not None:
+                gate.wait(timeout=5)
+            time.sleep(delay)
+            if fail:
+                raise RuntimeError(f"cannot load {model_id}")
+            return _FakePipeline(model_id), {}
+        return load
+
+    def _run_concurrently(self, fn, n):
+        results, errors = [None] * n, [None] * n
+
+        def worker(i):
+            try:
+                results[i] = fn()
+            except Exception as e:
+                errors[i] = e
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=10)
+        return results, errors
+
+    def test_concurrent_cold_loads_share_one_load(self):
+        with mock.patch.object(model_manager, "_load_pipeline", side_effect=self._slow_loader()):
+            results, errors = self._run_concurrently(lambda: model_manager.load_model("sdxl-turbo"), 8)
+
+        self.assertEqual(self.calls, ["sdxl-turbo"])
+        self.assertEqual(errors, [None] * 8)
+        self.assertTrue(all(r is results[0] for r in results))
+        self.assertEqual([m["id"] for m in model_manager.get_loaded_models()], ["sdxl-turbo"])
+
+    def test_failed_load_reaches_every_waiter_and_is_not_cached(self):
+        with mock.patch.object(model_manager, "_load_pipeline", side_effect=self._slow_loader(fail=True)):
+            results, errors = self._run_concurrently(lambda: model_manager.load_model("sdxl-turbo"), 5)
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertTrue(all(isinstance(e, RuntimeError) for e in errors))
+        self.assertEqual(model_manager.get_loaded_models(), [])
+
+        with mock.patch.object(model_manager, "_load_pipeline", side_effect=self._slow_loader(delay=0)):
+            self.assertEqual(model_manager.load_model("sdxl-turbo").model_id, "sdxl-turbo")
+        self.assertEqual(len(self.calls), 2)
+
+    def test_loading_one_model_does_not_block_a_resident_one(self):
+        with mock.patch.object(model_manager, "_load_pipeline", side_effect=self._slow_loader(delay=0)):
+            resident = model_manager.load_model("sdxl-base-1.0")
+
+        gate = threading.Event()
+        with mock.patch.object(model_manager, "_load_pipeline", side_effect=self._slow_loader(gate=gate)):
+            loader = threading.Thread(target=model_manager.load_model, args=("sdxl-turbo",))
+            loader.start()
+            try:
+                started = time.monotonic()
+                self.assertIs(model_manager.load_model("sdxl-base-1.0"), resident)
+                self.assertLess(time.monotonic() - started, 0.2)
+            finally:
+                gate.set()
+                loader.join(timeout=5)
+
+    # Through the generation path: the cold load happens on the requesting
+    # thread, so the batch worker keeps serving the resident model meanwhile
+    def test_cold_load_does_not_hold_up_generation_on_a_resident_model(self):
+        params = dict(negative_prompt="", width=64, height=64, steps=2, guidance_scale=1.0, seed=1)
+        scheduler = BatchScheduler(inference_local._run_pipeline_batch, max_batch_size=4, max_wait=0)
+        with mock.patch.object(inference_local, "batch_scheduler", scheduler):
+            with mock.patch.object(model_manager, "_load_pipeline", side_effect=self._slow_loader(delay=0)):
+                inference_local.generate_image_local(model_id="sdxl-turbo", prompt="warm", **params)
+
+            gate = threading.Event()
+            cold = []
+            with mock.patch.object(model_manager, "_load_pipeline", side_effect=self._slow_loader(delay=0, gate=gate)):
+                loader = threading.Thread(target=lambda: cold.append(
+                    inference_local.generate_image_local(model_id="sdxl-base-1.0", prompt="cold", **params)
+                ))
+                loader.start()
+                try:
+                    while "sdxl-base-1.0" not in self.calls:
+                        time.sleep(0.01)
+                    started = time.monotonic()
+                    image_bytes = inference_local.generate_image_local(model_id="sdxl-turbo", prompt="hot", **params)
+                    self.assertLess(time.monotonic() - started, 1.0)
+                    self.assertTrue(image_bytes)
+                finally:
+                    gate.set()
+                    loader.join(timeout=10)
+
+        self.assertEqual(len(cold), 1)
+        self.assertEqual(model_manager.get_loaded_models()[0]["in_use"], 0)
+
+
+@unittest.skipUnless(_HAS_TORCH, "torch/diffusers not installed")
+@override_settings(MODEL_SNAPSHOT_DIR="")
+class ResidencyBudgetTests(SimpleTestCase):
+    def setUp(self):
+        patcher = _isolated_manager_state()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for name, value in (("memory_budget", 0), ("max_resident", 0)):
+            patcher = mock.patch.object(model_manager, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch("api.model_loader.estimated_model_bytes", return_value=100)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.loads = []
+
+    def _loader(self, gate=None):
+        def load(model_id):
+            self.loads.append((model_id, sorted(m["id"] for m in model_manager.get_loaded_models())))
+            if gate is not None:
+                gate.wait(timeout=5)
+            return _SizedPipeline(model_id, 100), {}
+        return load
+
+    def _load(self, model_id):
+        with mock.patch.object(model_manager, "_load_pipeline", side_effect=self._loader()):
+            return model_manager.load_model(model_id)
+
+    def _resident(self):
+        return [m["id"] for m in model_manager.get_loaded_models()]
+
+    def test_least_recently_used_model_is_evicted_first(self):
+        model_manager.max_resident = 2
+        self._load("sdxl-turbo")
+        self._load("sdxl-base-1.0")
+        self._load("sdxl-turbo")
+        self._load("playground-v2.5")
+
+        self.assertEqual(self._resident(), ["sdxl-turbo", "playground-v2.5"])
+
+    def test_byte_budget_makes_room_before_the_load(self):
+        model_manager.memory_budget = 250
+        self._load("sdxl-turbo")
+        self._load("sdxl-base-1.0")
+        self._load("playground-v2.5")
+
+        # The oldest model was gone before the new weights were read
+        self.assertEqual(self.loads[-1], ("playground-v2.5", ["sdxl-base-1.0"]))
+        self.assertEqual(model_manager.resident_bytes(), 200)
+
+    def test_pinned_model_is_never_evicted(self):
+        model_manager.max_resident = 1
+        with mock.patch.object(model_manager, "_load_pipeline", side_effect=self._loader()):
+            with model_manager.use_model("sdxl-turbo"):
+                model_manager.load_model("sdxl-base-1.0")
+                self.assertIn("sdxl-turbo", self._resident())
+                model_manager.unload_model("sdxl-turbo")
+                self.assertIn("sdxl-turbo", self._resident())
+
+            model_manager.load_model("playground-v2.5")
+        self.assertEqual(self._resident(), ["playground-v2.5"])
+
+    def test_concurrent_cold_loads_reserve_room_for_each_other(self):
+        model_manager.memory_budget = 250
+        self._load("sdxl-turbo")
+
+        gate = threading.Event()
+        with mock.patch.object(model_manager, "_load_pipeline", side_effect=self._loader(gate=gate)):
+            threads = [threading.Thread(target=model_manager.load_model, args=(m,))
+                       for m in ("sdxl-base-1.0", "playground-v2.5")]
+            for t in threads:
+                t.start()
+            try:
+                while len(self.loads) < 3:
+                    time.sleep(0.01)
+                # Both loads are in flight: 100 resident + 2 x 100 reserved
+                # would pass 250, so the idle model made room first
+                self.assertEqual(self._resident(), [])
+            finally:
+                gate.set()
+                for t in threads:
+                    t.join(timeout=5)
+
+        self.assertEqual(sorted(self._resident()), ["playground-v2.5", "sdxl-base-1.0"])
+        self.assertLessEqual(model_manager.resident_bytes(), 250)
+
+    def test_unloading_a_model_drops_its_prompt_embeddings(self):
+        cache = PromptEmbeddingCache(max_bytes=1 << 20)
+        for model_id in ("sdxl-turbo", "sdxl-base-1.0"):
+            cache.get_or_compute(model_id, "a cat", lambda: torch.zeros(4))
+
+        with mock.patch("api.model_loader.prompt_embedding_cache", cache):
+            self._load("sdxl-turbo")
+            model_manager.unload_model("sdxl-turbo")
+
+        self.assertEqual(cache.stats()["entries"], 1)
+        computed = []
+        cache.get_or_compute("sdxl-turbo", "a cat", lambda: computed.append(1) or torch.zeros(4))
+        self.assertEqual(computed, [1])
+
+
+@unittest.skipUnless(_HAS_TORCH, "torch/diffusers not installed")
+@override_settings(MODEL_SNAPSHOT_DIR="")
+class ComponentSharingTests(SimpleTestCase):
+    def setUp(self):
+        patcher = _isolated_manager_state()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _load(self, model_id, seed=0):
+        pipeline = build_tiny_sdxl_pipeline(seed=seed)
+        with mock.patch.object(model_manager, "_load_pipeline", return_value=(pipeline, pipeline_fingerprints(pipeline))):
+            return model_manager.load_model(model_id)
+
+    def test_identical_components_are_shared_and_counted_once(self):
+        first = self._load("sdxl-turbo")
+        second = self._load("sdxl-base-1.0")
+
+        for name in ("vae", "text_encoder", "text_encoder_2", "tokenizer", "tokenizer_2"):
+            self.assertIs(getattr(second, name), getattr(first, name), name)
+            self.assertIs(second.components[name], getattr(first, name), name)
+        self.assertIsNot(second.unet, first.unet)
+        self.assertEqual(model_manager.resident_bytes(), pipeline_nbytes(first) + module_nbytes(second.unet))
+
+        loaded = {m["id"]: m for m in model_manager.get_loaded_models()}
+        self.assertEqual(loaded["sdxl-base-1.0"]["unique_bytes"], module_nbytes(second.unet))
+        self.assertIn("vae", loaded["sdxl-turbo"]["shared_components"])
+
+        # The survivor keeps the shared modules and is now charged for them
+        model_manager.unload_model("sdxl-turbo")
+        self.assertIs(second.vae, first.vae)
+        self.assertEqual(model_manager.resident_bytes(), pipeline_nbytes(second))
+        third = self._load("juggernaut-xl-v9")
+        self.assertIs(third.vae, second.vae)
+
+    def test_different_weights_are_not_shared(self):
+        first = self._load("sdxl-turbo", seed=0)
+        second = self._load("sdxl-base-1.0", seed=1)
+
+        self.assertIsNot(second.vae, first.vae)
+        self.assertIsNot(second.text_encoder, first.text_encoder)
+        # Tokenizers carry no weights and are identical in both
+        self.assertIs(second.tokenizer, first.tokenizer)
+        self.assertEqual(model_manager.resident_bytes(), pipeline_nbytes(first) + pipeline_nbytes(second))
+
+
+@unittest.skipUnless(_HAS_TORCH, "torch/diffusers not installed")
+class FingerprintTests(SimpleTestCase):
+    def setUp(self):
+        patcher = _isolated_manager_state()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(snapshot_dir.cleanup)
+        patcher = override_settings(MODEL_SNAPSHOT_DIR=snapshot_dir.name)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        self.events = []
+
+    def _load(self):
+        pipeline = build_tiny_sdxl_pipeline(seed=0)
+        moved = lambda device: self.events.append("to") or pipeline
+        hashed = lambda component: self.events.append("hash") or component_fingerprint(component)
+        with mock.patch.object(type(pipeline), "from_pretrained", return_value=pipeline), \
+                mock.patch.object(type(pipeline), "to", side_effect=moved), \
+                mock.patch.dict(model_loader.MODEL_CONFIGS["sdxl-turbo"], pipeline_class=type(pipeline)), \
+                mock.patch("api.model_loader.component_fingerprint", side_effect=hashed), \
+                mock.patch("api.model_loader.cpu_perf.optimize_pipeline"):
+            loaded = model_manager.load_model("sdxl-turbo")
+        model_manager.unload_model("sdxl-turbo")
+        return loaded
+
+    # Weights are hashed on the host before the move, then never again: the
+    # snapshot carries the fingerprints, read once per path
+    def test_weights_are_hashed_once_and_before_moving_to_the_device(self):
+        self._load()
+        self.assertIn("hash", self.events)
+        self.assertEqual(self.events[-1], "to")
+        self.assertNotIn("hash", self.events[self.events.index("to"):])
+
+        # As in a fresh process, which only has the snapshot on disk
+        self.events.clear()
+        ModelManager._snapshot_fingerprints.clear()
+        with mock.patch("api.model_loader.snapshots.snapshot_metadata", wraps=snapshots.snapshot_metadata) as metadata:
+            for _ in range(2):
+                self._load()
+        self.assertEqual(self.events, ["to", "to"])
+        self.assertEqual(metadata.call_count, 1)
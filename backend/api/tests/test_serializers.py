@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from api.serializers import BatchGenerateSerializer
+
+
+class BatchGenerateSerializerTests(SimpleTestCase):
+    def test_num_images_expands_the_prompt(self):
+        serializer = BatchGenerateSerializer(data={"prompt": "a cat", "num_images": 3, "seed": 10})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data["prompts"], ["a cat"] * 3)
+        self.assertEqual(serializer.validated_data["seeds"], [10, 11, 12])
+
+    def test_oversized_requests_are_rejected_before_expansion(self):
+        serializer = BatchGenerateSerializer(data={"prompt": "a cat", "num_images": 10 ** 9})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("num_images", serializer.errors)
+
+        limit = settings.GENERATION_BATCH_REQUEST_MAX_ITEMS
+        serializer = BatchGenerateSerializer(data={"prompt": "a cat", "seeds": list(range(limit + 1))})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("seeds", serializer.errors)
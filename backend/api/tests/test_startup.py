@@ -0,0 +1,37 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from api import startup
+from api.startup import WarmUp
+
+
+class WarmUpStateTests(SimpleTestCase):
+    def _run(self, outcomes):
+        warmup = WarmUp(models=list(outcomes), resolutions=[(64, 64)], steps=1, parallelism=1)
+
+        def warm_models(models):
+            for model_id in models:
+                warmup._set_model(model_id, outcomes[model_id])
+
+        backend = mock.Mock(mode="local")
+        with mock.patch.object(startup.inference, "get_backend", return_value=backend), \
+                mock.patch.object(warmup, "warm_models", side_effect=warm_models):
+            warmup._run()
+        return warmup
+
+    def test_all_models_warm_is_ready(self):
+        warmup = self._run({"a": WarmUp.READY, "b": WarmUp.SKIPPED})
+        self.assertEqual(warmup.state, WarmUp.READY)
+        self.assertTrue(warmup.ready)
+
+    def test_some_failed_models_degrade_readiness(self):
+        warmup = self._run({"a": WarmUp.READY, "b": WarmUp.FAILED})
+        self.assertEqual(warmup.state, WarmUp.DEGRADED)
+        self.assertTrue(warmup.ready)
+        self.assertIn("b", warmup.error)
+
+    def test_every_model_failing_is_not_ready(self):
+        warmup = self._run({"a": WarmUp.FAILED, "b": WarmUp.FAILED})
+        self.assertEqual(warmup.state, WarmUp.FAILED)
+        self.assertFalse(warmup.ready)
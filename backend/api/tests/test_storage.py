@@ -0,0 +1,189 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from PIL import Image
+
+from api import storage
+from api.models import GeneratedImage
+from api.storage import BackgroundWriter, LocalStorage, S3Storage, content_rel_path
+
+
+# HEAD answers a bare 404; GET names the error
+class _MissingKey(Exception):
+    def __init__(self, code="404"):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+# Local stand-in for an S3 endpoint: the subset of the boto3 client API that
+# S3Storage uses, backed by a dict
+class _FakeS3Client:
+    def __init__(self):
+        self.objects = {}
+        self.heads = 0
+
+    def head_object(self, Bucket, Key):
+        self.heads += 1
+        if (Bucket, Key) not in self.objects:
+            raise _MissingKey()
+        return {"ContentLength": len(self.objects[(Bucket, Key)][0])}
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise _MissingKey("NoSuchKey")
+        body = self.objects[(Bucket, Key)][0]
+        return {"Body": mock.Mock(read=lambda: body)}
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        data = Body if isinstance(Body, bytes) else Body.read()
+        self.objects[(Bucket, Key)] = (data, ContentType)
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+class LocalStorageTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="storage-test-")
+        self.backend = LocalStorage(self.root)
+
+    def test_content_paths_are_sharded_by_digest(self):
+        digest = hashlib.sha256(b"x").hexdigest()
+        self.assertEqual(content_rel_path(digest, "png"), f"generated/{digest[:2]}/{digest[2:4]}/{digest}.png")
+
+    def test_write_is_atomic_and_leaves_no_temp_files(self):
+        self.backend.write("generated/ab/cd/file.png", b"first")
+        self.backend.write("generated/ab/cd/file.png", b"second")
+        with self.backend.open("generated/ab/cd/file.png") as f:
+            self.assertEqual(f.read(), b"second")
+        self.assertEqual(os.listdir(os.path.join(self.root, "generated/ab/cd")), ["file.png"])
+
+    def test_failed_write_keeps_the_old_file(self):
+        self.backend.write("generated/a.png", b"old")
+        with mock.patch("api.storage.os.replace", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.backend.write("generated/a.png", b"new")
+        with self.backend.open("generated/a.png") as f:
+            self.assertEqual(f.read(), b"old")
+        self.assertEqual(os.listdir(os.path.join(self.root, "generated")), ["a.png"])
+
+    def test_published_files_are_readable_by_other_users(self):
+        self.backend.write("generated/a.png", b"data")
+        with mock.patch.object(storage, "backend", self.backend):
+            stored = storage.save_image_stream([b"streamed"], ext="png")
+
+        for rel_path in ("generated/a.png", stored.rel_path):
+            mode = os.stat(self.backend.path(rel_path)).st_mode & 0o777
+            self.assertEqual(mode, storage.FILE_MODE)
+            self.assertTrue(mode & 0o044, oct(mode))
+
+    def test_save_helpers_write_through_the_configured_backend(self):
+        with mock.patch.object(storage, "backend", self.backend):
+            rel_path = storage.save_image_bytes(b"image-bytes", ext="png")
+            stored = storage.save_image_stream([b"image-", b"bytes"], ext="png")
+
+        self.assertEqual(stored.rel_path, rel_path)
+        self.assertTrue(self.backend.exists(rel_path))
+        self.assertEqual(os.listdir(os.path.join(self.root, ".incoming")), [])
+
+    def test_streamed_images_carry_their_header_dimensions(self):
+        encoded = io.BytesIO()
+        Image.new("RGB", (64, 48)).save(encoded, format="PNG")
+        data = encoded.getvalue()
+
+        with mock.patch.object(storage, "backend", self.backend):
+            stored = storage.save_image_stream([data[:20], data[20:]], ext="png")
+            not_an_image = storage.save_image_stream([b"garbage"], ext="png")
+
+        self.assertEqual(stored.dimensions, (64, 48))
+        self.assertIsNone(not_an_image.dimensions)
+
+
+class S3StorageTests(SimpleTestCase):
+    def setUp(self):
+        self.client = _FakeS3Client()
+        self.backend = S3Storage("images", prefix="prod", client=self.client, public_base_url="https://cdn.test")
+
+    def test_round_trip_under_prefix(self):
+        self.assertFalse(self.backend.exists("generated/a.png"))
+        self.backend.write("generated/a.png", b"data")
+
+        self.assertEqual(self.client.objects[("images", "prod/generated/a.png")], (b"data", "image/png"))
+        self.assertTrue(self.backend.exists("generated/a.png"))
+        with self.backend.open("generated/a.png") as f:
+            self.assertEqual(f.read(), b"data")
+        self.assertEqual(self.backend.url("generated/a.png"), "https://cdn.test/prod/generated/a.png")
+
+    def test_streamed_writes_upload_the_spooled_file(self):
+        with mock.patch.object(storage, "backend", self.backend):
+            stored = storage.save_image_stream([b"abc", b"def"], ext="webp")
+            again = storage.save_image_stream([b"abcdef"], ext="webp")
+
+        self.assertEqual(stored, again)
+        self.assertEqual(self.client.objects[("images", f"prod/{stored.rel_path}")][0], b"abcdef")
+
+    def test_exists_is_remembered_after_the_first_hit(self):
+        self.backend.write("generated/a.png", b"data")
+        heads = self.client.heads
+        for _ in range(3):
+            self.assertTrue(self.backend.exists("generated/a.png"))
+        self.assertEqual(self.client.heads, heads)
+
+    def test_missing_object_opens_as_file_not_found(self):
+        self.backend.write("generated/a.png", b"data")
+        self.assertTrue(self.backend.exists("generated/a.png"))
+        # Removed behind this process's back, e.g. by a lifecycle rule
+        del self.client.objects[("images", "prod/generated/a.png")]
+
+        with self.assertRaises(FileNotFoundError):
+            self.backend.open("generated/a.png")
+        self.assertFalse(self.backend.exists("generated/a.png"))
+
+    def test_other_errors_are_not_mistaken_for_missing(self):
+        with mock.patch.object(self.client, "get_object", side_effect=_MissingKey("AccessDenied")):
+            with self.assertRaises(_MissingKey):
+                self.backend.open("generated/a.png")
+
+
+class S3DerivativeViewTests(TestCase):
+    def test_missing_original_is_not_found(self):
+        backend = S3Storage("images", client=_FakeS3Client(), public_base_url="https://cdn.test")
+        record = GeneratedImage.objects.create(prompt="a", image="generated/a.png", created_at=timezone.now())
+
+        with mock.patch.object(storage, "backend", backend):
+            response = self.client.get(f"/api/v1/result/{record.id}/thumb")
+
+        self.assertEqual(response.status_code, 404)
+
+
+class BackgroundWriterTests(SimpleTestCase):
+    def test_pending_bytes_are_bounded(self):
+        writer = BackgroundWriter(max_pending_bytes=10, workers=1)
+        release = threading.Event()
+        writer.submit(lambda: release.wait(timeout=5), 8)
+
+        submitted = threading.Event()
+
+        def producer():
+            writer.submit(lambda: None, 8)
+            submitted.set()
+
+        threading.Thread(target=producer).start()
+        time.sleep(0.1)
+        self.assertFalse(submitted.is_set())
+        self.assertEqual(writer.pending_bytes, 8)
+
+        release.set()
+        self.assertTrue(submitted.wait(timeout=5))
+
+    def test_oversized_write_goes_through_alone(self):
+        writer = BackgroundWriter(max_pending_bytes=10, workers=1)
+        self.assertEqual(writer.submit(lambda: "done", 100).result(timeout=5), "done")
+        self.assertEqual(writer.pending_bytes, 0)
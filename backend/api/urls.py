@@ -4,11 +4,17 @@ from . import views
 urlpatterns = [
     # health check (optional)
     path("health/", views.health_check, name="health"),
+    path("ready/", views.readiness_check, name="ready"),
 
     # v1 API
     path("v1/generate/txt2img", views.Txt2ImgView.as_view(), name="txt2img"),
     path("v1/generate/img2img", views.Img2ImgView.as_view(), name="img2img"),
+    path("v1/generate/batch", views.BatchGenerateView.as_view(), name="generate-batch"),
+    path("v1/generate/stream", views.GenerateStreamView.as_view(), name="generate-stream"),
     path("v1/status", views.StatusView.as_view(), name="status"),
+    path("v1/metrics", views.metrics_view, name="metrics"),
     path("v1/models", views.ModelsView.as_view(), name="models"),
     path("v1/result", views.ResultView.as_view(), name="result"),
+    path("v1/result/<int:image_id>/<str:size>", views.DerivativeView.as_view(), name="result-derivative"),
+    path("v1/jobs/<uuid:job_id>", views.JobView.as_view(), name="job"),
 ]
@@ -1,219 +1,474 @@
-import os
+import json
+import hashlib
 import logging
-from rest_framework.views import APIView
+from asgiref.sync import sync_to_async
 from rest_framework.response import Response
 from rest_framework import status
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse, HttpResponseRedirect
 from django.conf import settings
-from .serializers import GenerateImageSerializer
-from .models import GeneratedImage
-from django.utils import timezone
-from PIL import Image
-import io
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+from .serializers import (
+    BatchGenerateSerializer,
+    GenerateImageSerializer,
+    GenerateStreamSerializer,
+    Img2ImgSerializer,
+)
+from .models import GeneratedImage, GenerationJob
+from .generation import (
+    generation_params,
+    generate_batch_records,
+    generate_record,
+    in_flight_generations,
+    is_known_model,
+    supports_img2img,
+)
+from .jobs import job_queue
+from .cache import generation_cache
+from .embedding_cache import prompt_embedding_cache
+from .db import record_writer, sqlite_state
+from .streaming import EventStreamRenderer, astream_generation, stream_generation
+from .derivatives import DERIVATIVE_SIZES, ensure_derivative
+from .pagination import InvalidCursor, keyset_page
+from .init_images import InvalidImage, MaxUploadSizeHandler, max_request_bytes, store_upload, upload_too_large_message
+from .metrics import registry
+from .startup import warmup
+from .async_views import AsyncAPIView
+from .inference_executor import ExecutorFull, inference_executor
+from . import inference
+from . import storage
 
 logger = logging.getLogger(__name__)
 
-try:
-    from .inference import generate_image, MODEL_MAP
-    _HAS_INFERENCE = True
-    logger.info(f"Inference backend loaded successfully")
-except Exception as e:
-    _HAS_INFERENCE = False
-    MODEL_MAP = {}
-    generate_image = None
-    logger.warning(f"Inference backend not available: {e}")
 
-
-# Health
-def health_check(request):
+# Liveness: answers as soon as Django is up and never touches the ML stack
+async def health_check(request):
     return JsonResponse({"status": "ok"})
 
 
-# Helper - save image bytes and return filename + full url
-def _save_bytes_and_record(prompt: str, image_bytes: bytes):
-    gen_dir = os.path.join(settings.MEDIA_ROOT, "generated")
-    os.makedirs(gen_dir, exist_ok=True)
-    filename = f"generated_{abs(hash(prompt)) % (10**8)}.png"
-    filepath = os.path.join(gen_dir, filename)
-    with open(filepath, "wb") as f:
-        f.write(image_bytes)
-    rel_path = f"generated/{filename}"
-    record = GeneratedImage.objects.create(prompt=prompt, image=rel_path, created_at=timezone.now())
-    return record, filename
-
-
-# Build absolute URL for a generated filename
-def _build_media_url(request, filename: str):
-    media_base = request.build_absolute_uri(settings.MEDIA_URL)
-    return f"{media_base.rstrip('/')}/generated/{filename}"
-
-
-# Stub inference (you can replace with real model later)
-def run_inference_stub(prompt: str, width: int, height: int) -> bytes:
-    from PIL import Image
-    import io
-    img = Image.new("RGB", (int(width), int(height)), color=(120, 180, 200))
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    return buf.getvalue()
-
-
-def _generate_bytes_or_stub(prompt, negative_prompt, width, height, steps, guidance, model_id, seed=None):
-    if _HAS_INFERENCE and generate_image:
-        if model_id not in MODEL_MAP:
-            raise ValueError(f"unknown model_id: {model_id}")
-        return generate_image(
-            model_id=model_id,
-            prompt=prompt,
-            negative_prompt=negative_prompt,
-            width=width,
-            height=height,
-            steps=steps,
-            guidance_scale=guidance,
-            seed=seed,
-        )
-    return run_inference_stub(prompt, width, height)
-
-
-class Txt2ImgView(APIView):
-    def post(self, request):
+# Readiness: 503 until warm-up has imported the inference backend and warmed
+# the configured models, and for good if every one of them failed; per-model
+# progress is in the body
+async def readiness_check(request):
+    warmup.start()
+    state = warmup.stats()
+    return JsonResponse(
+        {"status": state["state"], "warmup": state},
+        status=200 if warmup.ready else 503,
+    )
+
+
+# Prometheus text exposition format. Rendering runs the gauge callbacks, some
+# of which query the database, so it happens off the event loop.
+async def metrics_view(request):
+    body = await sync_to_async(registry.render)()
+    return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# Absolute URL of a stored file: the storage backend's own URL when it serves
+# files itself (S3), otherwise under MEDIA_URL
+def _media_url(request, rel_path: str, media_base: str = None):
+    public = storage.url(rel_path)
+    if public:
+        return public
+    if media_base is None:
+        media_base = request.build_absolute_uri(settings.MEDIA_URL)
+    return f"{media_base.rstrip('/')}/{rel_path}"
+
+
+# The endpoint that renders a derivative on first use and redirects to the file;
+# listings link it rather than checking storage for every row
+def _derivative_urls(request, record, api_base: str = None):
+    if api_base is None:
+        api_base = request.build_absolute_uri("/api/v1/result/")
+    return {size: f"{api_base}{record.id}/{size}" for size in DERIVATIVE_SIZES}
+
+
+# Conditional GET: polling clients that send the ETag back in If-None-Match get
+# an empty 304 while nothing has changed. The ETag is a digest of version when
+# given (cheap to compute and stable while the payload means the same thing),
+# otherwise of the payload.
+def _conditional_response(request, payload, version=None):
+    source = payload if version is None else version
+    body = json.dumps(source, sort_keys=True, separators=(",", ":"), default=str)
+    etag = f'"{hashlib.sha256(body.encode("utf-8")).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == "*"):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(payload, status=status.HTTP_200_OK, headers=headers)
+
+
+def _record_payload(request, record):
+    return {
+        "id": record.id,
+        "url": _media_url(request, record.image.name),
+        "prompt": record.prompt,
+        "created_at": record.created_at.isoformat(),
+        "model_id": record.model_id,
+        "seed": record.seed,
+        "width": record.width,
+        "height": record.height,
+    }
+
+
+def _job_payload(request, job):
+    payload = {
+        "id": str(job.id),
+        "kind": job.kind,
+        "status": job.status,
+        "created_at": job.created_at.isoformat(),
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "result": None,
+        "error": job.error or None,
+    }
+    if job.result is not None:
+        payload["result"] = _record_payload(request, job.result)
+    return payload
+
+
+async def _submit_job(request, kind: str, params: dict):
+    job = await sync_to_async(job_queue.submit)(kind, params)
+    logger.info(f"Queued {kind} job {job.id}: {params['prompt'][:50]}...")
+    return Response({
+        "status": "queued",
+        "job": _job_payload(request, job),
+        "status_url": request.build_absolute_uri(f"/api/v1/jobs/{job.id}"),
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+# The first call imports the ML stack, which must not stall the event loop
+async def _is_known_model(model_id: str) -> bool:
+    if inference.backend_resolved():
+        return is_known_model(model_id)
+    return await sync_to_async(is_known_model, thread_sensitive=False)(model_id)
+
+
+async def _supports_img2img() -> bool:
+    if inference.backend_resolved():
+        return supports_img2img()
+    return await sync_to_async(supports_img2img, thread_sensitive=False)()
+
+
+def _busy_response(e: ExecutorFull):
+    return Response({"status": "error", "error": f"server busy: {e}"},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={"Retry-After": "5"})
+
+
+class Txt2ImgView(AsyncAPIView):
+    async def post(self, request):
         serializer = GenerateImageSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
 
-        prompt = data.get("prompt", "")
-        model_id = data.get("model_id", "stable-diffusion-v1-5")
-        steps = int(data.get("steps", 30))
-        guidance = float(data.get("guidance_scale", 7.5))
-        neg_prompt = data.get("negative_prompt", "")
-        width = int(data.get("width", 512))
-        height = int(data.get("height", 512))
-        seed = data.get("seed", None)
+        params = generation_params(data)
+        prompt = params["prompt"]
+        model_id = params["model_id"]
 
-        if _HAS_INFERENCE and model_id not in MODEL_MAP:
+        if not await _is_known_model(model_id):
             return Response({"status": "error", "error": "unknown model_id"}, status=status.HTTP_400_BAD_REQUEST)
 
+        if data.get("mode") == "job":
+            return await _submit_job(request, "txt2img", params)
+
         try:
             logger.info(f"Generating image: {prompt[:50]}... with model {model_id}")
-            image_bytes = _generate_bytes_or_stub(prompt, neg_prompt, width, height, steps, guidance, model_id, seed)
-            record, filename = _save_bytes_and_record(prompt, image_bytes)
-            full_url = _build_media_url(request, filename)
+            record, filename = await inference_executor.run(generate_record, params)
             logger.info(f"Image generated successfully: {filename}")
+        except ExecutorFull as e:
+            return _busy_response(e)
         except Exception as e:
             logger.error(f"Error generating image: {str(e)}")
             return Response({"status": "error", "error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         return Response({
             "status": "success",
-            "result": {
-                "id": record.id,
-                "url": full_url,
-                "prompt": record.prompt,
-                "created_at": record.created_at.isoformat()
-            }
+            "result": _record_payload(request, record)
         }, status=status.HTTP_201_CREATED)
 
 
-class Img2ImgView(APIView):
-    def post(self, request):
-        serializer = GenerateImageSerializer(data=request.data)
+# The init image is a multipart upload (streamed into storage) or the id of an
+# earlier result; either way the job and cache key refer to its stored path.
+# Support and upload size are checked before the body is parsed.
+class Img2ImgView(AsyncAPIView):
+    async def post(self, request):
+        if not await _supports_img2img():
+            return Response({"status": "error", "error": "img2img is not supported by this inference backend"},
+                            status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        too_large = Response({"status": "error", "error": upload_too_large_message()},
+                             status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        try:
+            content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            content_length = 0
+        if content_length > max_request_bytes():
+            return too_large
+        size_limit = MaxUploadSizeHandler(request)
+        request.upload_handlers.insert(0, size_limit)
+
+        serializer = Img2ImgSerializer(data=request.data)
+        if size_limit.exceeded:
+            return too_large
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
 
-        prompt = data.get("prompt", "")
-        model_id = data.get("model_id", "stable-diffusion-v1-5")
-        steps = int(data.get("steps", 30))
-        guidance = float(data.get("guidance_scale", 7.5))
-        neg_prompt = data.get("negative_prompt", "")
-        width = int(data.get("width", 512))
-        height = int(data.get("height", 512))
-        seed = data.get("seed", None)
+        params = generation_params(data)
+        prompt = params["prompt"]
+        model_id = params["model_id"]
 
-        if _HAS_INFERENCE and model_id not in MODEL_MAP:
+        if not await _is_known_model(model_id):
             return Response({"status": "error", "error": "unknown model_id"}, status=status.HTTP_400_BAD_REQUEST)
 
+        if "init_image_id" in data:
+            source = await GeneratedImage.objects.filter(id=data["init_image_id"]).only("image").afirst()
+            if source is None:
+                return Response({"status": "error", "error": "init_image_id not found"}, status=status.HTTP_404_NOT_FOUND)
+            init_image = source.image.name
+            # Checked here so a missing file fails the request, not a queued job
+            if not await sync_to_async(storage.exists, thread_sensitive=False)(init_image):
+                return Response({"status": "error", "error": "init image missing"}, status=status.HTTP_404_NOT_FOUND)
+        else:
+            try:
+                init_image = await sync_to_async(store_upload, thread_sensitive=False)(data["init_image"])
+            except InvalidImage as e:
+                return Response({"status": "error", "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        params.update(init_image=init_image, strength=data["strength"])
+
+        if data.get("mode") == "job":
+            return await _submit_job(request, "img2img", params)
+
         try:
             logger.info(f"Generating img2img: {prompt[:50]}... with model {model_id}")
-            image_bytes = _generate_bytes_or_stub(prompt, neg_prompt, width, height, steps, guidance, model_id, seed)
-            record, filename = _save_bytes_and_record(prompt, image_bytes)
-            full_url = _build_media_url(request, filename)
+            record, filename = await inference_executor.run(generate_record, params)
             logger.info(f"Img2img generated successfully: {filename}")
+        except ExecutorFull as e:
+            return _busy_response(e)
+        except InvalidImage as e:
+            # The stored input decodes only at generation time
+            return Response({"status": "error", "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error(f"Error generating img2img: {str(e)}")
             return Response({"status": "error", "error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         return Response({
             "status": "success",
-            "result": {
-                "id": record.id,
-                "url": full_url,
-                "prompt": record.prompt,
-                "created_at": record.created_at.isoformat()
+            "result": _record_payload(request, record)
+        }, status=status.HTTP_201_CREATED)
+
+
+# Many images in one request: batched pipeline calls locally, a bounded
+# fan-out remotely. Items fail individually; the response lists every one.
+class BatchGenerateView(AsyncAPIView):
+    async def post(self, request):
+        serializer = BatchGenerateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        params = generation_params(data)
+        model_id = params["model_id"]
+        if not await _is_known_model(model_id):
+            return Response({"status": "error", "error": "unknown model_id"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            logger.info(f"Generating batch of {len(data['prompts'])} with model {model_id}")
+            outcomes = await inference_executor.run(generate_batch_records, params, data["prompts"], data["seeds"])
+        except ExecutorFull as e:
+            return _busy_response(e)
+        except Exception as e:
+            logger.error(f"Error generating batch: {str(e)}")
+            return Response({"status": "error", "error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        results = [
+            {
+                "index": index,
+                "seed": seed,
+                "result": _record_payload(request, record) if record is not None else None,
+                "error": error,
             }
+            for index, ((record, error), seed) in enumerate(zip(outcomes, data["seeds"]))
+        ]
+        failed = sum(1 for r in results if r["error"])
+        if failed == len(results):
+            return Response({"status": "error", "results": results}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({
+            "status": "partial" if failed else "success",
+            "results": results,
         }, status=status.HTTP_201_CREATED)
 
 
+# Server-Sent Events: step progress, cheap latent previews, then the result
+class GenerateStreamView(AsyncAPIView):
+    renderer_classes = [EventStreamRenderer, JSONRenderer]
+
+    async def get(self, request):
+        return await self._stream(request, request.query_params)
+
+    async def post(self, request):
+        return await self._stream(request, request.data)
+
+    async def _stream(self, request, raw):
+        serializer = GenerateStreamSerializer(data=raw)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        params = generation_params(data)
+
+        if not await _is_known_model(params["model_id"]):
+            return Response({"status": "error", "error": "unknown model_id"}, status=status.HTTP_400_BAD_REQUEST)
+
+        preview_interval = data.get("preview_interval")
+        if preview_interval is None:
+            preview_interval = settings.STREAM_PREVIEW_INTERVAL
+
+        logger.info(f"Streaming generation: {params['prompt'][:50]}... with model {params['model_id']}")
+        record_payload = lambda r: _record_payload(request, r)
+        # Under ASGI an open stream is a coroutine; WSGI servers iterate
+        # synchronously, so they keep the thread-backed stream
+        if isinstance(request._request, ASGIRequest):
+            events = astream_generation(generate_record, params, preview_interval, record_payload, inference_executor.run)
+        else:
+            events = stream_generation(generate_record, params, preview_interval, record_payload)
+        response = StreamingHttpResponse(events, content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
 # Status endpoint
-class StatusView(APIView):
-    def get(self, request):
-        from .utils import get_system_info
+def _status_payload():
+    from .utils import get_system_info
+    system_info = get_system_info()
+    backend = inference.get_backend()
+    loaded_models = []
+    cpu_mode = None
+    if backend is not None and backend.mode == "local":
         try:
-            system_info = get_system_info()
-            loaded_models = []
-            if _HAS_INFERENCE:
-                try:
-                    from .model_loader import model_manager
-                    loaded_models = model_manager.get_loaded_models()
-                except:
-                    pass
-
-            return Response({
-                "status": "ready",
-                "inference_available": _HAS_INFERENCE,
-                "loaded_models": loaded_models,
-                "system_info": system_info,
-            }, status=status.HTTP_200_OK)
+            from .model_loader import model_manager, DEVICE
+            from .cpu_perf import cpu_mode_state
+            loaded_models = model_manager.get_loaded_models()
+            if DEVICE == "cpu":
+                cpu_mode = cpu_mode_state()
+        except:
+            pass
+
+    return {
+        "status": "ready",
+        "inference_available": backend is not None,
+        "inference": inference.backend_state(),
+        "warmup": warmup.stats(),
+        "loaded_models": loaded_models,
+        "cpu_mode": cpu_mode,
+        "jobs": job_queue.stats(),
+        "inference_executor": inference_executor.stats(),
+        "generation_cache": generation_cache.stats(),
+        "generation_coalescing": in_flight_generations.stats(),
+        "prompt_embedding_cache": prompt_embedding_cache.stats(),
+        "record_writer": record_writer.stats(),
+        "database": sqlite_state(),
+        "system_info": system_info,
+    }
+
+
+class StatusView(AsyncAPIView):
+    async def get(self, request):
+        try:
+            # System probes and the database pragmas block
+            payload = await sync_to_async(_status_payload)()
+            return Response(payload, status=status.HTTP_200_OK)
         except Exception as e:
             logger.error(f"Error getting status: {str(e)}")
             return Response({"status": "ready"}, status=status.HTTP_200_OK)
 
 
-class ModelsView(APIView):
-    def get(self, request):
-        if _HAS_INFERENCE and MODEL_MAP:
-            try:
-                from .model_loader import model_manager
-                models = model_manager.get_available_models()
-            except:
-                models = [{"id": k, "name": k.replace("-", " ").title()} for k in MODEL_MAP.keys()]
-        else:
-            models = [
-                {"id": "stable-diffusion-v1-5", "name": "Stable Diffusion v1.5", "default_size": 512},
-                {"id": "stable-diffusion-v2-1", "name": "Stable Diffusion v2.1", "default_size": 768},
-                {"id": "dreamshaper-v8", "name": "DreamShaper v8", "default_size": 512},
-            ]
-        return Response(models, status=status.HTTP_200_OK)
+def _models_payload():
+    backend = inference.get_backend()
+    if backend is not None and backend.model_map:
+        try:
+            from .model_loader import model_manager
+            return model_manager.get_available_models()
+        except:
+            return [{"id": k, "name": k.replace("-", " ").title()} for k in backend.model_map.keys()]
+    return [
+        {"id": "stable-diffusion-v1-5", "name": "Stable Diffusion v1.5", "default_size": 512},
+        {"id": "stable-diffusion-v2-1", "name": "Stable Diffusion v2.1", "default_size": 768},
+        {"id": "dreamshaper-v8", "name": "DreamShaper v8", "default_size": 512},
+    ]
+
 
+class ModelsView(AsyncAPIView):
+    async def get(self, request):
+        models = await sync_to_async(_models_payload, thread_sensitive=False)()
+        return _conditional_response(request, models)
 
-class ResultView(APIView):
-    def get(self, request):
-        limit = request.query_params.get('limit', 20)
+
+# The page and its version: row ids and timestamps plus what the URLs are built
+# from, since presigned storage URLs differ on every request
+def _results_page(request, cursor, limit: int):
+    page, next_cursor = keyset_page(GeneratedImage.objects.all(), cursor, limit)
+
+    # Resolve the absolute bases once per request rather than once per row
+    media_base = request.build_absolute_uri(settings.MEDIA_URL)
+    api_base = request.build_absolute_uri("/api/v1/result/")
+    results = []
+    for r in page:
+        results.append({
+            "id": r.id,
+            "url": _media_url(request, r.image.name, media_base),
+            "derivatives": _derivative_urls(request, r, api_base),
+            "prompt": r.prompt,
+            "created_at": r.created_at.isoformat()
+        })
+    version = [
+        media_base, api_base, storage.url_version(), next_cursor,
+        [(r.id, r.created_at.isoformat()) for r in page],
+    ]
+    return {"results": results, "next_cursor": next_cursor}, version
+
+
+class ResultView(AsyncAPIView):
+    async def get(self, request):
+        limit = request.query_params.get('limit', settings.RESULT_PAGE_DEFAULT_LIMIT)
         try:
             limit = int(limit)
         except:
-            limit = 20
+            limit = settings.RESULT_PAGE_DEFAULT_LIMIT
+        limit = max(1, min(limit, settings.RESULT_PAGE_MAX_LIMIT))
 
-        qs = GeneratedImage.objects.all().order_by("-created_at")[:limit]
-        results = []
-        for r in qs:
-            try:
-                img_url = request.build_absolute_uri(r.image.url)
-            except Exception:
-                img_url = request.build_absolute_uri(settings.MEDIA_URL + (r.image.name if hasattr(r.image, 'name') else str(r.image)))
-            results.append({
-                "id": r.id,
-                "url": img_url,
-                "prompt": r.prompt,
-                "created_at": r.created_at.isoformat()
-            })
-        return Response({"results": results}, status=status.HTTP_200_OK)
+        # The page query blocks
+        try:
+            payload, version = await sync_to_async(_results_page)(request, request.query_params.get('cursor'), limit)
+        except InvalidCursor as e:
+            return Response({"status": "error", "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return _conditional_response(request, payload, version)
+
+
+class DerivativeView(AsyncAPIView):
+    async def get(self, request, image_id, size):
+        if size not in DERIVATIVE_SIZES:
+            return Response({"status": "error", "error": "unknown size"}, status=status.HTTP_404_NOT_FOUND)
+        record = await GeneratedImage.objects.filter(id=image_id).afirst()
+        if record is None:
+            return Response({"status": "error", "error": "unknown image id"}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            target = await sync_to_async(ensure_derivative, thread_sensitive=False)(record.image.name, size)
+        except FileNotFoundError:
+            return Response({"status": "error", "error": "original image missing"}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            logger.error(f"Error creating {size} derivative for image {image_id}: {str(e)}")
+            return Response({"status": "error", "error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        response = HttpResponseRedirect(_media_url(request, target))
+        response["Cache-Control"] = "public, max-age=86400"
+        return response
+
+
+class JobView(AsyncAPIView):
+    async def get(self, request, job_id):
+        try:
+            job = await GenerationJob.objects.select_related("result").aget(id=job_id)
+        except GenerationJob.DoesNotExist:
+            return Response({"status": "error", "error": "unknown job id"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(_job_payload(request, job), status=status.HTTP_200_OK)
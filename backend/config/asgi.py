@@ -3,3 +3,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 application = get_asgi_application()
+
+from api.init_images import RequestBodyLimit, max_request_bytes
+application = RequestBodyLimit(application, {"/api/v1/generate/img2img": max_request_bytes()})
+
+from api.startup import start_background_services
+start_background_services()
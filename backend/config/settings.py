@@ -23,6 +23,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.MetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -32,7 +33,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'api.middleware.AsyncWhiteNoiseMiddleware',
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -56,14 +57,33 @@ TEMPLATES = [
 WSGI_APPLICATION = "config.wsgi.application"
 ASGI_APPLICATION = "config.asgi.application"
 
+# SQLite tuning, applied to each new connection (api/db.py). WAL lets readers
+# run alongside the writer; synchronous=NORMAL is durable across crashes of the
+# process (a power loss can drop the last commits, never corrupt the file).
+SQLITE_WAL = os.getenv("SQLITE_WAL", "true").lower() == "true"
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+if SQLITE_SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+    raise ValueError(f"SQLITE_SYNCHRONOUS must be OFF, NORMAL, FULL or EXTRA, got {SQLITE_SYNCHRONOUS}")
+# How long a write waits for the database lock before failing
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
 # Database (sqlite for dev)
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "NAME": os.getenv("SQLITE_PATH", str(BASE_DIR / "db.sqlite3")),
+        "OPTIONS": {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
     }
 }
 
+# Generated image rows are inserted by a single writer thread that groups rows
+# arriving within RECORD_WRITER_MAX_WAIT_MS into one transaction
+RECORD_WRITER_ENABLED = os.getenv("RECORD_WRITER_ENABLED", "true").lower() == "true"
+RECORD_WRITER_MAX_BATCH = int(os.getenv("RECORD_WRITER_MAX_BATCH", "64"))
+RECORD_WRITER_MAX_WAIT_MS = float(os.getenv("RECORD_WRITER_MAX_WAIT_MS", "2"))
+
 AUTH_PASSWORD_VALIDATORS = []
 
 LANGUAGE_CODE = "en-us"
@@ -103,6 +123,21 @@ STATIC_URL = "/static/"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Where generated images, derivatives and img2img inputs are stored: "local"
+# (MEDIA_ROOT) or "s3" (any S3-compatible bucket; needs boto3, credentials from
+# the usual AWS_* variables). Files are sharded by content hash either way.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+STORAGE_S3_BUCKET = os.getenv("STORAGE_S3_BUCKET", "")
+STORAGE_S3_PREFIX = os.getenv("STORAGE_S3_PREFIX", "")
+STORAGE_S3_ENDPOINT_URL = os.getenv("STORAGE_S3_ENDPOINT_URL", "")
+STORAGE_S3_REGION = os.getenv("STORAGE_S3_REGION", "")
+STORAGE_S3_URL_EXPIRY = int(os.getenv("STORAGE_S3_URL_EXPIRY", "3600"))
+# Base URL that serves the bucket (e.g. a CDN); empty = presigned URLs
+STORAGE_PUBLIC_BASE_URL = os.getenv("STORAGE_PUBLIC_BASE_URL", "")
+# Background writer: threads, and image bytes allowed to wait in its queue
+STORAGE_WRITER_THREADS = int(os.getenv("STORAGE_WRITER_THREADS", "2"))
+STORAGE_WRITER_MAX_PENDING_BYTES = int(os.getenv("STORAGE_WRITER_MAX_PENDING_BYTES", str(64 * 1024 * 1024)))
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # CORS — allow frontend to call API (tighten for production)
@@ -114,6 +149,101 @@ REST_FRAMEWORK = {
         "rest_framework.renderers.JSONRenderer",
     ),
 }
+# Generation job queue: in-process workers draining the GenerationJob table
+GENERATION_JOB_WORKERS = int(os.getenv("GENERATION_JOB_WORKERS", "1"))
+GENERATION_JOB_POLL_INTERVAL = float(os.getenv("GENERATION_JOB_POLL_INTERVAL", "1.0"))
+# Seconds after which a running job is taken to be orphaned by a dead worker
+# and marked failed (0 = never); keep it above the longest expected generation
+GENERATION_JOB_STALE_AFTER = float(os.getenv("GENERATION_JOB_STALE_AFTER", "1800"))
+
+# Micro-batching of compatible local generation requests
+GENERATION_BATCH_MAX_SIZE = int(os.getenv("GENERATION_BATCH_MAX_SIZE", "4"))
+GENERATION_BATCH_MAX_WAIT_MS = float(os.getenv("GENERATION_BATCH_MAX_WAIT_MS", "20"))
+# Caps batch size x width x height per pipeline call (0 = only the size limit),
+# and the number of images one /api/v1/generate/batch request may ask for
+GENERATION_BATCH_MAX_PIXELS = int(os.getenv("GENERATION_BATCH_MAX_PIXELS", str(2 * 1024 * 1024)))
+GENERATION_BATCH_REQUEST_MAX_ITEMS = int(os.getenv("GENERATION_BATCH_REQUEST_MAX_ITEMS", "64"))
+
+# Threads the async views run blocking generations on, i.e. how many run at
+# once (default: one batch in flight plus the next one forming). Further
+# requests wait without a thread; past INFERENCE_EXECUTOR_MAX_QUEUED they get
+# a 503 (0 = no limit).
+INFERENCE_EXECUTOR_THREADS = int(os.getenv("INFERENCE_EXECUTOR_THREADS", str(2 * GENERATION_BATCH_MAX_SIZE)))
+INFERENCE_EXECUTOR_MAX_QUEUED = int(os.getenv("INFERENCE_EXECUTOR_MAX_QUEUED", "10000"))
+
+# Result cache for seeded (deterministic) generations; 0 entries disables it
+GENERATION_CACHE_MAX_ENTRIES = int(os.getenv("GENERATION_CACHE_MAX_ENTRIES", "4096"))
+GENERATION_CACHE_TTL_SECONDS = float(os.getenv("GENERATION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Resident pipeline limits; least recently used idle models are evicted (0 = unlimited).
+# A model's first load reserves an estimate from its parameter count and dtype.
+MODEL_MEMORY_BUDGET_BYTES = int(os.getenv("MODEL_MEMORY_BUDGET_BYTES", "0"))
+MODEL_MAX_RESIDENT = int(os.getenv("MODEL_MAX_RESIDENT", "0"))
+
+# Text-encoder outputs cached per (model, prompt text), bounded by tensor bytes
+PROMPT_EMBEDDING_CACHE_BYTES = int(os.getenv("PROMPT_EMBEDDING_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+# /api/v1/generate/stream sends a latent preview on step 1 and every N steps (0 = off)
+STREAM_PREVIEW_INTERVAL = int(os.getenv("STREAM_PREVIEW_INTERVAL", "5"))
+
+# Remote inference HTTP client: pooling, retries, circuit breaker, per-model concurrency
+REMOTE_TIMEOUT = float(os.getenv("REMOTE_TIMEOUT", "300"))
+REMOTE_POOL_SIZE = int(os.getenv("REMOTE_POOL_SIZE", "10"))
+REMOTE_MAX_RETRIES = int(os.getenv("REMOTE_MAX_RETRIES", "4"))
+REMOTE_BACKOFF_BASE = float(os.getenv("REMOTE_BACKOFF_BASE", "1.0"))
+REMOTE_BACKOFF_MAX = float(os.getenv("REMOTE_BACKOFF_MAX", "30"))
+REMOTE_CIRCUIT_FAILURES = int(os.getenv("REMOTE_CIRCUIT_FAILURES", "5"))
+REMOTE_CIRCUIT_RESET_SECONDS = float(os.getenv("REMOTE_CIRCUIT_RESET_SECONDS", "30"))
+REMOTE_MAX_CONCURRENCY_PER_MODEL = int(os.getenv("REMOTE_MAX_CONCURRENCY_PER_MODEL", "4"))
+REMOTE_BATCH_MAX_IN_FLIGHT = int(os.getenv("REMOTE_BATCH_MAX_IN_FLIGHT", "8"))
+
+# Threads dedicated to encoding generated images (PNG/WebP/JPEG/AVIF)
+IMAGE_ENCODER_WORKERS = int(os.getenv("IMAGE_ENCODER_WORKERS", "2"))
+
+# Gallery thumbnails / medium sizes, rendered on first request and kept beside the original
+IMAGE_DERIVATIVE_FORMAT = os.getenv("IMAGE_DERIVATIVE_FORMAT", "webp")
+IMAGE_DERIVATIVE_QUALITY = int(os.getenv("IMAGE_DERIVATIVE_QUALITY", "80"))
+
+# img2img inputs: upload size limit and largest decoded image (width * height)
+IMG2IMG_MAX_UPLOAD_BYTES = int(os.getenv("IMG2IMG_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+IMG2IMG_MAX_INPUT_PIXELS = int(os.getenv("IMG2IMG_MAX_INPUT_PIXELS", str(4096 * 4096)))
+
+# Result history paging
+RESULT_PAGE_DEFAULT_LIMIT = int(os.getenv("RESULT_PAGE_DEFAULT_LIMIT", "20"))
+RESULT_PAGE_MAX_LIMIT = int(os.getenv("RESULT_PAGE_MAX_LIMIT", "100"))
+
+# Import the ML stack in the background as soon as the server starts, instead of
+# on the first generation request. /api/ready/ reports 503 until this finishes.
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "True") == "True"
+# Models to load and run once per resolution during warm-up (e.g. "sdxl-turbo"),
+# resolutions as WxH (empty = each model's default size), loads run in parallel
+WARMUP_MODELS = [m.strip() for m in os.getenv("WARMUP_MODELS", "").split(",") if m.strip()]
+WARMUP_RESOLUTIONS = [
+    tuple(int(v) for v in r.lower().split("x"))
+    for r in os.getenv("WARMUP_RESOLUTIONS", "").split(",") if r.strip()
+]
+WARMUP_STEPS = int(os.getenv("WARMUP_STEPS", "2"))
+WARMUP_PARALLELISM = int(os.getenv("WARMUP_PARALLELISM", "2"))
+
+# Prepared pipelines (converted scheduler, target dtype) are written here as
+# safetensors after the first load and memory-mapped on later loads, fully
+# offline. Worker processes on one host share the mapped pages. Off by default:
+# the first load pays for the write, every model is kept twice on disk, and on
+# CPU channels_last copies the conv weights out of the mapping anyway.
+MODEL_SNAPSHOT_DIR = os.getenv("MODEL_SNAPSHOT_DIR", "")
+
+# CPU performance mode (ignored on CUDA). bfloat16 autocast only takes effect
+# where the CPU has native bf16 support; weights stay float32. channels_last
+# copies the UNet/VAE conv weights out of the mmapped snapshot. Thread counts of
+# 0 keep torch's defaults. Compiled UNet/VAE-decoder kernels are cached on disk.
+CPU_BF16_AUTOCAST = os.getenv("CPU_BF16_AUTOCAST", "False") == "True"
+CPU_CHANNELS_LAST = os.getenv("CPU_CHANNELS_LAST", "False") == "True"
+CPU_INTRA_OP_THREADS = int(os.getenv("CPU_INTRA_OP_THREADS", "0"))
+CPU_INTER_OP_THREADS = int(os.getenv("CPU_INTER_OP_THREADS", "0"))
+CPU_COMPILE = os.getenv("CPU_COMPILE", "False") == "True"
+CPU_COMPILE_MODE = os.getenv("CPU_COMPILE_MODE", "default")
+CPU_COMPILE_CACHE_DIR = os.getenv("CPU_COMPILE_CACHE_DIR", str(BASE_DIR / "compile_cache"))
+
 # near STATIC_URL
 STATICFILES_DIRS = [BASE_DIR / "dist"]
 STATIC_ROOT = BASE_DIR / "staticfiles"
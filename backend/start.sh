@@ -27,7 +27,7 @@ echo "Setup complete!"
 echo "================================"
 echo ""
 echo "To preload models (optional):"
-echo "  python manage.py preload_models --models stable-diffusion-v1-5"
+echo "  python manage.py preload_models --models sdxl-turbo"
 echo ""
 echo "To test the setup:"
 echo "  python test_backend.py"